@@ -28,13 +28,18 @@ class UserAdmin(BaseUserAdmin):
                     "email", "first_name", "last_name", "password1", "password2",
                 )
             }
-        )
+        ),
     )
 
+    # icontains searches on these fields use the trigram indexes added in
+    # core/migrations/0002_user_search_trigram_indexes.py
     search_fields = ("email", "first_name", "last_name")
     ordering = ("email", "first_name", "last_name")
 
+    # Avoids an unfiltered COUNT(*) over every user on each changelist page
+    show_full_result_count = False
+
     filter_horizontal = ()
 
 
-admin.site.register(User)
+admin.site.register(User, UserAdmin)
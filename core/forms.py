@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 
 from .models import User
+from .uploads import ProbedImageField
 
 
 class AdminAddUserForm(forms.ModelForm):
@@ -54,3 +55,4 @@ class UpdateUserForm(forms.ModelForm):
         model = User
         fields = ("email", "first_name", "last_name",
                   "username", "avatar", "description")
+        field_classes = {"avatar": ProbedImageField}
@@ -0,0 +1,23 @@
+from jobs.queue import job
+from posterchat.metrics import time_image
+
+from .models import User
+
+AVATAR_SIZE = (200, 200)
+
+
+@job("core.resize_avatar")
+def resize_avatar(user_id):
+    """Downscales a user's avatar to at most AVATAR_SIZE"""
+    user = User.objects.filter(pk=user_id).only("avatar").first()
+    if user is None or not user.avatar:
+        return
+
+    # Imported here so web processes, which only queue this job, never load PIL
+    from PIL import Image
+
+    with time_image("avatar_resize"):
+        img = Image.open(user.avatar.path)
+        if img.height > AVATAR_SIZE[1] or img.width > AVATAR_SIZE[0]:
+            img.thumbnail(AVATAR_SIZE)
+            img.save(user.avatar.path)
@@ -0,0 +1,84 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: loads and warms the WSGI application as a
+# gunicorn worker would, then reports how long that took
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import posterchat.wsgi
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def parse_importtime(stderr: str, limit: int):
+    """Returns the slowest packages imported, from ``python -X importtime``.
+
+    Only top-level packages are listed, each with the time taken by its
+    first import including everything it imported in turn.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if cumulative.strip().isdigit() and "." not in name:
+            imports.append((int(cumulative), name))
+    return sorted(imports, reverse=True)[:limit]
+
+
+class Command(BaseCommand):
+    help = ("Measures how long a web worker takes to load the application, "
+            "failing if it exceeds the startup budget or loads modules that "
+            "should be imported lazily.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget", type=float, default=settings.STARTUP_BUDGET,
+            help="Maximum median startup time in seconds.")
+        parser.add_argument(
+            "--runs", type=int, default=5,
+            help="Number of fresh interpreters to time.")
+        parser.add_argument(
+            "--top", type=int, default=10,
+            help="Number of slowest imports to list.")
+
+    def handle(self, *args, budget=2.0, runs=5, top=10, **options):
+        script = STARTUP_SCRIPT % (settings.STARTUP_LAZY_MODULES,)
+        timings = []
+        for run in range(runs):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", script],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, env=os.environ.copy())
+            if result.returncode:
+                raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            if report["loaded"]:
+                raise CommandError(
+                    "Modules that should be loaded lazily were imported at "
+                    f"startup: {', '.join(report['loaded'])}")
+            timings.append(report["seconds"])
+
+        self.stdout.write("Slowest imports (cumulative):")
+        for micros, name in parse_importtime(result.stderr, top):
+            self.stdout.write(f"  {micros / 1000:8.1f}ms  {name}")
+
+        median = statistics.median(timings)
+        self.stdout.write(
+            f"Startup: median {median:.3f}s, min {min(timings):.3f}s, "
+            f"max {max(timings):.3f}s over {runs} runs (budget {budget:.3f}s)")
+        if median > budget:
+            raise CommandError(
+                f"Startup took {median:.3f}s, over the {budget:.3f}s budget")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from core import ratelimit
+
+
+class Command(BaseCommand):
+    help = "Deletes rate-limit buckets that have refilled completely."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {ratelimit.purge()} buckets")
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Django's icontains lookup compiles to UPPER("column"::text) LIKE UPPER(...)
+# on Postgres, so the indexes are built on that exact expression.
+SEARCH_FIELDS = ("email", "first_name", "last_name")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [TrigramExtension()] + [
+        migrations.RunSQL(
+            f'CREATE INDEX core_user_{field}_trgm ON core_user '
+            f'USING gin ((UPPER("{field}"::text)) gin_trgm_ops);',
+            f'DROP INDEX core_user_{field}_trgm;',
+        )
+        for field in SEARCH_FIELDS
+    ]
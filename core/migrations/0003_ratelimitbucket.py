@@ -0,0 +1,27 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tat', models.FloatField()),
+                ('allowed', models.BooleanField(default=True)),
+            ],
+        ),
+        # Buckets are short-lived and rebuilt by the next request, so they
+        # skip the write-ahead log
+        migrations.RunSQL(
+            'ALTER TABLE "core_ratelimitbucket" SET UNLOGGED',
+            'ALTER TABLE "core_ratelimitbucket" SET LOGGED',
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:17
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created date')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=2000)),
+                ('view_name', models.CharField(max_length=200)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('reason', models.CharField(choices=[('sampled', 'Sampled'), ('slow', 'Slow'), ('requested', 'Requested')], max_length=16)),
+                ('duration', models.FloatField()),
+                ('cpu_time', models.FloatField()),
+                ('query_time', models.FloatField()),
+                ('query_count', models.PositiveIntegerField()),
+                ('queries', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('samples', models.PositiveIntegerField()),
+                ('stacks', models.TextField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['-duration'], name='core_reques_duratio_c61412_idx'),
+        ),
+    ]
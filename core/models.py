@@ -2,12 +2,14 @@ import re
 
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
+from django.contrib.postgres.fields import JSONField
 from django.core import validators
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from PIL import Image
+
+from jobs import queue
 
 
 def validate_name(name: str):
@@ -122,6 +124,15 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    # Avatar file name when the user was loaded, to detect new uploads
+    _loaded_avatar = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_avatar = dict(zip(field_names, values)).get("avatar")
+        return instance
+
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
 
@@ -132,15 +143,12 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.get_full_name()} <{self.email}>"
 
     def save(self, *args, **kwargs):
-        """Overloads save method to resize avatar on save"""
+        """Overloads save method to resize new avatars in the background"""
         super().save(*args, **kwargs)
-        if self.avatar:
-            img = Image.open(self.avatar.path)
-
-            if img.height > 200 or img.width > 200:
-                img.thumbnail((200, 200))
-                img.save(self.avatar.path)
-                super().save()
+        if self.avatar and self.avatar.name != self._loaded_avatar:
+            self._loaded_avatar = self.avatar.name
+            queue.enqueue("core.resize_avatar", {"user_id": self.pk},
+                          dedup_key=f"core.resize_avatar:{self.pk}")
 
     def clean(self):
         """Performs pre-db validation on several fields."""
@@ -148,3 +156,51 @@ class User(AbstractBaseUser, PermissionsMixin):
         validate_name(self.first_name)
         validate_name(self.last_name)
         validate_username(self.username)
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket state for one rate-limited key, see core.ratelimit"""
+
+    key = models.CharField(max_length=255, primary_key=True)
+    # Theoretical arrival time of the next request, in seconds since the epoch
+    tat = models.FloatField()
+    # Whether the last request against the bucket was let through
+    allowed = models.BooleanField(default=True)
+
+
+class RequestProfile(models.Model):
+    """A sampled call-stack profile of one request, see core.profiler"""
+
+    SAMPLED = "sampled"
+    SLOW = "slow"
+    REQUESTED = "requested"
+    REASONS = [
+        (SAMPLED, "Sampled"),
+        (SLOW, "Slow"),
+        (REQUESTED, "Requested"),
+    ]
+
+    created_date = models.DateTimeField("created date", default=timezone.now)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200)
+    status = models.PositiveSmallIntegerField()
+    reason = models.CharField(max_length=16, choices=REASONS)
+    # Seconds
+    duration = models.FloatField()
+    cpu_time = models.FloatField()
+    query_time = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    # [[seconds, sql], ...] in execution order
+    queries = JSONField(default=list)
+    samples = models.PositiveIntegerField()
+    # Folded stacks ("outer;inner count" lines), as read by flamegraph.pl
+    stacks = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-duration"]),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration:.3f}s)"
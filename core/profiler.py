@@ -0,0 +1,200 @@
+"""Sampling profiler for slow requests.
+
+``ProfilerMiddleware`` profiles a request when it is picked at random
+(``PROFILER_SAMPLE_RATE``), when a staff user sends an ``X-Profile: 1``
+header, or, with ``PROFILER_SLOW_THRESHOLD`` set, every request, keeping
+only those slower than the threshold.
+
+Profiles come from a single background thread per process that wakes every
+``PROFILER_INTERVAL`` seconds and records the call stack of each profiled
+request's thread. Unlike ``cProfile``, which hooks every function call, the
+cost depends only on the interval, not on how much code the request runs.
+Stacks are stored folded ("outer;inner count" per line), the input format
+of flamegraph.pl, speedscope and similar tools, along with the request's
+queries and timings. Only the ``PROFILER_KEEP`` slowest profiles are kept.
+"""
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .models import RequestProfile
+
+HEADER = "HTTP_X_PROFILE"
+MAX_QUERIES = 200
+MAX_SQL_LENGTH = 2000
+
+
+@functools.lru_cache(maxsize=4096)
+def short_path(filename: str) -> str:
+    """Strips the longest ``sys.path`` entry off a source file name."""
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def fold(frame) -> str:
+    """Returns a frame's call stack, outermost first, as one folded line."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({short_path(code.co_filename)}:"
+                     f"{code.co_firstlineno})".replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Records the stacks of registered threads from a background thread."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.stacks: Dict[int, Counter] = {}
+        self.pid = None
+
+    def start(self, thread_id: int):
+        with self.condition:
+            # A sampler thread started before a fork is gone in the child
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.stacks = {}
+                threading.Thread(target=self.run, name="profiler",
+                                 daemon=True).start()
+            self.stacks[thread_id] = Counter()
+            self.condition.notify()
+
+    def stop(self, thread_id: int) -> Counter:
+        with self.condition:
+            return self.stacks.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stacks:
+                    self.condition.wait()
+            time.sleep(settings.PROFILER_INTERVAL)
+
+            frames = sys._current_frames()
+            with self.condition:
+                for thread_id, stacks in self.stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[fold(frame)] += 1
+            del frames
+
+
+sampler = Sampler()
+
+
+def choose(request) -> Optional[str]:
+    """Returns why the request should be profiled, or None."""
+    # request.user is only loaded for requests sending the header
+    if request.META.get(HEADER) == "1" and request.user.is_staff:
+        return RequestProfile.REQUESTED
+    if random.random() < settings.PROFILER_SAMPLE_RATE:
+        return RequestProfile.SAMPLED
+    if settings.PROFILER_SLOW_THRESHOLD is not None:
+        return RequestProfile.SLOW
+    return None
+
+
+def save(profile: RequestProfile):
+    """Stores the profile if it is among the ``PROFILER_KEEP`` slowest.
+
+    Requested profiles are always stored, and the ``PROFILER_KEEP`` most
+    recent of them are kept.
+    """
+    keep = settings.PROFILER_KEEP
+    if profile.reason == RequestProfile.REQUESTED:
+        profiles = RequestProfile.objects.filter(reason=profile.reason) \
+            .order_by("-created_date")
+    else:
+        profiles = RequestProfile.objects \
+            .exclude(reason=RequestProfile.REQUESTED).order_by("-duration")
+        cutoff = list(profiles.values_list("duration", flat=True)[keep - 1:keep])
+        if cutoff and profile.duration <= cutoff[0]:
+            return
+
+    profile.save()
+    RequestProfile.objects.filter(
+        pk__in=profiles.values("pk")[keep:]).delete()
+
+
+class ProfilerMiddleware:
+    """Goes after AuthenticationMiddleware, which the header check needs."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = choose(request)
+        if reason is None:
+            return self.get_response(request)
+
+        queries = []
+
+        def log_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append([time.perf_counter() - start, sql])
+
+        thread_id = threading.get_ident()
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        sampler.start(thread_id)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(log_query))
+                response = self.get_response(request)
+        finally:
+            stacks = sampler.stop(thread_id)
+        duration = time.perf_counter() - start
+
+        if reason == RequestProfile.SLOW \
+                and duration < settings.PROFILER_SLOW_THRESHOLD:
+            return response
+
+        match = getattr(request, "resolver_match", None)
+        save(RequestProfile(
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=match.view_name if match is not None else "",
+            status=response.status_code,
+            reason=reason,
+            duration=duration,
+            cpu_time=time.thread_time() - cpu_start,
+            query_time=sum(seconds for seconds, _ in queries),
+            query_count=len(queries),
+            queries=[[seconds, sql[:MAX_SQL_LENGTH]]
+                     for seconds, sql in queries[:MAX_QUERIES]],
+            samples=sum(stacks.values()),
+            stacks="".join(f"{stack} {count}\n"
+                           for stack, count in stacks.most_common()),
+        ))
+        return response
+
+
+def hot_functions(profile: RequestProfile, limit: int = 20):
+    """Returns ``(function, self samples, total samples)`` for the functions
+    that were running in most samples."""
+    own, total = Counter(), Counter()
+    for line in profile.stacks.splitlines():
+        stack, _, count = line.rpartition(" ")
+        frames = stack.split(";")
+        own[frames[-1]] += int(count)
+        for frame in set(frames):
+            total[frame] += int(count)
+    return [(name, samples, total[name])
+            for name, samples in own.most_common(limit)]
@@ -0,0 +1,110 @@
+"""Token-bucket rate limiting for write endpoints.
+
+Each limited view names a scope configured in ``settings.RATELIMITS`` as
+``{"rate": tokens, "period": seconds, "burst": tokens}``: a bucket holds up
+to ``burst`` tokens and refills at ``rate`` tokens per ``period``. Every
+request takes a token from its user's bucket and from its IP address's
+bucket, and is answered with 429 Too Many Requests if either is empty.
+
+Buckets are kept as a theoretical arrival time (GCRA), which advances by
+``period / rate`` per request and may run ahead of the clock by at most the
+burst. Both buckets are checked and updated by one ``INSERT ... ON CONFLICT
+DO UPDATE`` on an unlogged table, so limits hold across every worker
+process at the cost of a single database round trip.
+"""
+import functools
+import math
+import time
+from typing import List
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+from .models import RateLimitBucket
+
+
+def client_ip(request) -> str:
+    if settings.RATELIMIT_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+        if forwarded:
+            # The proxy in front of the app appends the address it saw last;
+            # earlier entries are whatever the client chose to send
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def bucket_keys(request, scope: str) -> List[str]:
+    keys = [f"{scope}:ip:{client_ip(request)}"]
+    if request.user.is_authenticated:
+        keys.append(f"{scope}:user:{request.user.pk}")
+    # Sorted so concurrent requests lock shared rows in the same order
+    return sorted(keys)
+
+
+def take(keys: List[str], rate: int, period: float, burst: int = 1) -> float:
+    """Takes a token from each bucket in ``keys``.
+
+    Returns 0 if the request is allowed, otherwise the number of seconds
+    until every bucket has a token again. Buckets that had a token are
+    charged even if another one was empty.
+    """
+    interval = period / rate
+    tolerance = (burst - 1) * interval
+    table = RateLimitBucket._meta.db_table
+    with connection.cursor() as cursor:
+        # EXCLUDED.tat is now + interval, the arrival time of a new bucket
+        cursor.execute(f"""
+            INSERT INTO {table} AS bucket (key, tat, allowed)
+            SELECT key, extract(epoch FROM statement_timestamp()) + %(interval)s,
+                   true
+            FROM unnest(%(keys)s::varchar[]) AS key
+            ON CONFLICT (key) DO UPDATE SET
+                allowed = bucket.tat - %(tolerance)s
+                          <= EXCLUDED.tat - %(interval)s,
+                tat = CASE
+                    WHEN bucket.tat - %(tolerance)s
+                         <= EXCLUDED.tat - %(interval)s
+                    THEN GREATEST(bucket.tat + %(interval)s, EXCLUDED.tat)
+                    ELSE bucket.tat
+                END
+            RETURNING allowed,
+                      tat - %(tolerance)s
+                      - extract(epoch FROM statement_timestamp())
+        """, {"keys": keys, "interval": interval, "tolerance": tolerance})
+        waits = [wait for allowed, wait in cursor.fetchall() if not allowed]
+    return max(waits) if waits else 0
+
+
+def too_many_requests(wait: float) -> HttpResponse:
+    response = HttpResponse("Too many requests, please try again later.",
+                            status=429, content_type="text/plain")
+    response["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def ratelimit(scope: str, methods=("POST",)):
+    """Limits ``methods`` requests to a view as configured for ``scope``.
+
+    Scopes missing from ``settings.RATELIMITS`` are not limited.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            config = settings.RATELIMITS.get(scope)
+            if config and request.method in methods:
+                wait = take(bucket_keys(request, scope), **config)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def purge() -> int:
+    """Deletes buckets that have refilled completely, returning the count.
+
+    A full bucket behaves exactly like a missing one.
+    """
+    deleted, _ = RateLimitBucket.objects.filter(tat__lt=time.time()).delete()
+    return deleted
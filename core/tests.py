@@ -1,14 +1,32 @@
 import copy
+import io
 import logging
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
 from typing import Dict, List, Optional, Tuple
 
 import requests
+from django import forms
 from django.core.files.base import ContentFile
-from django.test import TestCase, TransactionTestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import F
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.http import HttpResponse
+from django.urls import reverse
 from PIL import Image
+from prometheus_client import REGISTRY
 from requests.exceptions import HTTPError
 
-from .models import User
+from posterchat import metrics
+
+from . import jobs, profiler, ratelimit, uploads
+from .models import RateLimitBucket, RequestProfile, User
 
 logger = logging.getLogger(__name__)
 
@@ -202,6 +220,7 @@ class UserModelTests(TransactionTestCase):
                 self.assert_user_creation(
                     test_kwargs, data["reason"], data["is_valid"])
 
+    @override_settings(JOBS_EAGER=True)
     def test_user_avatar_resize(self):
         """Tests avatar images are downscaled"""
         # First creates a user with a large image
@@ -222,3 +241,248 @@ class UserModelTests(TransactionTestCase):
             img.height, 200, "Ensure that avatar height is downscaled")
         self.assertLessEqual(
             img.width, 200, "Ensure that avatar width is downscaled")
+
+
+@override_settings(
+    RATELIMITS={"test": {"rate": 1, "period": 60, "burst": 2}},
+    RATELIMIT_FORWARDED_FOR=True)
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        self.view = ratelimit.ratelimit("test")(lambda request: HttpResponse())
+        self.user = User.objects.create_user(
+            email="simple@example.com", first_name="Test", last_name="User",
+            username="testuser", password="password")
+
+    def request(self, ip="10.0.0.1", user=None, method="post"):
+        request = getattr(RequestFactory(), method)(
+            "/", HTTP_X_FORWARDED_FOR=f"1.2.3.4, {ip}")
+        request.user = user or self.user
+        return request
+
+    def test_bucket(self):
+        """Tests that a bucket allows its burst and then reports the wait"""
+        keys = ["test:bucket"]
+        self.assertEqual(ratelimit.take(keys, rate=1, period=60, burst=2), 0)
+        self.assertEqual(ratelimit.take(keys, rate=1, period=60, burst=2), 0)
+        wait = ratelimit.take(keys, rate=1, period=60, burst=2)
+        self.assertAlmostEqual(wait, 60, delta=1)
+
+        RateLimitBucket.objects.update(tat=F("tat") - 60)
+        self.assertEqual(ratelimit.take(keys, rate=1, period=60, burst=2), 0)
+
+    def test_view_limits(self):
+        """Tests that users and IP addresses are limited separately"""
+        other = User.objects.create_user(
+            email="other@example.com", first_name="Other", last_name="User",
+            username="otheruser", password="password")
+        for _ in range(2):
+            self.assertEqual(self.view(self.request()).status_code, 200)
+
+        response = self.view(self.request())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+
+        self.assertEqual(self.view(self.request(method="get")).status_code,
+                         200, "Only POST requests are limited")
+        self.assertEqual(
+            self.view(self.request(ip="10.0.0.2", user=other)).status_code,
+            200)
+        self.assertEqual(
+            self.view(self.request(ip="10.0.0.2")).status_code, 429,
+            "The user's bucket is empty")
+        self.assertEqual(
+            self.view(self.request(user=other)).status_code, 429,
+            "The IP address's bucket is empty")
+
+
+class StartupTests(TestCase):
+
+    def test_lazy_imports(self):
+        """Tests that loading the WSGI application skips lazy modules"""
+        stdout = io.StringIO()
+        call_command("benchmark_startup", runs=1, budget=60, stdout=stdout)
+        self.assertIn("Startup: median", stdout.getvalue())
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            email="staff@example.com", first_name="Staff", last_name="User",
+            username="staff", password="password", is_staff=True)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        """Tests that requests are timed per URL name with their queries"""
+        labels = {"view": "poster:conference_index", "method": "GET"}
+        requests_before = self.sample(
+            "posterchat_request_duration_seconds_count", **labels)
+        queries_before = self.sample(
+            "posterchat_db_query_duration_seconds_count",
+            view="poster:conference_index")
+
+        self.client.get("/conferences/conferences/")
+        self.assertEqual(
+            self.sample("posterchat_request_duration_seconds_count", **labels),
+            requests_before + 1)
+        self.assertGreater(
+            self.sample("posterchat_db_query_duration_seconds_count",
+                        view="poster:conference_index"),
+            queries_before)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.client.force_login(self.staff)
+        response = self.client.get("/metrics")
+        self.assertContains(response, "posterchat_request_duration_seconds")
+        self.assertContains(response, "posterchat_cache_lookups_total")
+
+    def test_job_worker_metrics(self):
+        """Tests that avatar resizing in a job worker shows up when its
+        metrics are scraped"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (300, 300)).save(buffer, "PNG")
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            self.staff.avatar.save("avatar.png", ContentFile(buffer.getvalue()))
+            jobs.resize_avatar(self.staff.pk)
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        metrics.serve(port, "127.0.0.1")
+        response = requests.get(f"http://127.0.0.1:{port}/", timeout=5)
+        self.assertIn('posterchat_image_processing_seconds_count'
+                      '{operation="avatar_resize"}', response.text)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_scrape_token(self):
+        """Tests that scrapers authenticate with the bearer token"""
+        self.assertEqual(self.client.get(
+            "/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 404)
+        self.assertEqual(self.client.get(
+            "/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+
+class ProfilerTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            email="staff@example.com", first_name="Staff", last_name="User",
+            username="staff", password="password", is_staff=True)
+        self.url = "/conferences/conferences/"
+
+    def test_sampler(self):
+        """Tests that the sampler records the stacks of a running thread"""
+        thread_id = threading.get_ident()
+        profiler.sampler.start(thread_id)
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+        stacks = profiler.sampler.stop(thread_id)
+        self.assertTrue(stacks)
+        self.assertTrue(all(stack.split(";")[-1].startswith("test_sampler ")
+                            for stack in stacks))
+
+    def test_staff_header(self):
+        """Tests that staff users can profile a request with a header"""
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+        self.assertFalse(RequestProfile.objects.exists())
+
+        self.client.force_login(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.reason, RequestProfile.REQUESTED)
+        self.assertEqual(profile.view_name, "poster:conference_index")
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertIn("poster_conference", profile.queries[-1][1])
+
+        response = self.client.get(
+            reverse("core:request_profile_stacks", args=[profile.pk]))
+        self.assertEqual(response.content.decode(), profile.stacks)
+        self.assertContains(self.client.get(
+            reverse("core:request_profile", args=[profile.pk])), self.url)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_KEEP=2)
+    def test_keeps_slowest(self):
+        """Tests that only the slowest sampled profiles are kept"""
+        for _ in range(4):
+            self.client.get(self.url)
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_slow_threshold(self):
+        """Tests that requests below the latency threshold are dropped"""
+        with self.settings(PROFILER_SLOW_THRESHOLD=60):
+            self.client.get(self.url)
+        self.assertFalse(RequestProfile.objects.exists())
+        with self.settings(PROFILER_SLOW_THRESHOLD=0):
+            self.client.get(self.url)
+        self.assertEqual(RequestProfile.objects.get().reason,
+                         RequestProfile.SLOW)
+
+
+def png_header(width: int, height: int) -> bytes:
+    """A PNG claiming the given size, without the pixel data to match."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + \
+            struct.pack(">I", zlib.crc32(kind + data))
+
+    return b"\x89PNG\r\n\x1a\n" + \
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(b"\0" * 64)) + chunk(b"IEND", b"")
+
+
+class UploadTests(TestCase):
+
+    def upload(self, data: bytes, name="image.png"):
+        upload = SimpleUploadedFile(name, data)
+        upload.field_name = "image"
+        return upload
+
+    def image(self, size, format="PNG") -> bytes:
+        buffer = io.BytesIO()
+        Image.new("RGB", size).save(buffer, format)
+        return buffer.getvalue()
+
+    def sample(self, result):
+        return REGISTRY.get_sample_value(
+            "posterchat_upload_validation_seconds_count",
+            {"field": "image", "result": result}) or 0
+
+    def test_probe_limits(self):
+        """Tests that images are checked against the limits from their
+        header alone"""
+        self.assertEqual(uploads.probe_image(self.upload(self.image((30, 20)))),
+                         ("PNG", 30, 20))
+
+        rejections = [
+            (png_header(20000, 20000), "too_many_pixels"),
+            (png_header(13000, 10), "too_large"),
+            (png_header(9000, 9000), "too_many_pixels"),
+            (self.image((30, 20), "BMP"), "invalid_format"),
+            (b"not an image", "invalid_image"),
+        ]
+        for data, code in rejections:
+            with self.assertRaises(forms.ValidationError) as error:
+                uploads.probe_image(self.upload(data))
+            self.assertEqual(error.exception.code, code)
+
+        with self.settings(UPLOAD_IMAGE_MAX_BYTES=100):
+            with self.assertRaises(forms.ValidationError) as error:
+                uploads.probe_image(self.upload(self.image((300, 300))))
+            self.assertEqual(error.exception.code, "file_too_large")
+
+    def test_field_timing(self):
+        """Tests that the form field rejects before decoding and records the
+        check per result"""
+        field = uploads.ProbedImageField()
+        accepted, rejected = self.sample("accepted"), self.sample("too_large")
+
+        self.assertEqual(field.clean(self.upload(self.image((30, 20)))).image.size,
+                         (30, 20))
+        with self.assertRaises(forms.ValidationError):
+            field.clean(self.upload(png_header(13000, 10)))
+        self.assertEqual(self.sample("accepted"), accepted + 1)
+        self.assertEqual(self.sample("too_large"), rejected + 1)
@@ -0,0 +1,91 @@
+"""Cheap checks of uploaded images, before anything decodes them.
+
+A small compressed file can hold an image of billions of pixels, which
+would take a worker's CPU and memory to decode, whether by Django's
+``ImageField`` validation or by the jobs resizing and hashing images later.
+``ProbedImageField`` reads only the image header, which states the format
+and dimensions, and rejects images in other formats or over the
+``UPLOAD_IMAGE_*`` limits before Django's own validation runs and before
+the file is saved to storage.
+"""
+import time
+import warnings
+from typing import Tuple
+
+from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+
+from posterchat.metrics import upload_validation_duration
+
+
+def probe_image(file) -> Tuple[str, int, int]:
+    """Returns the format, width and height stated in an image's header.
+
+    Raises ``ValidationError`` when they are over the limits.
+    """
+    # Imported here so processes that never see an upload never load PIL
+    from PIL import Image
+
+    if file.size > settings.UPLOAD_IMAGE_MAX_BYTES:
+        raise forms.ValidationError(
+            "Images can be at most %(limit)s.", code="file_too_large",
+            params={"limit": filesizeformat(settings.UPLOAD_IMAGE_MAX_BYTES)})
+
+    file.seek(0)
+    try:
+        # Image.open only parses the header; pixels are read on first use
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(file)
+    except Image.DecompressionBombError:
+        raise forms.ValidationError(
+            "This image has too many pixels.", code="too_many_pixels")
+    except Exception:
+        raise forms.ValidationError(
+            forms.ImageField.default_error_messages["invalid_image"],
+            code="invalid_image")
+    finally:
+        file.seek(0)
+
+    image_format, (width, height) = image.format, image.size
+    if image_format not in settings.UPLOAD_IMAGE_FORMATS:
+        raise forms.ValidationError(
+            "Images must be in one of these formats: %(formats)s.",
+            code="invalid_format",
+            params={"formats": ", ".join(settings.UPLOAD_IMAGE_FORMATS)})
+    if max(width, height) > settings.UPLOAD_IMAGE_MAX_DIMENSION:
+        raise forms.ValidationError(
+            "Images can be at most %(limit)d pixels wide and high; this one "
+            "is %(width)dx%(height)d.", code="too_large",
+            params={"limit": settings.UPLOAD_IMAGE_MAX_DIMENSION,
+                    "width": width, "height": height})
+    if width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+        raise forms.ValidationError(
+            "Images can have at most %(limit)g megapixels; this one has "
+            "%(pixels).1f.", code="too_many_pixels",
+            params={"limit": settings.UPLOAD_IMAGE_MAX_PIXELS / 10 ** 6,
+                    "pixels": width * height / 10 ** 6})
+    return image_format, width, height
+
+
+class ProbedImageField(forms.ImageField):
+    """An ``ImageField`` that checks the image header before validating the
+    whole file, timing the check per field and result."""
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return super().to_python(data)
+
+        start = time.perf_counter()
+        result = "accepted"
+        try:
+            probe_image(data)
+        except forms.ValidationError as error:
+            result = error.code
+            raise
+        finally:
+            upload_validation_duration.labels(
+                getattr(data, "field_name", None) or "<unknown>", result) \
+                .observe(time.perf_counter() - start)
+        return super().to_python(data)
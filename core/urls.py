@@ -7,5 +7,9 @@ urlpatterns = [
     path('profile/<slug:username>/', views.profile, name='profile'),
     path('profile/<slug:username>/edit/',
          views.update_user, name='profile_edit'),
+    path('profiler/', views.request_profiles, name='request_profiles'),
+    path('profiler/<int:pk>/', views.request_profile, name='request_profile'),
+    path('profiler/<int:pk>/stacks.folded', views.request_profile_stacks,
+         name='request_profile_stacks'),
     path('', views.home, name='home'),
 ]
@@ -1,20 +1,40 @@
 from django.shortcuts import render, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model, decorators
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 
+from poster import feed
+
+from . import profiler
 from .forms import UpdateUserForm
+from .models import RequestProfile
 
 
 @decorators.login_required
 def profile(request, username):
     template_name = "core/profile.html"
-    profile = get_object_or_404(get_user_model(), username=username)
-    return render(request, template_name, {"profile": profile})
+    # Activity stats are precomputed, so the whole page is a single query
+    profile = get_object_or_404(
+        get_user_model().objects.select_related("stats"), username=username)
+    stats = getattr(profile, "stats", None)
+    return render(request, template_name, {"profile": profile, "stats": stats})
 
 
 def home(request):
     template_name = "core/home.html"
-    return render(request, template_name, {})
+    if not request.user.is_authenticated:
+        return render(request, template_name, {})
+
+    try:
+        before = int(request.GET["before"]) if "before" in request.GET else None
+    except ValueError:
+        before = None
+    entries, next_before = feed.page(request.user, before)
+    return render(request, template_name, {
+        "feed": entries,
+        "next_before": next_before,
+        "feed_page": before is not None,
+    })
 
 
 @decorators.login_required
@@ -32,3 +52,31 @@ def update_user(request, username):
         context["form"] = form
 
         return render(request, "core/profile_edit.html", context)
+
+
+@staff_member_required
+def request_profiles(request):
+    template_name = "core/request_profiles.html"
+    profiles = RequestProfile.objects.defer("queries", "stacks") \
+        .order_by("-duration")
+    return render(request, template_name, {"profiles": profiles})
+
+
+@staff_member_required
+def request_profile(request, pk):
+    template_name = "core/request_profile.html"
+    profile = get_object_or_404(RequestProfile, pk=pk)
+    return render(request, template_name, {
+        "profile": profile,
+        "hot_functions": profiler.hot_functions(profile),
+    })
+
+
+@staff_member_required
+def request_profile_stacks(request, pk):
+    """Folded stacks, for flamegraph.pl or speedscope."""
+    profile = get_object_or_404(RequestProfile.objects.only("stacks"), pk=pk)
+    response = HttpResponse(profile.stacks, content_type="text/plain")
+    response["Content-Disposition"] = \
+        f'attachment; filename="profile-{profile.pk}.folded"'
+    return response
@@ -0,0 +1,44 @@
+"""Gunicorn settings, read automatically by `gunicorn posterchat.wsgi`.
+
+The application is loaded and warmed up once in the master process, then
+forked into workers that share its memory, which makes starting (and
+scaling out) workers fast.
+
+Workers write their Prometheus metrics to files in one directory, which
+``/metrics`` sums up (see posterchat/metrics.py). It is emptied whenever
+Gunicorn starts, before the application is loaded.
+"""
+import os
+import shutil
+import tempfile
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+metrics_dir = os.environ.setdefault(
+    "prometheus_multiproc_dir",
+    os.path.join(tempfile.gettempdir(), "posterchat-metrics"))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+
+def pre_fork(server, worker):
+    # Workers must open their own database connections and cache clients
+    # rather than share the master's sockets
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    for cache in caches.all():
+        cache.close()
+
+
+def post_fork(server, worker):
+    from posterchat import metrics
+
+    metrics.worker_started()
+
+
+def child_exit(server, worker):
+    from posterchat import metrics
+
+    metrics.worker_exited(worker.pid)
@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "priority", "attempts", "run_after",
+                    "finished_date")
+    list_filter = ("status", "name")
+    search_fields = ("dedup_key",)
+    readonly_fields = ("started_date", "finished_date", "worker", "last_error")
+
+
+admin.site.register(Job, JobAdmin)
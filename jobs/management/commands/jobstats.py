@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = "Prints job queue depth, throughput and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=int, default=60,
+            help="Report on jobs finished in the last N minutes.")
+
+    def handle(self, *args, minutes=60, **options):
+        since = timezone.now() - datetime.timedelta(minutes=minutes)
+        stats = queue.stats(since)
+
+        self.stdout.write(
+            f"Queued: {stats['queued']}  Running: {stats['running']}")
+        self.stdout.write(
+            f"{'job':<30} {'done':>6} {'failed':>6} {'/min':>7} "
+            f"{'avg wait':>9} {'max wait':>9} {'avg run':>9} {'max run':>9}")
+        for row in stats["jobs"]:
+            self.stdout.write(
+                f"{row['name']:<30} {row['done']:>6} {row['failed']:>6} "
+                f"{row['per_minute']:>7.2f} "
+                f"{seconds(row['avg_wait']):>9} {seconds(row['max_wait']):>9} "
+                f"{seconds(row['avg_run']):>9} {seconds(row['max_run']):>9}")
+
+
+def seconds(duration):
+    return "-" if duration is None else f"{duration.total_seconds():.3f}s"
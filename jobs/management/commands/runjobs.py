@@ -0,0 +1,56 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs import queue
+from posterchat import metrics
+
+
+class Command(BaseCommand):
+    help = "Runs a worker that executes queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="Exit once there are no due jobs left instead of polling.")
+        parser.add_argument(
+            "--sleep", type=float, default=settings.JOBS_POLL_INTERVAL,
+            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument(
+            "--metrics-port", type=int, default=settings.JOBS_METRICS_PORT,
+            help="Serve Prometheus metrics on this port (0 to disable).")
+
+    def handle(self, *args, burst=False, sleep=1, metrics_port=0, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if metrics_port:
+            metrics.serve(metrics_port, settings.JOBS_METRICS_ADDR)
+        self.stdout.write(f"Worker {queue.worker_name()} started")
+        # None rather than 0: monotonic() counts from boot, so a worker on a
+        # fresh host would otherwise wait JOBS_TIMEOUT for its first pass
+        last_maintenance = None
+        while not self.stopping:
+            if last_maintenance is None or \
+                    time.monotonic() - last_maintenance > settings.JOBS_TIMEOUT:
+                queue.requeue_stale()
+                queue.purge()
+                queue.schedule_periodic()
+                last_maintenance = time.monotonic()
+
+            started = time.monotonic()
+            job = queue.run_next()
+            if job is not None:
+                self.stdout.write(
+                    f"{job} in {time.monotonic() - started:.3f}s")
+            elif burst:
+                break
+            else:
+                time.sleep(sleep)
+
+    def stop(self, signum, frame):
+        """Lets the current job finish before exiting."""
+        self.stopping = True
@@ -0,0 +1,59 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A unit of background work stored in the database.
+
+    Workers claim queued jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` so
+    that any number of them can poll the table concurrently.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(
+        default=0, help_text="Jobs with a higher priority run first.")
+    dedup_key = models.CharField(
+        max_length=255, null=True, blank=True,
+        help_text="Only one queued or running job may have a given key.")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    created_date = models.DateTimeField('created date', default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_date = models.DateTimeField('started date', null=True, blank=True)
+    finished_date = models.DateTimeField('finished date', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-priority", "run_after"],
+                         name="job_queued_idx",
+                         condition=models.Q(status="queued")),
+            models.Index(fields=["status", "finished_date"],
+                         name="job_status_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"], name="job_unique_pending_dedup_key",
+                condition=models.Q(status__in=["queued", "running"])),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,240 @@
+"""A durable job queue stored in the project's Postgres database.
+
+Job functions are registered by name with the ``job`` decorator, usually in
+an app's ``jobs.py`` which is imported when Django starts::
+
+    @job("core.resize_avatar")
+    def resize_avatar(user_id):
+        ...
+
+    enqueue("core.resize_avatar", {"user_id": 1}, dedup_key="avatar:1")
+
+Jobs are executed by ``python manage.py runjobs``. Failing jobs are retried
+with exponential backoff until ``max_attempts`` is reached. Jobs named in
+``settings.JOBS_PERIODIC`` are queued again, that many seconds later, each
+time they finish.
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import traceback
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (Avg, Count, DurationField, ExpressionWrapper, F,
+                              Max, Q)
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry: Dict[str, Callable] = {}
+
+
+def job(name: str):
+    """Registers the decorated function as the job called ``name``."""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name: str, payload: dict = None, priority: int = 0,
+            dedup_key: Optional[str] = None, run_after=None,
+            max_attempts: int = None) -> Job:
+    """Adds a job to the queue.
+
+    If a queued or running job with the same ``dedup_key`` already exists,
+    that job is returned instead of creating another one.
+    """
+    if name not in registry:
+        raise ValueError(f"No job registered as {name!r}")
+
+    new_job = Job(name=name, payload=payload or {}, priority=priority,
+                  dedup_key=dedup_key, run_after=run_after or timezone.now(),
+                  max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS)
+
+    if settings.JOBS_EAGER:
+        new_job.save()
+        run(claim_job(new_job.pk))
+        new_job.refresh_from_db()
+        return new_job
+
+    if dedup_key is None:
+        new_job.save()
+        return new_job
+
+    while True:
+        try:
+            with transaction.atomic():
+                new_job.save()
+            return new_job
+        except IntegrityError:
+            # The existing job may finish before it is read; insert again
+            existing = Job.objects.filter(
+                dedup_key=dedup_key,
+                status__in=[Job.QUEUED, Job.RUNNING]).first()
+            if existing is not None:
+                return existing
+            new_job.pk = None
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(pk: int = None) -> Optional[Job]:
+    """Marks the next due job as running and returns it.
+
+    ``SKIP LOCKED`` makes concurrent workers pass over rows another worker is
+    claiming instead of waiting on them.
+    """
+    now = timezone.now()
+    queued = Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+    if pk is not None:
+        queued = queued.filter(pk=pk)
+
+    with transaction.atomic():
+        claimed = queued.order_by("-priority", "run_after", "pk") \
+            .select_for_update(skip_locked=True).first()
+        if claimed is None:
+            return None
+
+        claimed.status = Job.RUNNING
+        claimed.attempts += 1
+        claimed.started_date = now
+        claimed.worker = worker_name()
+        claimed.save(update_fields=[
+            "status", "attempts", "started_date", "worker"])
+    return claimed
+
+
+def backoff(attempts: int) -> datetime.timedelta:
+    """Exponential backoff with jitter, capped at JOBS_MAX_BACKOFF seconds."""
+    delay = min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1),
+                settings.JOBS_MAX_BACKOFF)
+    return datetime.timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def run(claimed: Optional[Job]) -> Optional[Job]:
+    """Executes a claimed job and records its outcome."""
+    if claimed is None:
+        return None
+
+    func = registry.get(claimed.name)
+    try:
+        if func is None:
+            raise LookupError(f"No job registered as {claimed.name!r}")
+        func(**claimed.payload)
+    except Exception:
+        claimed.last_error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = Job.QUEUED
+            claimed.run_after = timezone.now() + backoff(claimed.attempts)
+            logger.warning("Job %s failed, retrying at %s",
+                           claimed, claimed.run_after)
+        else:
+            claimed.status = Job.FAILED
+            claimed.finished_date = timezone.now()
+            logger.error("Job %s failed permanently", claimed)
+    else:
+        claimed.status = Job.DONE
+        claimed.finished_date = timezone.now()
+
+    claimed.save(update_fields=[
+        "status", "run_after", "finished_date", "last_error"])
+    if claimed.name in settings.JOBS_PERIODIC \
+            and claimed.finished_date is not None \
+            and claimed.dedup_key == periodic_key(claimed.name):
+        schedule(claimed.name)
+    return claimed
+
+
+def periodic_key(name: str) -> str:
+    return f"periodic:{name}"
+
+
+def schedule(name: str, delay: float = None) -> Job:
+    """Queues the next run of a periodic job, ``delay`` seconds from now
+    (by default its period) unless a run is already pending."""
+    if delay is None:
+        delay = settings.JOBS_PERIODIC[name]
+    return enqueue(name, dedup_key=periodic_key(name),
+                   run_after=timezone.now() + datetime.timedelta(seconds=delay))
+
+
+def schedule_periodic():
+    """Makes sure every periodic job has a pending run.
+
+    Runs queue the next one as they finish; this only starts them and
+    replaces runs lost to e.g. purged jobs.
+    """
+    for name in settings.JOBS_PERIODIC:
+        schedule(name, delay=0)
+
+
+def run_next() -> Optional[Job]:
+    """Claims and runs the next due job, if there is one."""
+    return run(claim_job())
+
+
+def requeue_stale(timeout: int = None) -> int:
+    """Requeues running jobs whose worker died without finishing them.
+
+    Jobs that have used up their attempts fail instead, so a job that keeps
+    crashing or hanging its worker is not retried forever. Returns the
+    number of jobs requeued.
+    """
+    timeout = timeout or settings.JOBS_TIMEOUT
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started_date__lt=now - datetime.timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, finished_date=now, last_error="Worker timed out")
+    if failed:
+        logger.error("%d timed out job(s) failed permanently", failed)
+    return stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.QUEUED, run_after=now, last_error="Worker timed out")
+
+
+def purge(older_than: int = None) -> int:
+    """Deletes finished jobs older than ``older_than`` seconds."""
+    older_than = older_than or settings.JOBS_RETENTION
+    cutoff = timezone.now() - datetime.timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED], finished_date__lt=cutoff).delete()
+    return deleted
+
+
+def stats(since: datetime.datetime) -> dict:
+    """Returns queue depth, throughput and latency since ``since``.
+
+    ``wait`` is the time a job sat in the queue after becoming due, ``run``
+    is the time its last attempt took to execute.
+    """
+    depth = dict(Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING])
+                 .values_list("status").annotate(Count("pk")))
+
+    wait = ExpressionWrapper(F("started_date") - F("run_after"),
+                             output_field=DurationField())
+    runtime = ExpressionWrapper(F("finished_date") - F("started_date"),
+                                output_field=DurationField())
+    finished = Job.objects.filter(finished_date__gte=since).values("name") \
+        .annotate(done=Count("pk", filter=Q(status=Job.DONE)),
+                  failed=Count("pk", filter=Q(status=Job.FAILED)),
+                  avg_wait=Avg(wait), max_wait=Max(wait),
+                  avg_run=Avg(runtime), max_run=Max(runtime)) \
+        .order_by("name")
+
+    elapsed = max((timezone.now() - since).total_seconds(), 1)
+    return {
+        "queued": depth.get(Job.QUEUED, 0),
+        "running": depth.get(Job.RUNNING, 0),
+        "jobs": [dict(row, per_minute=row["done"] * 60 / elapsed)
+                 for row in finished],
+    }
@@ -0,0 +1,179 @@
+import datetime
+import io
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+
+calls = []
+
+
+@queue.job("jobs.tests.record")
+def record(value):
+    calls.append(value)
+
+
+@queue.job("jobs.tests.tick")
+def tick():
+    calls.append("tick")
+
+
+@queue.job("jobs.tests.fail")
+def fail():
+    raise RuntimeError("Job failed")
+
+
+class QueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_priority_order(self):
+        """Tests that higher priority jobs run first, then oldest first"""
+        queue.enqueue("jobs.tests.record", {"value": "low"})
+        queue.enqueue("jobs.tests.record", {"value": "high"}, priority=10)
+        queue.enqueue("jobs.tests.record", {"value": "low 2"})
+
+        while queue.run_next():
+            pass
+
+        self.assertEqual(calls, ["high", "low", "low 2"])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_dedup_key(self):
+        """Tests that pending jobs with the same dedup key are merged"""
+        first = queue.enqueue("jobs.tests.record", {"value": 1}, dedup_key="a")
+        second = queue.enqueue("jobs.tests.record", {"value": 2}, dedup_key="a")
+        self.assertEqual(first.pk, second.pk)
+
+        queue.run_next()
+        third = queue.enqueue("jobs.tests.record", {"value": 3}, dedup_key="a")
+        self.assertNotEqual(first.pk, third.pk,
+                            "Finished jobs do not block new ones")
+
+    def test_delayed_job(self):
+        """Tests that jobs do not run before run_after"""
+        queue.enqueue("jobs.tests.record", {"value": 1},
+                      run_after=timezone.now() + datetime.timedelta(hours=1))
+        self.assertIsNone(queue.run_next())
+
+    @override_settings(JOBS_RETRY_DELAY=10)
+    def test_retry_backoff(self):
+        """Tests that failing jobs are retried with backoff, then failed"""
+        job = queue.enqueue("jobs.tests.fail", max_attempts=2)
+
+        queue.run_next()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("Job failed", job.last_error)
+        self.assertIsNone(queue.run_next(), "Retry waits for backoff")
+
+        Job.objects.update(run_after=timezone.now())
+        queue.run_next()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_requeue_stale(self):
+        """Tests that timed out jobs are requeued until out of attempts"""
+        retried = queue.enqueue("jobs.tests.record", {"value": 1})
+        exhausted = queue.enqueue("jobs.tests.record", {"value": 2},
+                                  max_attempts=1)
+        queue.claim_job(retried.pk)
+        queue.claim_job(exhausted.pk)
+        Job.objects.update(
+            started_date=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(queue.requeue_stale(timeout=60), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, Job.QUEUED)
+        self.assertEqual(exhausted.status, Job.FAILED)
+        self.assertIsNotNone(exhausted.finished_date)
+
+    def test_dedup_race(self):
+        """Tests that a duplicate finishing before it is read does not fail
+        the enqueue"""
+        first = queue.enqueue("jobs.tests.record", {"value": 1}, dedup_key="a")
+        real_filter = Job.objects.filter
+
+        def finish_first(*args, **kwargs):
+            # The duplicate finishes between the failed insert and the read
+            real_filter(pk=first.pk).update(status=Job.DONE)
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Job.objects, "filter", side_effect=finish_first):
+            second = queue.enqueue("jobs.tests.record", {"value": 2},
+                                   dedup_key="a")
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(second.status, Job.QUEUED)
+
+    @override_settings(JOBS_PERIODIC={"jobs.tests.tick": 60})
+    def test_periodic(self):
+        """Tests that periodic jobs queue their next run when they finish"""
+        queue.schedule_periodic()
+        queue.schedule_periodic()
+        self.assertEqual(Job.objects.count(), 1)
+
+        queue.run_next()
+        self.assertEqual(calls, ["tick"])
+        pending = Job.objects.get(status=Job.QUEUED)
+        self.assertGreater(pending.run_after,
+                           timezone.now() + datetime.timedelta(seconds=50))
+        queue.schedule_periodic()
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    @override_settings(JOBS_PERIODIC={"jobs.tests.tick": 60})
+    def test_worker_maintenance_on_start(self):
+        """Tests that a worker schedules periodic jobs before its first poll,
+        however recently its host booted"""
+        with mock.patch("time.monotonic", return_value=1.0), \
+                mock.patch("signal.signal"):
+            call_command("runjobs", burst=True, stdout=io.StringIO())
+        self.assertEqual(calls, ["tick"])
+
+    def test_stats(self):
+        """Tests throughput and latency stats for finished jobs"""
+        queue.enqueue("jobs.tests.record", {"value": 1})
+        queue.enqueue("jobs.tests.record", {"value": 2})
+        queue.run_next()
+
+        stats = queue.stats(timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(stats["queued"], 1)
+        self.assertEqual(len(stats["jobs"]), 1)
+        self.assertEqual(stats["jobs"][0]["done"], 1)
+        self.assertIsNotNone(stats["jobs"][0]["avg_run"])
+
+
+class ConcurrentWorkerTests(TransactionTestCase):
+
+    def test_skip_locked(self):
+        """Tests that a job being claimed is skipped by other workers"""
+        first = queue.enqueue("jobs.tests.record", {"value": 1})
+        second = queue.enqueue("jobs.tests.record", {"value": 2})
+        locked, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            with transaction.atomic():
+                list(Job.objects.select_for_update().filter(pk=first.pk))
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        locked.wait(5)
+        try:
+            claimed = queue.claim_job()
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(claimed.pk, second.pk)
@@ -1,32 +1,125 @@
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
+
 from .models import Poster, Comment, Conference
+from .stats import count_subquery
+
+# Inlines only show the most recent rows; the rest are reached through the
+# paginated changelist linked from the parent's change page.
+INLINE_LIMIT = 20
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):
+    """Shows the parent's INLINE_LIMIT most recent related rows."""
+    ordering_field = "-pk"
+
+    def get_queryset(self):
+        # self.queryset is already filtered to the parent's rows
+        if not hasattr(self, "_queryset"):
+            self._queryset = self.queryset \
+                .order_by(self.ordering_field)[:INLINE_LIMIT]
+        return self._queryset
 
 
-class CommentInline(admin.TabularInline):
+class LimitedInlineMixin:
+    """Limits an inline to the INLINE_LIMIT most recent related rows."""
+    formset = LimitedInlineFormSet
+    ordering_field = "-pk"
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.ordering_field = self.ordering_field
+        return formset
+
+
+class CommentInline(LimitedInlineMixin, admin.TabularInline):
     model = Comment
     extra = 3
+    fields = ("author", "body", "active", "parent")
+    autocomplete_fields = ("author",)
+    raw_id_fields = ("parent",)
+    ordering_field = "-created_date"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("author")
 
 
 class PosterAdmin(admin.ModelAdmin):
     fieldsets = [
         ("Details",          {"fields": ["title", "subtitle", "description"]}),
+        ("Conference",       {"fields": ["conference", "authors"]}),
         ("Image",            {"fields": ["image"]}),
-        ("Date information", {"fields": ["created_on"]}),
+        ("Date information", {"fields": ["created_date"]}),
     ]
     inlines = [CommentInline]
+    autocomplete_fields = ("conference", "authors")
 
+    list_display = ("title", "conference", "created_date", "comment_count")
+    list_select_related = ("conference",)
+    list_filter = ("created_date",)
+    search_fields = ("title", "subtitle")
+    show_full_result_count = False
 
-class PosterInline(admin.TabularInline):
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            comment_count=count_subquery(Comment.objects.all(), "poster"))
+
+    def comment_count(self, poster):
+        return poster.comment_count or 0
+    comment_count.short_description = "Comments"
+    comment_count.admin_order_field = "comment_count"
+
+
+class PosterInline(LimitedInlineMixin, admin.TabularInline):
     model = Poster
     extra = 3
+    fields = ("title", "subtitle", "created_date")
+    show_change_link = True
+    ordering_field = "-created_date"
 
 
 class ConferenceAdmin(admin.ModelAdmin):
     fieldsets = [
         (None, {"fields": ["title", "institution", "description"]}),
         ("Users", {"fields": ["organizers", "attendees", "guests"]}),
+        ("Posters", {"fields": ["all_posters"]}),
     ]
+    readonly_fields = ("all_posters",)
+    autocomplete_fields = ("organizers", "attendees", "guests")
     inlines = [PosterInline]
 
+    list_display = ("title", "institution", "created_date", "poster_count",
+                    "attendee_count")
+    search_fields = ("title", "institution")
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        attendees = Conference.attendees.through.objects.all()
+        return super().get_queryset(request).annotate(
+            poster_count=count_subquery(Poster.objects.all(), "conference"),
+            attendee_count=count_subquery(attendees, "conference"))
+
+    def poster_count(self, conference):
+        return conference.poster_count or 0
+    poster_count.short_description = "Posters"
+    poster_count.admin_order_field = "poster_count"
+
+    def attendee_count(self, conference):
+        return conference.attendee_count or 0
+    attendee_count.short_description = "Attendees"
+    attendee_count.admin_order_field = "attendee_count"
+
+    def all_posters(self, conference):
+        if conference.pk is None:
+            return "-"
+        url = reverse("admin:poster_poster_changelist")
+        return format_html(
+            '<a href="{}?conference__id__exact={}">View all {} posters</a>',
+            url, conference.pk, conference.poster_count or 0)
+    all_posters.short_description = "All posters"
+
 
 admin.site.register(Conference, ConferenceAdmin)
+admin.site.register(Poster, PosterAdmin)
@@ -0,0 +1,159 @@
+"""Poster view counting without a database write per page view.
+
+``record_view`` adds to a counter in the worker's memory. A background
+thread, started with the first view, writes the buffered counts every
+``settings.POSTER_VIEWS_FLUSH_INTERVAL`` seconds with a single multi-row
+``INSERT ... ON CONFLICT DO UPDATE`` into hourly ``PosterViews`` rows, which
+the organizer rollups read from. Counts are therefore at most one interval
+behind, whether or not the worker sees further views, and a killed worker
+loses at most one interval of them. Counts of posters deleted in the
+meantime are skipped, and counts that fail to be written twice are dropped.
+"""
+import atexit
+import datetime
+import logging
+import os
+import threading
+from collections import Counter
+from typing import List
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Poster, PosterViews
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "viewed_posters"
+# Caps the per-session dedup list so sessions stay small
+SESSION_MAX_POSTERS = 500
+
+
+class ViewBuffer:
+    """Thread-safe per-process buffer of (poster, conference, hour) counts."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        # Whether the buffer holds counts from a failed flush
+        self.retrying = False
+        # Replaced rather than set, which could block on a lock held at
+        # fork; a flusher finding another event here stops on its next wake
+        self.stopped = threading.Event()
+        self.flusher = None
+
+    def add(self, poster_id: int, conference_id: int, hour: datetime.datetime):
+        with self.lock:
+            self.counts[(poster_id, conference_id, hour)] += 1
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.flush_periodically, args=(self.stopped,),
+                    name="poster-views-flusher", daemon=True)
+                self.flusher.start()
+
+    def flush_periodically(self, stopped: threading.Event):
+        while not stopped.wait(settings.POSTER_VIEWS_FLUSH_INTERVAL) \
+                and self.stopped is stopped:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush poster views")
+            finally:
+                # The thread's own connection, not a request's
+                connection.close()
+
+    def flush(self) -> int:
+        """Writes buffered counts to the database, returning rows upserted."""
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+
+        if not counts:
+            return 0
+
+        try:
+            upsert(counts)
+        except Exception:
+            with self.lock:
+                if self.retrying:
+                    # Counts that failed twice would fail every flush after
+                    logger.error("Dropped %d poster view counts", len(counts))
+                    self.retrying = False
+                else:
+                    # Keep the counts for the next flush rather than losing them
+                    self.counts.update(counts)
+                    self.retrying = True
+            raise
+        self.retrying = False
+        return len(counts)
+
+
+def upsert(counts: Counter):
+    """Adds the counts to the hourly rows, skipping posters deleted since
+    they were viewed."""
+    table = PosterViews._meta.db_table
+    rows = ", ".join(["(%s, %s, %s)"] * len(counts))
+    params = []
+    for (poster_id, _, hour), views in counts.items():
+        params += [poster_id, hour, views]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (poster_id, conference_id, hour, views) "
+            f"SELECT counts.poster_id, poster.conference_id, counts.hour, "
+            f"counts.views FROM (VALUES {rows}) AS counts (poster_id, hour, views) "
+            f"JOIN {Poster._meta.db_table} AS poster "
+            f"ON poster.id = counts.poster_id "
+            f"ON CONFLICT (poster_id, hour) "
+            f"DO UPDATE SET views = {table}.views + EXCLUDED.views", params)
+
+
+buffer = ViewBuffer()
+atexit.register(buffer.flush)
+# A forked worker (e.g. under gunicorn --preload) must not inherit the
+# parent's counts, which the parent flushes itself, or a held lock
+os.register_at_fork(after_in_child=buffer.reset)
+
+
+def record_view(request, poster: Poster) -> bool:
+    """Counts a view of ``poster`` unless this session has already seen it."""
+    viewed = request.session.get(SESSION_KEY, [])
+    if poster.pk in viewed:
+        return False
+    request.session[SESSION_KEY] = (viewed + [poster.pk])[-SESSION_MAX_POSTERS:]
+
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    buffer.add(poster.pk, poster.conference_id, hour)
+    return True
+
+
+def top_posters(conference, since: datetime.datetime = None, limit: int = 10):
+    """Returns the conference's most viewed posters annotated with ``views``."""
+    rows = PosterViews.objects.filter(conference=conference)
+    if since is not None:
+        rows = rows.filter(hour__gte=since)
+    totals = rows.values("poster").annotate(total=Sum("views")) \
+        .order_by("-total")[:limit]
+
+    views = {row["poster"]: row["total"] for row in totals}
+    posters = Poster.objects.in_bulk(views)
+    ranked = []
+    for pk, total in views.items():
+        if pk in posters:
+            posters[pk].views = total
+            ranked.append(posters[pk])
+    return ranked
+
+
+def views_per_day(conference, since: datetime.datetime = None) -> List[dict]:
+    """Returns ``{"day": ..., "views": ...}`` totals for the conference."""
+    rows = PosterViews.objects.filter(conference=conference)
+    if since is not None:
+        rows = rows.filter(hour__gte=since)
+    return list(rows.annotate(day=TruncDay("hour")).values("day")
+                .annotate(views=Sum("views")).order_by("day"))
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PosterConfig(AppConfig):
     name = 'poster'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,302 @@
+"""Cold storage for conferences nobody edits anymore.
+
+``archive_conference`` moves a conference's posters, comments, related
+posters and view counts out of the hot tables into a single
+``ConferenceArchive`` row holding zlib-compressed JSON, and marks the
+conference ``is_archived``. The conference row itself, its roster and the
+users stay, so the conference and poster pages keep working read-only from
+the archive. ``restore_conference`` moves everything back with the same ids.
+
+Rows are moved with plain SQL rather than ``delete()`` so that no signals
+fire: users keep their stats, and clients syncing the conference keep their
+copy instead of receiving deletions.
+"""
+import datetime
+import functools
+import json
+import zlib
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import User
+from jobs import queue
+
+from . import duplicates, facets, feed, related
+from .models import (Change, Comment, Conference, ConferenceArchive,
+                     DuplicatePoster, FacetCount, FeedEntry, ImageHashChunk,
+                     Notification, Poster, PosterFacet, PosterViews,
+                     RelatedPoster)
+
+FORMAT_VERSION = 1
+RESTORE_JOB = "poster.restore_conference"
+
+POSTER_FIELDS = ["id", "title", "subtitle", "description", "image",
+                 "image_hash", "created_date", "updated_date"]
+COMMENT_FIELDS = ["id", "poster_id", "author_id", "parent_id", "thread_id",
+                  "path", "depth", "body", "body_html", "body_html_version",
+                  "active", "created_date", "updated_date"]
+DATE_FIELDS = ["created_date", "updated_date"]
+
+
+def stale_conferences(days: int = None):
+    """Conferences without changes to them, their posters or comments in
+    ``days`` (by default ``settings.ARCHIVE_AFTER_DAYS``) days."""
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+    return Conference.objects.filter(is_archived=False, created_date__lt=cutoff) \
+        .exclude(poster__updated_date__gte=cutoff) \
+        .exclude(poster__comment__updated_date__gte=cutoff)
+
+
+def dump(conference: Conference) -> dict:
+    posters = list(Poster.objects.filter(conference=conference)
+                   .order_by("pk").values(*POSTER_FIELDS))
+    authors = {}
+    links = Poster.authors.through.objects \
+        .filter(poster__conference=conference).order_by("poster", "user") \
+        .values_list("poster", "user")
+    for poster_id, user_id in links:
+        authors.setdefault(poster_id, []).append(user_id)
+    for poster in posters:
+        poster["authors"] = authors.get(poster["id"], [])
+
+    return {
+        "version": FORMAT_VERSION,
+        "posters": posters,
+        "comments": list(Comment.objects.filter(poster__conference=conference)
+                         .order_by("path").values(*COMMENT_FIELDS)),
+        "related": list(RelatedPoster.objects
+                        .filter(poster__conference=conference)
+                        .order_by("poster", "rank")
+                        .values_list("poster", "related", "rank", "score")),
+        "views": list(PosterViews.objects.filter(conference=conference)
+                      .order_by("hour", "poster")
+                      .values_list("poster", "hour", "views")),
+    }
+
+
+def encode_date(value):
+    # Unlike DjangoJSONEncoder, keeps microseconds
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(data: dict) -> bytes:
+    return zlib.compress(json.dumps(
+        data, default=encode_date, separators=(",", ":")).encode(), 9)
+
+
+def decode(blob: bytes) -> dict:
+    data = json.loads(zlib.decompress(blob))
+    for row in data["posters"] + data["comments"]:
+        for field in DATE_FIELDS:
+            row[field] = parse_datetime(row[field])
+    data["views"] = [(poster, parse_datetime(hour), views)
+                     for poster, hour, views in data["views"]]
+    return data
+
+
+def purge(conference_id: int):
+    """Deletes a conference's posters and everything hanging off them."""
+    posters = f"SELECT id FROM {Poster._meta.db_table} WHERE conference_id = %s"
+    comments = f"SELECT id FROM {Comment._meta.db_table} " \
+               f"WHERE poster_id IN ({posters})"
+    statements = [
+        (Notification, f"comment_id IN ({comments})"),
+        (FeedEntry, "conference_id = %s"),
+        (PosterViews, "conference_id = %s"),
+        (RelatedPoster, f"poster_id IN ({posters})"),
+        (PosterFacet, "conference_id = %s"),
+        (FacetCount, "conference_id = %s"),
+        (ImageHashChunk, "conference_id = %s"),
+        (DuplicatePoster, "conference_id = %s"),
+        (Comment, f"poster_id IN ({posters})"),
+        (Poster.authors.through, f"poster_id IN ({posters})"),
+        (Poster, "conference_id = %s"),
+    ]
+    with connection.cursor() as cursor:
+        for model, where in statements:
+            cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE {where}",
+                           [conference_id])
+
+
+def archive_conference(conference_id: int) -> Optional[ConferenceArchive]:
+    """Moves a conference into an archive, returning it.
+
+    Returns None if the conference is already archived.
+    """
+    with transaction.atomic():
+        conference = Conference.objects.select_for_update() \
+            .get(pk=conference_id)
+        if conference.is_archived:
+            return None
+
+        data = dump(conference)
+        archive = ConferenceArchive.objects.create(
+            conference=conference, data=encode(data),
+            poster_count=len(data["posters"]),
+            comment_count=len(data["comments"]))
+        purge(conference.pk)
+        conference.is_archived = True
+        conference.save(update_fields=["is_archived"])
+        # Clients keep their copy of an archived conference
+        Change.objects.filter(conference_id=conference.pk,
+                              xid=RawSQL("txid_current()", [])).delete()
+    return archive
+
+
+def restore_conference(conference_id: int) -> int:
+    """Moves an archived conference back, returning its number of posters.
+
+    Authors and comments of users deleted in the meantime are dropped, along
+    with the replies to those comments. Rows keep their archived dates, and
+    facets, duplicates, related posters and recent feed entries are rebuilt.
+    """
+    with transaction.atomic():
+        conference = Conference.objects.select_for_update() \
+            .get(pk=conference_id)
+        if not conference.is_archived:
+            return 0
+
+        data = decode(conference.archive.data)
+        user_ids = {user_id for poster in data["posters"]
+                    for user_id in poster["authors"]}
+        user_ids.update(comment["author_id"] for comment in data["comments"])
+        users = set(User.objects.filter(pk__in=user_ids)
+                    .values_list("pk", flat=True))
+
+        posters = []
+        links = []
+        for row in data["posters"]:
+            row = dict(row)
+            links += [Poster.authors.through(poster_id=row["id"], user_id=pk)
+                      for pk in row.pop("authors") if pk in users]
+            posters.append(Poster(conference=conference, **row))
+        restore_dates(Poster, posters)
+        Poster.authors.through.objects.bulk_create(links, batch_size=1000)
+
+        comments = []
+        dropped = []
+        for row in data["comments"]:  # In path order, parents first
+            if row["author_id"] not in users or any(
+                    row["path"].startswith(path) for path in dropped):
+                dropped.append(row["path"])
+            else:
+                comments.append(Comment(**row))
+        restore_dates(Comment, comments)
+
+        RelatedPoster.objects.bulk_create([
+            RelatedPoster(poster_id=poster, related_id=related, rank=rank,
+                          score=score)
+            for poster, related, rank, score in data["related"]
+        ], batch_size=1000)
+        PosterViews.objects.bulk_create([
+            PosterViews(poster_id=poster, conference=conference, hour=hour,
+                        views=views)
+            for poster, hour, views in data["views"]
+        ], batch_size=1000)
+
+        conference.archive.delete()
+        conference.is_archived = False
+        # Saving created_date, an auto_now field, marks the conference as
+        # touched so that it is not archived again right away
+        conference.save(update_fields=["is_archived", "created_date"])
+        facets.rebuild_conference(conference.pk)
+        duplicates.index_conference(conference.pk)
+        rebuild_derived(conference, posters, comments)
+    return len(posters)
+
+
+def restore_dates(model, instances: list):
+    """Creates the rows with their archived dates, which ``bulk_create``
+    replaces with now for ``auto_now`` and ``auto_now_add`` fields."""
+    dates = [[getattr(instance, field) for field in DATE_FIELDS]
+             for instance in instances]
+    model.objects.bulk_create(instances, batch_size=1000)
+    for instance, values in zip(instances, dates):
+        for field, value in zip(DATE_FIELDS, values):
+            setattr(instance, field, value)
+    model.objects.bulk_update(instances, DATE_FIELDS, batch_size=1000)
+
+
+def rebuild_derived(conference: Conference, posters: List[Poster],
+                    comments: List[Comment]):
+    """Queues the jobs that ``post_save`` would have queued for the restored
+    rows, which ``bulk_create`` does not send."""
+    related.queue_rebuild(conference.pk)
+    for poster in posters:
+        if poster.image and poster.image_hash is None:
+            duplicates.queue_hash(poster.pk)
+
+    # Older entries would only be trimmed again
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.FEED_RETENTION_DAYS)
+    for poster in posters:
+        if poster.created_date >= cutoff:
+            feed.queue_fan_out(poster.pk)
+    for comment in comments:
+        if comment.active and comment.created_date >= cutoff:
+            feed.queue_fan_out(comment.poster_id, comment.pk)
+
+
+def queue_restore(conference_id: int):
+    queue.enqueue(RESTORE_JOB, {"conference_id": conference_id},
+                  dedup_key=f"{RESTORE_JOB}:{conference_id}")
+
+
+@functools.lru_cache(maxsize=8)
+def load(conference_id: int, archived_date: datetime.datetime) -> dict:
+    """Returns the decoded archive, cached per process until it changes."""
+    return decode(ConferenceArchive.objects.get(
+        conference_id=conference_id, archived_date=archived_date).data)
+
+
+def archived_data(conference: Conference) -> dict:
+    archived_date = ConferenceArchive.objects \
+        .filter(conference=conference) \
+        .values_list("archived_date", flat=True).get()
+    return load(conference.pk, archived_date)
+
+
+def posters(conference: Conference, data: dict = None) -> List[Poster]:
+    """The archived posters, as unsaved instances for read-only templates."""
+    data = data or archived_data(conference)
+    result = []
+    for row in data["posters"]:
+        row = dict(row)
+        del row["authors"]
+        result.append(Poster(conference=conference, **row))
+    return result
+
+
+def poster_page(conference: Conference, poster_pk: int) -> Optional[dict]:
+    """Returns the context of an archived poster's page, or None."""
+    data = archived_data(conference)
+    by_pk: Dict[int, Poster] = {poster.pk: poster
+                                for poster in posters(conference, data)}
+    poster = by_pk.get(poster_pk)
+    if poster is None:
+        return None
+
+    rows = [row for row in data["comments"]
+            if row["poster_id"] == poster_pk and row["active"]]
+    authors = User.objects.in_bulk({row["author_id"] for row in rows})
+    comments = []
+    for row in rows:
+        comment = Comment(**row)
+        comment.author = authors.get(row["author_id"])
+        if comment.author is not None:
+            comments.append(comment)
+
+    related = []
+    for pk, related_pk, rank, score in data["related"]:
+        if pk == poster_pk and related_pk in by_pk:
+            related.append(RelatedPoster(poster=poster, related=by_pk[related_pk],
+                                         rank=rank, score=score))
+    return {"poster": poster, "comments": comments, "related": related}
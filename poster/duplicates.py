@@ -0,0 +1,214 @@
+"""Near-duplicate poster detection from perceptual image hashes.
+
+When a poster's image changes, a job computes its 64-bit perceptual hash:
+the image is decoded at reduced size, shrunk to 32x32 grayscale, and the
+signs of its lowest 8x8 DCT frequencies against their median give the bits.
+Re-encoded, rescaled or slightly edited copies of an image keep almost all
+of their bits, so their hashes are a small Hamming distance apart.
+
+Hashes are indexed by byte in ``ImageHashChunk`` rows. Two hashes at most 7
+bits apart agree on at least one of their 8 bytes, so a poster is only
+compared with the posters of its conference sharing a byte with it, found
+through the (conference, position, value) index, rather than with every
+poster. Pairs within ``settings.DUPLICATE_POSTER_DISTANCE`` bits are stored
+as ``DuplicatePoster`` rows and shown to organizers.
+"""
+import functools
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from jobs import queue
+
+from .models import DuplicatePoster, ImageHashChunk, Poster
+
+JOB_NAME = "poster.hash_image"
+
+# Side of the grayscale image the DCT is taken of
+IMAGE_SIZE = 32
+# Side of the block of lowest frequencies giving the 64 bits
+HASH_SIZE = 8
+CHUNKS = 8
+MASK = (1 << 64) - 1
+# Namespace for pg_advisory_xact_lock(namespace, conference id)
+LOCK_NAMESPACE = 3802
+
+
+@functools.lru_cache(maxsize=1)
+def dct_matrix(size: int):
+    """The DCT-II matrix, so that ``D @ X @ D.T`` transforms a square X."""
+    import numpy as np
+
+    k = np.arange(size).reshape(-1, 1)
+    n = np.arange(size).reshape(1, -1)
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+
+def image_hash(file) -> int:
+    """Returns the perceptual hash of an image file as a signed 64-bit
+    integer, the range of a ``BigIntegerField``.
+
+    Raises ``OSError`` or ``ValueError`` when the image cannot be read.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(file) as image:
+        # JPEGs are decoded straight at a fraction of their size
+        image.draft("L", (IMAGE_SIZE * 4, IMAGE_SIZE * 4))
+        small = image.convert("L").resize((IMAGE_SIZE, IMAGE_SIZE),
+                                          Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.float64)
+
+    matrix = dct_matrix(IMAGE_SIZE)
+    low = (matrix @ pixels @ matrix.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term is the average brightness, which says nothing about shapes
+    bits = low > np.median(low[1:])
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def distance(a: int, b: int) -> int:
+    """Number of bits in which two hashes differ."""
+    return bin((a ^ b) & MASK).count("1")
+
+
+def chunks(value: int) -> List[Tuple[int, int]]:
+    """Returns the (position, value) of each byte of a hash."""
+    return list(enumerate((value & MASK).to_bytes(CHUNKS, "big")))
+
+
+def pair(pk: int, other_pk: int, conference_id: int, bits: int) \
+        -> DuplicatePoster:
+    # The newer poster is the possible duplicate of the older one
+    return DuplicatePoster(poster_id=max(pk, other_pk),
+                           original_id=min(pk, other_pk),
+                           conference_id=conference_id, distance=bits)
+
+
+def lock(conference_id: int):
+    """Serializes indexing within a conference, so that two posters indexed
+    at once still find each other."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                       [LOCK_NAMESPACE, conference_id])
+
+
+def unindex(poster_ids: Iterable[int]):
+    poster_ids = list(poster_ids)
+    ImageHashChunk.objects.filter(poster__in=poster_ids).delete()
+    DuplicatePoster.objects.filter(
+        Q(poster__in=poster_ids) | Q(original__in=poster_ids)).delete()
+
+
+def index_poster(poster: Poster) -> List[DuplicatePoster]:
+    """Indexes a poster's hash and returns its possible duplicates."""
+    with transaction.atomic():
+        lock(poster.conference_id)
+        unindex([poster.pk])
+        if poster.image_hash is None:
+            return []
+
+        own = chunks(poster.image_hash)
+        ImageHashChunk.objects.bulk_create(
+            ImageHashChunk(poster=poster, conference_id=poster.conference_id,
+                           position=position, value=value)
+            for position, value in own)
+
+        shared = Q()
+        for position, value in own:
+            shared |= Q(position=position, value=value)
+        candidates = ImageHashChunk.objects \
+            .filter(shared, conference_id=poster.conference_id) \
+            .exclude(poster=poster).values("poster")
+        # store_hash clears a hash before the poster's chunks are unindexed
+        hashes = Poster.objects.filter(pk__in=candidates) \
+            .exclude(image_hash=None).values_list("pk", "image_hash")
+
+        found = []
+        for pk, other_hash in hashes:
+            bits = distance(poster.image_hash, other_hash)
+            if bits <= settings.DUPLICATE_POSTER_DISTANCE:
+                found.append(pair(poster.pk, pk, poster.conference_id, bits))
+        return DuplicatePoster.objects.bulk_create(found)
+
+
+def index_conference(conference_id: int) -> int:
+    """Rebuilds the index and duplicates of a conference from the stored
+    hashes, returning the number of duplicates found."""
+    hashes: Dict[int, int] = dict(
+        Poster.objects.filter(conference_id=conference_id)
+        .exclude(image_hash=None).values_list("pk", "image_hash"))
+
+    buckets = defaultdict(list)
+    rows = []
+    for pk, value in hashes.items():
+        for chunk in chunks(value):
+            buckets[chunk].append(pk)
+            rows.append(ImageHashChunk(poster_id=pk, conference_id=conference_id,
+                                       position=chunk[0], value=chunk[1]))
+
+    found = {}
+    for pks in buckets.values():
+        for i, pk in enumerate(pks):
+            for other_pk in pks[i + 1:]:
+                key = (min(pk, other_pk), max(pk, other_pk))
+                if key not in found:
+                    found[key] = distance(hashes[pk], hashes[other_pk])
+
+    with transaction.atomic():
+        lock(conference_id)
+        ImageHashChunk.objects.filter(conference_id=conference_id).delete()
+        DuplicatePoster.objects.filter(conference_id=conference_id).delete()
+        ImageHashChunk.objects.bulk_create(rows, batch_size=1000)
+        duplicates = DuplicatePoster.objects.bulk_create([
+            pair(pk, other_pk, conference_id, bits)
+            for (pk, other_pk), bits in sorted(found.items())
+            if bits <= settings.DUPLICATE_POSTER_DISTANCE
+        ], batch_size=1000)
+    return len(duplicates)
+
+
+def store_hash(poster: Poster) -> Optional[int]:
+    """Hashes a poster's current image and stores the hash, returning it.
+
+    Posters without a readable image get no hash.
+    """
+    try:
+        value = image_hash(poster.image.path) if poster.image else None
+    except (OSError, ValueError):
+        value = None
+    poster.image_hash = value
+    # update() rather than save(), which would hash the poster again
+    Poster.objects.filter(pk=poster.pk).update(image_hash=value)
+    return value
+
+
+def hash_poster(poster_id: int) -> List[DuplicatePoster]:
+    """Hashes and indexes a poster, returning its possible duplicates."""
+    poster = Poster.objects.filter(pk=poster_id).first()
+    if poster is None:
+        return []
+    store_hash(poster)
+    return index_poster(poster)
+
+
+def queue_hash(poster_id: int):
+    queue.enqueue(JOB_NAME, {"poster_id": poster_id},
+                  dedup_key=f"{JOB_NAME}:{poster_id}")
+
+
+def image_changed(poster: Poster) -> bool:
+    """Whether the poster was saved with another image than it was loaded
+    with."""
+    return (poster.image.name or None) != (poster._loaded_image or None)
+
+
+def for_conference(conference_id: int):
+    """The conference's possible duplicates, closest first."""
+    return DuplicatePoster.objects.filter(conference_id=conference_id) \
+        .select_related("poster", "original") \
+        .order_by("distance", "-poster")
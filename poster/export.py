@@ -0,0 +1,158 @@
+"""Streaming ZIP archives of a whole conference.
+
+``export_conference`` is a generator of bytes: rows are read with chunked
+``iterator()`` querysets, written into a ZIP file that never seeks, and
+handed out as soon as they are compressed. Memory use therefore stays
+constant no matter how many posters, comments or images a conference has.
+
+Archive layout::
+
+    conference.json        conference details
+    roster.csv             one row per organizer, attendee and guest
+    posters.csv
+    poster_authors.csv
+    comments.csv           one row per comment, in thread order
+    images/<poster id>-<file name>
+"""
+import csv
+import io
+import json
+import os
+import time
+import zipfile
+from typing import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Change, Comment, Conference, Poster
+
+CHUNK_SIZE = 2000
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+
+class ZipStream(io.RawIOBase):
+    """A write-only, unseekable file whose contents are drained by a generator."""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def zip_info(name: str, compress_type=zipfile.ZIP_DEFLATED) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def csv_rows(archive: zipfile.ZipFile, stream: ZipStream, name: str,
+             header, rows) -> Iterator[bytes]:
+    """Writes ``rows`` as a CSV entry, yielding compressed output as it goes."""
+    with archive.open(zip_info(name), "w", force_zip64=True) as entry:
+        text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(header)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if i % CHUNK_SIZE == 0:
+                text.flush()
+                yield stream.drain()
+        text.flush()
+        text.detach()
+    yield stream.drain()
+
+
+def conference_manifest(conference: Conference) -> dict:
+    return dict(
+        id=conference.pk,
+        title=conference.title,
+        institution=conference.institution,
+        description=conference.description,
+        created_date=conference.created_date,
+        is_public=conference.is_public,
+    )
+
+
+def roster(conference: Conference) -> Iterator[tuple]:
+    for role in Change.ROLES:
+        members = getattr(conference, role).order_by("pk") \
+            .values_list("pk", "email")
+        for user_id, email in members.iterator(chunk_size=CHUNK_SIZE):
+            yield role, user_id, email
+
+
+def export_conference(conference: Conference) -> Iterator[bytes]:
+    """Yields a ZIP archive of ``conference`` chunk by chunk.
+
+    Archived conferences have no rows to read; restore them first.
+    """
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, "w")
+
+    archive.writestr(
+        zip_info("conference.json"),
+        json.dumps(conference_manifest(conference), cls=DjangoJSONEncoder,
+                   indent=2))
+    yield stream.drain()
+
+    yield from csv_rows(archive, stream, "roster.csv",
+                        ["role", "user_id", "email"], roster(conference))
+
+    posters = Poster.objects.filter(conference=conference).order_by("pk")
+    yield from csv_rows(
+        archive, stream, "posters.csv",
+        ["id", "title", "subtitle", "description", "created_date", "image"],
+        ([p.pk, p.title, p.subtitle, p.description, p.created_date.isoformat(),
+          p.image.name or ""] for p in posters.iterator(chunk_size=CHUNK_SIZE)))
+
+    authors = Poster.authors.through.objects \
+        .filter(poster__conference=conference).order_by("poster", "user") \
+        .values_list("poster", "user", "user__email", "user__first_name",
+                     "user__last_name")
+    yield from csv_rows(
+        archive, stream, "poster_authors.csv",
+        ["poster_id", "user_id", "email", "first_name", "last_name"],
+        authors.iterator(chunk_size=CHUNK_SIZE))
+
+    comments = Comment.objects.filter(poster__conference=conference) \
+        .order_by("poster", "path") \
+        .values_list("pk", "poster", "parent", "depth", "author__email",
+                     "created_date", "active", "body")
+    yield from csv_rows(
+        archive, stream, "comments.csv",
+        ["id", "poster_id", "parent_id", "depth", "author", "created_date",
+         "active", "body"],
+        ([pk, poster, parent or "", depth, author, created.isoformat(),
+          active, body]
+         for pk, poster, parent, depth, author, created, active, body
+         in comments.iterator(chunk_size=CHUNK_SIZE)))
+
+    images = posters.exclude(image="").exclude(image__isnull=True) \
+        .only("pk", "image")
+    for poster in images.iterator(chunk_size=CHUNK_SIZE):
+        name = f"images/{poster.pk}-{os.path.basename(poster.image.name)}"
+        try:
+            source = poster.image.open("rb")
+        except FileNotFoundError:
+            continue
+        # Images are already compressed, so they are stored as-is
+        with source, archive.open(zip_info(name, zipfile.ZIP_STORED), "w",
+                                  force_zip64=True) as entry:
+            for chunk in iter(lambda: source.read(IMAGE_CHUNK_SIZE), b""):
+                entry.write(chunk)
+                yield stream.drain()
+        yield stream.drain()
+
+    archive.close()
+    yield stream.drain()
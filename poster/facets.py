@@ -0,0 +1,236 @@
+"""Faceted filtering of a conference's posters.
+
+Every poster is indexed under its keywords, its authors' institutions and
+its authors as ``PosterFacet`` rows, and ``FacetCount`` keeps the number of
+posters per facet value in each conference. Both are updated from the
+difference between a poster's old and new facets whenever it is saved, so
+conference pages read counts instead of grouping over every poster.
+
+Keywords are the words that stand out in a poster's title, subtitle and
+description, plus any ``#tags`` in its description. Institutions are the
+authors' e-mail domains.
+
+Filtering by several values intersects their poster id lists, each read
+from the ``(conference, facet, value, poster)`` index.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import urlencode
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import FacetCount, Poster, PosterFacet
+from .related import tokenize
+
+KEYWORDS_PER_POSTER = 5
+# Values shown per facet on conference pages
+FACET_LIMIT = 15
+# Namespace for pg_advisory_xact_lock(namespace, conference id)
+LOCK_NAMESPACE = 3803
+
+TAG_RE = re.compile(r"#(\w{2,50})")
+# Title words count most towards a poster's keywords
+TITLE_WEIGHT = 3
+SUBTITLE_WEIGHT = 2
+
+# (facet, value) -> label
+Facets = Dict[Tuple[str, str], str]
+
+
+def keywords(poster: Poster) -> List[str]:
+    weights = Counter()
+    for text, weight in ((poster.title, TITLE_WEIGHT),
+                         (poster.subtitle, SUBTITLE_WEIGHT),
+                         (poster.description, 1)):
+        for token in tokenize(text):
+            if 2 < len(token) <= 100 and not token.isdigit():
+                weights[token] += weight
+    # most_common keeps first-seen order for ties, so title words win
+    return [token for token, _ in weights.most_common(KEYWORDS_PER_POSTER)]
+
+
+def extract(poster: Poster) -> Facets:
+    """Returns the facet values ``poster`` should be listed under."""
+    facets = {(PosterFacet.KEYWORD, word): word for word in keywords(poster)}
+    for tag in TAG_RE.findall(poster.description):
+        facets[(PosterFacet.KEYWORD, tag.lower())] = tag.lower()
+
+    for author in poster.authors.all():
+        facets[(PosterFacet.AUTHOR, str(author.pk))] = \
+            author.get_full_name() or author.username
+        domain = author.email.rpartition("@")[2].lower()[:100]
+        if domain:
+            facets[(PosterFacet.INSTITUTION, domain)] = domain
+    return facets
+
+
+def adjust_counts(conference_id: int, facets: Facets, delta: int):
+    """Adds ``delta`` to the counts of ``facets``, touching the rows in key
+    order so that concurrent adjustments lock them in the same order."""
+    if not facets:
+        return
+    facets = dict(sorted(facets.items()))
+
+    if delta > 0:
+        table = FacetCount._meta.db_table
+        rows = ", ".join(["(%s, %s, %s, %s, %s)"] * len(facets))
+        params = []
+        for (facet, value), label in facets.items():
+            params += [conference_id, facet, value, label, delta]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (conference_id, facet, value, label, count) "
+                f"VALUES {rows} ON CONFLICT (conference_id, facet, value) "
+                f"DO UPDATE SET count = {table}.count + EXCLUDED.count, "
+                f"label = EXCLUDED.label", params)
+        return
+
+    decremented = Q()
+    for facet, value in facets:
+        FacetCount.objects.filter(
+            conference_id=conference_id, facet=facet, value=value) \
+            .update(count=Greatest(F("count") + delta, 0))
+        decremented |= Q(facet=facet, value=value)
+    FacetCount.objects.filter(decremented, conference_id=conference_id,
+                              count=0).delete()
+
+
+def lock(conference_ids: Iterable[int]):
+    """Serializes indexing within conferences, so that two saves at once
+    neither insert the same first facets of a poster nor wait on each
+    other's counts. Conferences are locked in id order."""
+    with connection.cursor() as cursor:
+        for conference_id in sorted(set(conference_ids)):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                           [LOCK_NAMESPACE, conference_id])
+
+
+def index_poster(poster: Poster):
+    """Brings the poster's facets and its conference's counts up to date."""
+    new = {(poster.conference_id, facet, value): label
+           for (facet, value), label in extract(poster).items()}
+    with transaction.atomic():
+        # A poster that moved also has facets in its old conference, which
+        # is locked along with the new one
+        lock([poster.conference_id] + list(
+            PosterFacet.objects.filter(poster=poster)
+            .values_list("conference", flat=True).distinct()))
+        old = {(conference_id, facet, value): label
+               for conference_id, facet, value, label
+               in PosterFacet.objects.filter(poster=poster)
+               .values_list("conference", "facet", "value", "label")}
+        added = {key: label for key, label in new.items() if key not in old}
+        removed = {key: label for key, label in old.items() if key not in new}
+
+        for conference_id, facet, value in removed:
+            PosterFacet.objects.filter(
+                poster=poster, facet=facet, value=value).delete()
+        PosterFacet.objects.bulk_create(
+            PosterFacet(poster=poster, conference_id=conference_id,
+                        facet=facet, value=value, label=label)
+            for (conference_id, facet, value), label in added.items())
+
+        for conference_id in {key[0] for key in list(added) + list(removed)}:
+            adjust_counts(conference_id, {
+                (facet, value): label
+                for (c, facet, value), label in added.items()
+                if c == conference_id}, 1)
+            adjust_counts(conference_id, {
+                (facet, value): label
+                for (c, facet, value), label in removed.items()
+                if c == conference_id}, -1)
+
+
+def unindex_poster(poster: Poster):
+    """Removes a poster that is about to be deleted from the counts."""
+    with transaction.atomic():
+        facets = list(PosterFacet.objects.filter(poster=poster)
+                      .values_list("conference", "facet", "value", "label"))
+        lock(conference_id for conference_id, _, _, _ in facets)
+        by_conference = {}
+        for conference_id, facet, value, label in facets:
+            by_conference.setdefault(conference_id, {})[(facet, value)] = label
+        for conference_id, removed in by_conference.items():
+            adjust_counts(conference_id, removed, -1)
+
+
+def rebuild_conference(conference_id: int) -> int:
+    """Re-indexes every poster in a conference, returning the count."""
+    with transaction.atomic():
+        lock([conference_id])
+        PosterFacet.objects.filter(conference_id=conference_id).delete()
+        FacetCount.objects.filter(conference_id=conference_id).delete()
+        posters = Poster.objects.filter(conference_id=conference_id) \
+            .prefetch_related("authors")
+        facets = []
+        counts = Counter()
+        labels = {}
+        for poster in posters:
+            for (facet, value), label in extract(poster).items():
+                facets.append(PosterFacet(
+                    poster=poster, conference_id=conference_id,
+                    facet=facet, value=value, label=label))
+                counts[(facet, value)] += 1
+                labels[(facet, value)] = label
+        PosterFacet.objects.bulk_create(facets, batch_size=1000)
+        FacetCount.objects.bulk_create([
+            FacetCount(conference_id=conference_id, facet=facet, value=value,
+                       label=labels[(facet, value)], count=count)
+            for (facet, value), count in counts.items()], batch_size=1000)
+    return len(posters)
+
+
+def parse_selection(query) -> Set[Tuple[str, str]]:
+    """Returns the (facet, value) pairs selected in a request's GET data."""
+    return {(facet, value)
+            for facet, _ in PosterFacet.FACETS
+            for value in query.getlist(facet) if value}
+
+
+def filter_posters(posters, conference_id: int,
+                   selection: Iterable[Tuple[str, str]]):
+    """Narrows ``posters`` to those having every selected facet value."""
+    for facet, value in selection:
+        posters = posters.filter(pk__in=PosterFacet.objects.filter(
+            conference_id=conference_id, facet=facet, value=value)
+            .values("poster"))
+    return posters
+
+
+def facet_counts(conference_id: int, posters=None) -> Dict[str, List[dict]]:
+    """Returns the most common values of each facet with their counts.
+
+    Without ``posters`` the precomputed conference counts are read; with a
+    filtered ``posters`` queryset the values are counted within it.
+    """
+    result = {}
+    for facet, _ in PosterFacet.FACETS:
+        if posters is None:
+            rows = FacetCount.objects.filter(
+                conference_id=conference_id, facet=facet)
+        else:
+            rows = PosterFacet.objects.filter(
+                conference_id=conference_id, facet=facet,
+                poster__in=posters.values("pk")) \
+                .values("value", "label").annotate(count=Count("pk"))
+        result[facet] = list(rows.order_by("-count", "label")
+                             .values("value", "label", "count")[:FACET_LIMIT])
+    return result
+
+
+def selection_query(selection: Iterable[Tuple[str, str]]) -> str:
+    return urlencode(sorted(selection))
+
+
+def annotate_links(counts: Dict[str, List[dict]],
+                   selection: Set[Tuple[str, str]]):
+    """Marks selected values and adds the query string that toggles each."""
+    for facet, values in counts.items():
+        for entry in values:
+            key = (facet, entry["value"])
+            entry["selected"] = key in selection
+            entry["query"] = selection_query(selection ^ {key})
+    return counts
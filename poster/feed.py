@@ -0,0 +1,130 @@
+"""Home page feed of new posters and comments in a user's conferences.
+
+Reading the feed from the source tables would join comments to posters,
+conferences and the three roster tables on every home page view. Instead,
+each new poster or comment queues a job that fans it out on write: one
+``FeedEntry`` row per organizer, attendee and guest of its conference,
+written by a single ``INSERT ... SELECT``. A user's feed is then a range of
+the (user, id) index.
+
+Conferences with more than ``settings.FEED_FANOUT_LIMIT`` members would
+need too many rows per event, so they fan out on read instead: one shared
+row without a user, which the feed query picks up for members through the
+partial (conference, id) index. Pages are keyed by entry id, so a page
+costs the same however far back it is.
+
+``trim`` deletes entries past ``settings.FEED_RETENTION_DAYS`` and beyond
+the ``settings.FEED_LENGTH`` newest of each user. The job workers run it
+as the periodic ``TRIM_JOB``.
+"""
+import datetime
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import User
+from jobs import queue
+
+from .models import Change, Comment, Conference, FeedEntry, Poster
+
+JOB_NAME = "poster.fan_out"
+TRIM_JOB = "poster.trim_feeds"
+
+
+def members_sql() -> str:
+    """SQL for the distinct members of a conference, given as a parameter
+    for each roster."""
+    return " UNION ".join(
+        f"SELECT user_id FROM {getattr(Conference, role).through._meta.db_table} "
+        f"WHERE conference_id = %s"
+        for role in Change.ROLES)
+
+
+def fan_out(poster: Poster, comment: Comment = None) -> int:
+    """Adds a new poster or comment to the feeds of its conference's members,
+    except the comment's author. Returns the number of rows written."""
+    table = FeedEntry._meta.db_table
+    conference_id = poster.conference_id
+    created_date = comment.created_date if comment else poster.created_date
+    author_id = comment.author_id if comment else None
+    comment_id = comment.pk if comment else None
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM ({members_sql()}) AS members",
+                       [conference_id] * 3)
+        if cursor.fetchone()[0] > settings.FEED_FANOUT_LIMIT:
+            FeedEntry.objects.create(conference_id=conference_id, poster=poster,
+                                     comment_id=comment_id,
+                                     created_date=created_date)
+            return 1
+
+        cursor.execute(
+            f"INSERT INTO {table} "
+            f"(user_id, conference_id, poster_id, comment_id, created_date) "
+            f"SELECT user_id, %s, %s, %s, %s FROM ({members_sql()}) AS members "
+            f"WHERE user_id IS DISTINCT FROM %s",
+            [conference_id, poster.pk, comment_id, created_date] +
+            [conference_id] * 3 + [author_id])
+        return cursor.rowcount
+
+
+def fan_out_job(poster_id: int, comment_id: Optional[int] = None) -> int:
+    if comment_id is not None:
+        comment = Comment.objects.select_related("poster") \
+            .filter(pk=comment_id).first()
+        if comment is None or not comment.active:
+            return 0
+        return fan_out(comment.poster, comment)
+
+    poster = Poster.objects.filter(pk=poster_id).first()
+    return fan_out(poster) if poster is not None else 0
+
+
+def queue_fan_out(poster_id: int, comment_id: Optional[int] = None):
+    kind = f"comment:{comment_id}" if comment_id else f"poster:{poster_id}"
+    queue.enqueue(JOB_NAME, {"poster_id": poster_id, "comment_id": comment_id},
+                  dedup_key=f"{JOB_NAME}:{kind}")
+
+
+def entries(user: User, before: Optional[int] = None):
+    """The user's feed, newest first, from entry ``before`` on. Comments
+    deactivated since they were fanned out are left out."""
+    shared = Q()
+    for role in Change.ROLES:
+        shared |= Q(conference__in=getattr(Conference, role).through.objects
+                    .filter(user=user).values("conference"))
+    queryset = FeedEntry.objects \
+        .filter(Q(user=user) | Q(shared, user=None)) \
+        .filter(Q(comment=None) | Q(comment__active=True))
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    return queryset.select_related("conference", "poster", "comment__author") \
+        .order_by("-id")
+
+
+def page(user: User, before: Optional[int] = None, size: int = None) \
+        -> Tuple[List[FeedEntry], Optional[int]]:
+    """Returns a page of the feed, and the ``before`` of the next page or
+    None on the last page."""
+    size = size or settings.FEED_PAGE_SIZE
+    rows = list(entries(user, before)[:size + 1])
+    return rows[:size], rows[size - 1].pk if len(rows) > size else None
+
+
+def trim() -> int:
+    """Deletes old feed entries, returning how many."""
+    table = FeedEntry._meta.db_table
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.FEED_RETENTION_DAYS)
+    deleted, _ = FeedEntry.objects.filter(created_date__lt=cutoff).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM (SELECT id, row_number() OVER ("
+            f"PARTITION BY user_id ORDER BY id DESC) AS n FROM {table} "
+            f"WHERE user_id IS NOT NULL) AS ranked WHERE n > %s)",
+            [settings.FEED_LENGTH])
+        return deleted + cursor.rowcount
@@ -1,4 +1,5 @@
 from django import forms
+from core.uploads import ProbedImageField
 from .models import Poster, Comment
 
 
@@ -6,9 +7,20 @@ class PosterForm(forms.ModelForm):
     class Meta:
         model = Poster
         fields = ('title', 'subtitle', 'description', 'image',)
+        field_classes = {'image': ProbedImageField}
 
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        fields = ('body',)
+        fields = ('body', 'parent',)
+        widgets = {'parent': forms.HiddenInput}
+        help_texts = {'body': 'Markdown is supported, including links and '
+                              '`code`.'}
+
+    def __init__(self, *args, poster=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if poster is not None:
+            # Only allow replies to comments on the same poster
+            self.fields['parent'].queryset = Comment.objects.filter(
+                poster=poster, active=True)
@@ -0,0 +1,39 @@
+from jobs.queue import job
+
+from . import archive, duplicates, feed, notifications, related
+
+
+@job(related.JOB_NAME)
+def rebuild_related(conference_id):
+    """Recomputes the related posters of one conference"""
+    related.rebuild_conference(conference_id)
+
+
+@job("poster.send_digests")
+def send_digests():
+    """Delivers the comment digests whose window has elapsed"""
+    notifications.send_digests()
+
+
+@job(archive.RESTORE_JOB)
+def restore_conference(conference_id):
+    """Moves an archived conference back into the hot tables"""
+    archive.restore_conference(conference_id)
+
+
+@job(duplicates.JOB_NAME)
+def hash_image(poster_id):
+    """Hashes a new poster image and looks for near-duplicates of it"""
+    duplicates.hash_poster(poster_id)
+
+
+@job(feed.TRIM_JOB)
+def trim_feeds():
+    """Deletes old home feed entries"""
+    feed.trim()
+
+
+@job(feed.JOB_NAME)
+def fan_out(poster_id, comment_id=None):
+    """Adds a new poster or comment to its conference members' feeds"""
+    feed.fan_out_job(poster_id, comment_id)
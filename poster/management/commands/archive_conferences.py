@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from poster import archive
+
+
+class Command(BaseCommand):
+    help = ("Moves conferences without edits for ARCHIVE_AFTER_DAYS days (or "
+            "the given conferences) into compressed archives.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("conference_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--days", type=int, default=None,
+            help="Archive conferences without edits for this many days.")
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="List the conferences that would be archived.")
+
+    def handle(self, *args, conference_ids, days=None, dry_run=False,
+               **options):
+        if conference_ids:
+            ids = conference_ids
+        else:
+            ids = list(archive.stale_conferences(days)
+                       .order_by("pk").values_list("pk", flat=True))
+
+        for pk in ids:
+            if dry_run:
+                self.stdout.write(f"Would archive conference {pk}")
+                continue
+            archived = archive.archive_conference(pk)
+            if archived is None:
+                self.stdout.write(f"Conference {pk} is already archived")
+            else:
+                self.stdout.write(
+                    f"Archived conference {pk}: {archived.poster_count} "
+                    f"posters, {archived.comment_count} comments, "
+                    f"{len(archived.data)} bytes")
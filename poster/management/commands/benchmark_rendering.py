@@ -0,0 +1,114 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from core.models import User
+from poster.models import Comment, Conference, Poster
+
+TEMPLATE = "poster/poster_detail.html"
+
+
+def template_engine(loaders) -> DjangoTemplates:
+    config = settings.TEMPLATES[0]
+    return DjangoTemplates({
+        "NAME": "benchmark",
+        "DIRS": config["DIRS"],
+        "APP_DIRS": False,
+        "OPTIONS": dict(config["OPTIONS"], loaders=loaders),
+    })
+
+
+def timed(render, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = ("Compares rendering a poster page with many comments with and "
+            "without compiled template and fragment caching; the baseline "
+            "runs with a dummy fragment cache. Sample data is created in a "
+            "transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=500)
+        parser.add_argument("--threads", type=int, default=20,
+                            help="Top-level comments the others reply to.")
+        parser.add_argument("--runs", type=int, default=10)
+
+    def handle(self, *args, comments=500, threads=20, runs=10, **options):
+        with transaction.atomic():
+            context, request = self.sample_page(comments, threads)
+            uncached = template_engine(settings.TEMPLATE_LOADERS)
+
+            def before():
+                uncached.get_template(TEMPLATE).render(context, request)
+
+            # The templates' {% cache %} tags find no fragments in a dummy
+            # cache, so every comment row is rendered as before they had them
+            with override_settings(CACHES=dict(
+                    settings.CACHES, template_fragments={
+                        "BACKEND":
+                            "django.core.cache.backends.dummy.DummyCache"})):
+                before_time = timed(before, runs)
+
+            cached = template_engine([
+                ("django.template.loaders.cached.Loader",
+                 settings.TEMPLATE_LOADERS)])
+            cached.get_template(TEMPLATE).render(context, request)
+
+            def after():
+                cached.get_template(TEMPLATE).render(context, request)
+
+            after_time = timed(after, runs)
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Rendering {len(context['comments'])} comments, median of "
+            f"{runs} runs:\n"
+            f"  before (compiled per request, fragment cache disabled): "
+            f"{before_time * 1000:.1f}ms\n"
+            f"  after (cached template, warm fragments):                "
+            f"{after_time * 1000:.1f}ms\n"
+            f"  speedup: {before_time / after_time:.1f}x")
+
+    def sample_page(self, comments: int, threads: int):
+        user = User.objects.create_user(
+            email="benchmark@example.com", first_name="Bench",
+            last_name="Mark", username="benchmark_user",
+            avatar="default-avatar.png")
+        conference = Conference.objects.create(
+            title="Benchmark", institution="Benchmark", description="")
+        poster = Poster.objects.create(
+            title="Benchmark", subtitle="", description="",
+            image="poster.png", created_date=timezone.now(),
+            conference=conference)
+
+        roots = [Comment.objects.create(poster=poster, author=user,
+                                        body=f"Question {i}")
+                 for i in range(min(threads, comments))]
+        for i in range(comments - len(roots)):
+            Comment.objects.create(
+                poster=poster, author=user, parent=roots[i % len(roots)],
+                body=f"Reply {i}\n\nWith a second paragraph.")
+
+        request = RequestFactory().get("/")
+        request.user = user
+        context = {
+            "poster": poster,
+            "conference": conference,
+            "comments": list(Comment.objects.threads(
+                poster.comment_set.top_level())),
+            "comment_page": None,
+            "can_comment": True,
+        }
+        return context, request
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from poster import snapshot
+from poster.models import Conference
+
+
+class Command(BaseCommand):
+    help = ("Renders a conference into a static site for offline kiosks, "
+            "re-rendering only posters that changed since the last build.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("conference_id", type=int)
+        parser.add_argument("output", help="Directory to build the site in.")
+        parser.add_argument(
+            "--processes", type=int, default=None,
+            help="Worker processes rendering posters. Defaults to the CPU count.")
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Re-render every poster, e.g. after changing the templates.")
+
+    def handle(self, *args, conference_id, output, processes=None, full=False,
+               **options):
+        try:
+            conference = Conference.objects.get(pk=conference_id)
+        except Conference.DoesNotExist:
+            raise CommandError(f"Conference {conference_id} does not exist")
+
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        rendered, removed = snapshot.build(
+            conference, output, processes=processes, full=full, log=log)
+        self.stdout.write(
+            f"Rendered {rendered} poster(s), removed {removed}, in {output}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from poster import sync
+
+
+class Command(BaseCommand):
+    help = ("Deletes change log rows superseded by a later change to the same "
+            "object, which syncing clients no longer need.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {sync.compact()} changes")
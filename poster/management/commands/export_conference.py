@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from poster.export import export_conference
+from poster.models import Conference
+
+
+class Command(BaseCommand):
+    help = "Writes a ZIP archive of a conference's posters, images and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("conference_id", type=int)
+        parser.add_argument(
+            "-o", "--output",
+            help="File to write the archive to. Defaults to standard output.")
+
+    def handle(self, *args, conference_id, output=None, **options):
+        try:
+            conference = Conference.objects.get(pk=conference_id)
+        except Conference.DoesNotExist:
+            raise CommandError(f"Conference {conference_id} does not exist")
+
+        destination = open(output, "wb") if output else sys.stdout.buffer
+        try:
+            for chunk in export_conference(conference):
+                destination.write(chunk)
+        finally:
+            if output:
+                destination.close()
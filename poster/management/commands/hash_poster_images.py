@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from poster.duplicates import index_conference, store_hash
+from poster.models import Conference, Poster
+
+
+class Command(BaseCommand):
+    help = "Hashes poster images and looks for near-duplicates, for some or " \
+           "all conferences."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "conference_ids", nargs="*", type=int,
+            help="Conferences to hash. Defaults to every conference.")
+        parser.add_argument(
+            "--missing", action="store_true",
+            help="Only hash posters without a hash yet.")
+
+    def handle(self, *args, conference_ids=None, missing=False, **options):
+        conference_ids = conference_ids or \
+            Conference.objects.filter(is_archived=False) \
+            .order_by("pk").values_list("pk", flat=True)
+        for conference_id in conference_ids:
+            posters = Poster.objects.filter(conference_id=conference_id) \
+                .exclude(image="").only("pk", "image").order_by("pk")
+            if missing:
+                posters = posters.filter(image_hash=None)
+            hashed = sum(store_hash(poster) is not None for poster in posters)
+            found = index_conference(conference_id)
+            self.stdout.write(
+                f"Conference {conference_id}: {hashed} image(s) hashed, "
+                f"{found} possible duplicate(s)")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from poster.facets import rebuild_conference
+from poster.models import Conference
+
+
+class Command(BaseCommand):
+    help = "Re-indexes poster facets and counts for some or all conferences."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "conference_ids", nargs="*", type=int,
+            help="Conferences to rebuild. Defaults to every conference.")
+
+    def handle(self, *args, conference_ids=None, **options):
+        conference_ids = conference_ids or \
+            Conference.objects.order_by("pk").values_list("pk", flat=True)
+        for conference_id in conference_ids:
+            indexed = rebuild_conference(conference_id)
+            self.stdout.write(
+                f"Conference {conference_id}: {indexed} poster(s) indexed")
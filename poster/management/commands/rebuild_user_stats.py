@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from poster.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes the profile activity stats of every user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size=1000, **options):
+        rebuilt = rebuild(batch_size=batch_size)
+        self.stdout.write(f"Rebuilt stats for {rebuilt} user(s)")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from poster.models import Comment
+
+
+class Command(BaseCommand):
+    help = ("Re-renders the HTML of comments rendered by an older version "
+            "of the Markdown renderer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, batch_size=500, **options):
+        rendered = 0
+        last_pk = 0
+        while True:
+            # Keyset pagination, since re-rendered rows drop out of the filter
+            batch = list(Comment.objects.stale_html().filter(pk__gt=last_pk)
+                         .order_by("pk").only("pk", "body")[:batch_size])
+            if not batch:
+                break
+            for comment in batch:
+                comment.render_body()
+            Comment.objects.bulk_update(
+                batch, ["body_html", "body_html_version"])
+            rendered += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f"Re-rendered {rendered} comment(s)")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from poster import archive
+
+
+class Command(BaseCommand):
+    help = "Moves an archived conference back into the hot tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("conference_id", type=int)
+
+    def handle(self, *args, conference_id, **options):
+        restored = archive.restore_conference(conference_id)
+        self.stdout.write(
+            f"Restored {restored} posters of conference {conference_id}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from poster.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = "Sends comment digest e-mails to poster authors."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep running, checking for due digests every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=60)
+
+    def handle(self, *args, loop=False, interval=60, **options):
+        while True:
+            sent = send_digests()
+            if sent:
+                self.stdout.write(f"Sent {sent} digest(s)")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from poster import feed
+
+
+class Command(BaseCommand):
+    help = ("Deletes home feed entries older than FEED_RETENTION_DAYS or "
+            "beyond the FEED_LENGTH newest of each user.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {feed.trim()} feed entries")
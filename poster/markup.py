@@ -0,0 +1,58 @@
+"""Markdown rendering for comment bodies.
+
+Comments are rendered once, when they are saved, and the sanitized HTML is
+stored next to the Markdown source so pages only output stored HTML. Bump
+``RENDERER_VERSION`` whenever the output of ``render`` changes; comments
+rendered by an older version are re-rendered by
+``python manage.py rerender_comments``, which runs on every release.
+"""
+
+RENDERER_VERSION = 2
+
+EXTENSIONS = ["fenced_code", "sane_lists"]
+
+ALLOWED_TAGS = [
+    "a", "blockquote", "br", "code", "em", "h3", "h4", "h5", "h6", "hr",
+    "li", "ol", "p", "pre", "strong", "ul",
+]
+ALLOWED_ATTRIBUTES = {"a": ["href", "title"]}
+ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
+
+# Comments sit below the poster's own h1 and h2, so Markdown headings start
+# two levels down: "#" renders as h3, "##" as h4, and deeper ones stop at h6
+HEADINGS = {f"h{level}": f"h{min(level + 2, 6)}" for level in range(1, 7)}
+
+
+def heading_extension():
+    """A Markdown extension renaming headings according to HEADINGS."""
+    from markdown.extensions import Extension
+    from markdown.treeprocessors import Treeprocessor
+
+    class ShiftHeadings(Treeprocessor):
+        def run(self, root):
+            for element in root.iter():
+                if element.tag in HEADINGS:
+                    element.tag = HEADINGS[element.tag]
+
+    class HeadingExtension(Extension):
+        def extendMarkdown(self, md):
+            md.treeprocessors.register(ShiftHeadings(md), "shift_headings", 5)
+
+    return HeadingExtension()
+
+
+def render(body: str) -> str:
+    """Renders Markdown to HTML that is safe to output as-is.
+
+    Raw HTML in the source is escaped rather than interpreted, links may
+    only use ALLOWED_PROTOCOLS, and bare URLs become nofollow links.
+    """
+    # Imported here so processes that never save comments don't load them
+    import bleach
+    import markdown
+
+    html = markdown.markdown(body,
+                             extensions=EXTENSIONS + [heading_extension()])
+    html = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                        protocols=ALLOWED_PROTOCOLS)
+    return bleach.linkify(html, skip_tags=["code", "pre"])
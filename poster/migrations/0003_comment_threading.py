@@ -0,0 +1,62 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_threads(apps, schema_editor):
+    """Existing comments are all top-level, each starting its own thread."""
+    Comment = apps.get_model("poster", "Comment")
+    batch = []
+    for comment in Comment.objects.only("pk").iterator():
+        comment.thread_id = comment.pk
+        comment.path = str(comment.pk).zfill(10) + "/"
+        comment.depth = 0
+        batch.append(comment)
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ["thread", "path", "depth"])
+            batch = []
+    Comment.objects.bulk_update(batch, ["thread", "path", "depth"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0002_auto_20200401_1149'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['path']},
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='poster.Comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poster.Comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['poster', 'path'], name='poster_comm_poster__b2c60d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'path'], name='poster_comm_thread__b220e0_idx'),
+        ),
+        migrations.RunPython(backfill_threads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poster', '0003_comment_threading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created date')),
+                ('sent_date', models.DateTimeField(blank=True, null=True, verbose_name='sent date')),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Comment')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(sent_date__isnull=True), fields=['recipient', 'created_date'], name='notification_pending_idx'),
+        ),
+    ]
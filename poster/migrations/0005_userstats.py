@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:43
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poster', '0004_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posters_authored', models.PositiveIntegerField(default=0)),
+                ('comments_written', models.PositiveIntegerField(default=0)),
+                ('conferences_organized', models.PositiveIntegerField(default=0)),
+                ('conferences_attended', models.PositiveIntegerField(default=0)),
+                ('conferences_guested', models.PositiveIntegerField(default=0)),
+                ('recent_activity', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=list)),
+            ],
+        ),
+    ]
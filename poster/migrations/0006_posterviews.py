@@ -0,0 +1,32 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0005_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosterViews',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('conference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Conference')),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Poster')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='posterviews',
+            index=models.Index(fields=['conference', 'hour'], name='poster_post_confere_2de523_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posterviews',
+            constraint=models.UniqueConstraint(fields=('poster', 'hour'), name='posterviews_unique_poster_hour'),
+        ),
+    ]
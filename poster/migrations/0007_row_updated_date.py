@@ -0,0 +1,23 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0006_posterviews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, verbose_name='updated date'),
+        ),
+        migrations.AddField(
+            model_name='poster',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, verbose_name='updated date'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0007_row_updated_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='body_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='body_html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.5 on 2026-10-19 11:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0008_comment_body_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPoster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poster.Poster')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poster.Poster')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='relatedposter',
+            constraint=models.UniqueConstraint(fields=('poster', 'rank'), name='relatedposter_unique_poster_rank'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0009_relatedposter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosterFacet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('keyword', 'Keyword'), ('institution', 'Institution'), ('author', 'Author')], max_length=16)),
+                ('value', models.CharField(max_length=100)),
+                ('label', models.CharField(max_length=200)),
+                ('conference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Conference')),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Poster')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('keyword', 'Keyword'), ('institution', 'Institution'), ('author', 'Author')], max_length=16)),
+                ('value', models.CharField(max_length=100)),
+                ('label', models.CharField(max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('conference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Conference')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='posterfacet',
+            index=models.Index(fields=['conference', 'facet', 'value', 'poster'], name='poster_post_confere_8f38cb_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posterfacet',
+            constraint=models.UniqueConstraint(fields=('poster', 'facet', 'value'), name='posterfacet_unique_value'),
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['conference', 'facet', '-count'], name='poster_face_confere_26c516_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('conference', 'facet', 'value'), name='facetcount_unique_value'),
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:07
+
+from django.db import migrations, models
+
+INSERT = (
+    "INSERT INTO poster_change (xid, conference_id, kind, object_id, deleted)"
+)
+
+TRIGGERS = f"""
+CREATE FUNCTION poster_change_conference() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        {INSERT} VALUES (txid_current(), OLD.id, 'conference', OLD.id, true);
+        RETURN NULL;
+    END IF;
+    {INSERT} VALUES (txid_current(), NEW.id, 'conference', NEW.id, false);
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION poster_change_poster() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        {INSERT} VALUES (txid_current(), OLD.conference_id, 'poster', OLD.id, true);
+        RETURN NULL;
+    END IF;
+    {INSERT} VALUES (txid_current(), NEW.conference_id, 'poster', NEW.id, false);
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.conference_id <> NEW.conference_id THEN
+            {INSERT} VALUES (txid_current(), OLD.conference_id, 'poster', OLD.id, true);
+            -- Clients of the new conference have never seen its comments
+            {INSERT} SELECT txid_current(), NEW.conference_id, 'comment', id, false
+                FROM poster_comment WHERE poster_id = NEW.id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION poster_change_comment() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    row poster_comment;
+    conference integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN row := OLD; ELSE row := NEW; END IF;
+    SELECT conference_id INTO conference
+        FROM poster_poster WHERE id = row.poster_id;
+    -- Without its poster, the comment goes with the poster's own delete
+    IF conference IS NOT NULL THEN
+        {INSERT} VALUES (txid_current(), conference, 'comment', row.id,
+                         TG_OP = 'DELETE');
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Authors are part of a poster, so author changes re-send the poster
+CREATE FUNCTION poster_change_author() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    poster integer;
+    conference integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN poster := OLD.poster_id; ELSE poster := NEW.poster_id; END IF;
+    SELECT conference_id INTO conference FROM poster_poster WHERE id = poster;
+    IF conference IS NOT NULL THEN
+        {INSERT} VALUES (txid_current(), conference, 'poster', poster, false);
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Roster changes are logged under the role (TG_ARGV[0]) and user id
+CREATE FUNCTION poster_change_role() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        {INSERT} VALUES (txid_current(), OLD.conference_id, TG_ARGV[0], OLD.user_id, true);
+    ELSE
+        {INSERT} VALUES (txid_current(), NEW.conference_id, TG_ARGV[0], NEW.user_id, false);
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER poster_change AFTER INSERT OR UPDATE OR DELETE ON poster_conference
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_conference();
+CREATE TRIGGER poster_change AFTER INSERT OR UPDATE OR DELETE ON poster_poster
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_poster();
+CREATE TRIGGER poster_change AFTER INSERT OR UPDATE OR DELETE ON poster_comment
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_comment();
+CREATE TRIGGER poster_change AFTER INSERT OR DELETE ON poster_poster_authors
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_author();
+CREATE TRIGGER poster_change AFTER INSERT OR DELETE ON poster_conference_organizers
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_role('organizers');
+CREATE TRIGGER poster_change AFTER INSERT OR DELETE ON poster_conference_attendees
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_role('attendees');
+CREATE TRIGGER poster_change AFTER INSERT OR DELETE ON poster_conference_guests
+    FOR EACH ROW EXECUTE PROCEDURE poster_change_role('guests');
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER poster_change ON poster_conference;
+DROP TRIGGER poster_change ON poster_poster;
+DROP TRIGGER poster_change ON poster_comment;
+DROP TRIGGER poster_change ON poster_poster_authors;
+DROP TRIGGER poster_change ON poster_conference_organizers;
+DROP TRIGGER poster_change ON poster_conference_attendees;
+DROP TRIGGER poster_change ON poster_conference_guests;
+DROP FUNCTION poster_change_conference();
+DROP FUNCTION poster_change_poster();
+DROP FUNCTION poster_change_comment();
+DROP FUNCTION poster_change_author();
+DROP FUNCTION poster_change_role();
+"""
+
+# Logs the existing rows, so a client syncing from scratch gets everything
+BACKFILL = f"""
+{INSERT} SELECT txid_current(), id, 'conference', id, false FROM poster_conference;
+{INSERT} SELECT txid_current(), conference_id, 'organizers', user_id, false
+    FROM poster_conference_organizers;
+{INSERT} SELECT txid_current(), conference_id, 'attendees', user_id, false
+    FROM poster_conference_attendees;
+{INSERT} SELECT txid_current(), conference_id, 'guests', user_id, false
+    FROM poster_conference_guests;
+{INSERT} SELECT txid_current(), conference_id, 'poster', id, false FROM poster_poster;
+{INSERT} SELECT txid_current(), p.conference_id, 'comment', c.id, false
+    FROM poster_comment c JOIN poster_poster p ON p.id = c.poster_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0010_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('xid', models.BigIntegerField()),
+                ('conference_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('conference', 'Conference'), ('poster', 'Poster'), ('comment', 'Comment'), ('organizers', 'Organizers'), ('attendees', 'Attendees'), ('guests', 'Guests')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['conference_id', 'xid', 'id'], name='poster_chan_confere_9d71d5_idx'),
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.RunSQL(TRIGGERS, DROP_TRIGGERS),
+    ]
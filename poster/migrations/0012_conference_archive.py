@@ -0,0 +1,35 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0011_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConferenceArchive',
+            fields=[
+                ('conference', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='poster.Conference')),
+                ('archived_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='archived date')),
+                ('data', models.BinaryField()),
+                ('poster_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conference',
+            name='is_archived',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        # Archives are already compressed, so Postgres should not try again
+        migrations.RunSQL(
+            'ALTER TABLE "poster_conferencearchive" ALTER COLUMN "data" SET STORAGE EXTERNAL',
+            'ALTER TABLE "poster_conferencearchive" ALTER COLUMN "data" SET STORAGE EXTENDED',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster', '0012_conference_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poster',
+            name='image_hash',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ImageHashChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('value', models.PositiveSmallIntegerField()),
+                ('conference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Conference')),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Poster')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DuplicatePoster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveSmallIntegerField()),
+                ('conference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poster.Conference')),
+                ('original', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poster.Poster')),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poster.Poster')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagehashchunk',
+            index=models.Index(fields=['conference', 'position', 'value'], name='poster_imag_confere_14db15_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagehashchunk',
+            constraint=models.UniqueConstraint(fields=('poster', 'position'), name='imagehashchunk_unique_position'),
+        ),
+        migrations.AddConstraint(
+            model_name='duplicateposter',
+            constraint=models.UniqueConstraint(fields=('poster', 'original'), name='duplicateposter_unique_pair'),
+        ),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.contrib.postgres.fields import JSONField
+from django.db import connection, models
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from core.models import User
 from typing import List
 
+from . import markup
+
 
 class Conference(models.Model):
     title = models.CharField(max_length=50)
@@ -19,6 +22,8 @@ class Conference(models.Model):
     created_date = models.DateTimeField('created date', auto_now=True)
     is_public = models.BooleanField(
         "is conference publically accessible", default=True)
+    # Posters and comments were moved into a ConferenceArchive
+    is_archived = models.BooleanField(default=False, editable=False)
 
     def update_organizers(self):
         if self.organizers != self._original_organizers:
@@ -58,21 +63,421 @@ class Poster(models.Model):
     authors = models.ManyToManyField(User)
     description = models.TextField()
     created_date = models.DateTimeField('created date')
+    # Row version for cached template fragments
+    updated_date = models.DateTimeField('updated date', auto_now=True)
     conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    # Perceptual hash of the image as a signed 64-bit integer, see
+    # poster.duplicates
+    image_hash = models.BigIntegerField(null=True, editable=False)
+
+    # Image file name when the poster was loaded, to detect new uploads
+    _loaded_image = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = dict(zip(field_names, values)).get("image")
+        return instance
 
     def __str__(self):
         return self.title
 
 
+COMMENT_PATH_STEP = 10
+COMMENT_MAX_DEPTH = 20
+
+
+def comment_path_segment(pk: int) -> str:
+    """Zero-pads a comment id so that paths sort in thread order."""
+    return str(pk).zfill(COMMENT_PATH_STEP) + "/"
+
+
+class CommentQuerySet(models.QuerySet):
+    def stale_html(self):
+        """Comments whose HTML was rendered by an older renderer"""
+        return self.filter(body_html_version__lt=markup.RENDERER_VERSION)
+
+    def top_level(self):
+        return self.filter(parent__isnull=True)
+
+    def threads(self, roots):
+        """Returns every comment in the threads started by ``roots``.
+
+        ``roots`` may be any (sliced) queryset of comments, so a page of
+        top-level comments and all of their replies come back from a single
+        ordered query.
+        """
+        return self.filter(thread__in=roots.values("pk")) \
+            .select_related("author").order_by("path")
+
+
 class Comment(models.Model):
+    """A comment on a poster, optionally replying to another comment.
+
+    Threads are stored as a materialized path: ``path`` is the zero-padded
+    ids of every ancestor followed by the comment's own id, so ordering by
+    ``path`` yields each thread depth-first in creation order.
+    """
+
     poster = models.ForeignKey(Poster, on_delete=models.CASCADE)
     author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     body = models.TextField()
+    # Sanitized HTML rendered from the Markdown body when it is saved
+    body_html = models.TextField(editable=False, default="")
+    body_html_version = models.PositiveSmallIntegerField(
+        editable=False, default=0)
     created_date = models.DateTimeField('created date', auto_now_add=True)
+    # Row version for cached template fragments
+    updated_date = models.DateTimeField('updated date', auto_now=True)
     active = models.BooleanField(default=True)
 
+    parent = models.ForeignKey("self", null=True, blank=True,
+                               on_delete=models.CASCADE, related_name="replies")
+    thread = models.ForeignKey("self", null=True, editable=False,
+                               on_delete=models.CASCADE, related_name="+")
+    path = models.CharField(max_length=255, editable=False, default="")
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
+
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
-        ordering = ['created_date']
+        ordering = ['path']
+        indexes = [
+            models.Index(fields=["poster", "path"]),
+            models.Index(fields=["thread", "path"]),
+        ]
+
+    def render_body(self):
+        self.body_html = markup.render(self.body)
+        self.body_html_version = markup.RENDERER_VERSION
+
+    def save(self, *args, **kwargs):
+        """Overloads save method to render the body and place new comments
+        in their thread"""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self.render_body()
+        elif "body" in update_fields:
+            self.render_body()
+            kwargs["update_fields"] = \
+                set(update_fields) | {"body_html", "body_html_version"}
+
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
+
+        parent = self.parent
+        if parent is not None and parent.depth + 1 >= COMMENT_MAX_DEPTH:
+            # Replies past the max depth become siblings of their parent
+            parent = self.parent = parent.parent
+
+        # Take the id first, so the comment is inserted with its path and
+        # receivers and change log triggers see a single complete row
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))",
+                           [Comment._meta.db_table])
+            self.pk = cursor.fetchone()[0]
+        if parent is None:
+            self.thread_id = self.pk
+            self.path = comment_path_segment(self.pk)
+            self.depth = 0
+        else:
+            self.thread_id = parent.thread_id
+            self.path = parent.path + comment_path_segment(self.pk)
+            self.depth = parent.depth + 1
+        kwargs["force_insert"] = True
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return 'Comment {} by {}'.format(self.body, self.author)
+
+
+class NotificationQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(sent_date__isnull=True)
+
+
+class Notification(models.Model):
+    """A comment waiting to be delivered to a poster author in a digest"""
+
+    recipient = models.ForeignKey(get_user_model(), on_delete=models.CASCADE,
+                                  related_name="notifications")
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
+    created_date = models.DateTimeField('created date', default=timezone.now)
+    sent_date = models.DateTimeField('sent date', null=True, blank=True)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipient", "created_date"],
+                         name="notification_pending_idx",
+                         condition=models.Q(sent_date__isnull=True)),
+        ]
+
+    def __str__(self):
+        return 'Notification to {} about {}'.format(self.recipient, self.comment_id)
+
+
+class UserStats(models.Model):
+    """Activity counters for a user's profile, kept up to date on write.
+
+    Maintained by the receivers in poster/signals.py and rebuilt from scratch
+    with ``python manage.py rebuild_user_stats``.
+    """
+
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE,
+                                primary_key=True, related_name="stats")
+    posters_authored = models.PositiveIntegerField(default=0)
+    comments_written = models.PositiveIntegerField(default=0)
+    conferences_organized = models.PositiveIntegerField(default=0)
+    conferences_attended = models.PositiveIntegerField(default=0)
+    conferences_guested = models.PositiveIntegerField(default=0)
+    # Newest first, capped at poster.stats.RECENT_ACTIVITY_LIMIT entries
+    recent_activity = JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return 'Stats for {}'.format(self.user_id)
+
+
+class PosterViews(models.Model):
+    """Unique views of a poster during one hour.
+
+    Rows are upserted in batches by poster.analytics rather than updated on
+    every page view.
+    """
+
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE)
+    # Denormalized so conference rollups do not need to join Poster
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["poster", "hour"],
+                                    name="posterviews_unique_poster_hour"),
+        ]
+        indexes = [
+            models.Index(fields=["conference", "hour"]),
+        ]
+
+    def __str__(self):
+        return '{} views of {} at {}'.format(self.views, self.poster_id, self.hour)
+
+
+class RelatedPoster(models.Model):
+    """One of a poster's most similar posters in the same conference.
+
+    Rows are precomputed by poster.related so poster pages read their
+    recommendations with a single indexed query.
+    """
+
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE, related_name="+")
+    related = models.ForeignKey(Poster, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["poster", "rank"],
+                                    name="relatedposter_unique_poster_rank"),
+        ]
+
+    def __str__(self):
+        return '{} is related to {} ({:.2f})'.format(
+            self.related_id, self.poster_id, self.score)
+
+
+class PosterFacet(models.Model):
+    """A keyword, institution or author a poster can be filtered by.
+
+    Maintained by poster.facets whenever a poster or its authors change.
+    """
+
+    KEYWORD = "keyword"
+    INSTITUTION = "institution"
+    AUTHOR = "author"
+    FACETS = [
+        (KEYWORD, "Keyword"),
+        (INSTITUTION, "Institution"),
+        (AUTHOR, "Author"),
+    ]
+
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE)
+    # Denormalized so filters never need to join Poster
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    facet = models.CharField(max_length=16, choices=FACETS)
+    value = models.CharField(max_length=100)
+    label = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["poster", "facet", "value"],
+                                    name="posterfacet_unique_value"),
+        ]
+        indexes = [
+            # Covers the poster ids matching a value, for intersections
+            models.Index(fields=["conference", "facet", "value", "poster"]),
+        ]
+
+    def __str__(self):
+        return '{} {}={}'.format(self.poster_id, self.facet, self.value)
+
+
+class FacetCount(models.Model):
+    """Number of posters in a conference with a facet value."""
+
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    facet = models.CharField(max_length=16, choices=PosterFacet.FACETS)
+    value = models.CharField(max_length=100)
+    label = models.CharField(max_length=200)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["conference", "facet", "value"],
+                                    name="facetcount_unique_value"),
+        ]
+        indexes = [
+            models.Index(fields=["conference", "facet", "-count"]),
+        ]
+
+    def __str__(self):
+        return '{} posters with {}={}'.format(self.count, self.facet, self.value)
+
+
+class Change(models.Model):
+    """An insert, update or delete of a conference's data, for syncing clients.
+
+    Rows are written by database triggers (see migration 0011) in the same
+    transaction as the change itself, so they cover bulk updates, cascading
+    deletes and m2m changes alike. ``xid`` is the id of that transaction;
+    poster.sync reads changes in ``(xid, id)`` order.
+    """
+
+    CONFERENCE = "conference"
+    POSTER = "poster"
+    COMMENT = "comment"
+    ROLES = ("organizers", "attendees", "guests")
+    KINDS = [
+        (CONFERENCE, "Conference"),
+        (POSTER, "Poster"),
+        (COMMENT, "Comment"),
+    ] + [(role, role.capitalize()) for role in ROLES]
+
+    id = models.BigAutoField(primary_key=True)
+    xid = models.BigIntegerField()
+    # Not a foreign key, so the changes of a deleted conference remain
+    conference_id = models.IntegerField()
+    kind = models.CharField(max_length=16, choices=KINDS)
+    # A user id for roster changes
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["conference_id", "xid", "id"]),
+        ]
+
+    def __str__(self):
+        return '{} {} {} in {}'.format(
+            "deleted" if self.deleted else "saved", self.kind, self.object_id,
+            self.conference_id)
+
+
+class ImageHashChunk(models.Model):
+    """One byte of a poster's image hash, indexed for near-duplicate lookups.
+
+    Two hashes differing in fewer than 8 bits have at least one byte in
+    common, so the candidates for a near-duplicate of a poster are the
+    posters sharing a chunk with it.
+    """
+
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE)
+    # Denormalized so lookups never need to join Poster
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    position = models.PositiveSmallIntegerField()
+    value = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["poster", "position"],
+                                    name="imagehashchunk_unique_position"),
+        ]
+        indexes = [
+            models.Index(fields=["conference", "position", "value"]),
+        ]
+
+    def __str__(self):
+        return '{} byte {}={}'.format(self.poster_id, self.position, self.value)
+
+
+class DuplicatePoster(models.Model):
+    """A poster whose image looks like that of an older poster."""
+
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE, related_name="+")
+    original = models.ForeignKey(Poster, on_delete=models.CASCADE,
+                                 related_name="+")
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    # Number of differing bits between the image hashes
+    distance = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["poster", "original"],
+                                    name="duplicateposter_unique_pair"),
+        ]
+
+    def __str__(self):
+        return '{} looks like {} ({} bits)'.format(
+            self.poster_id, self.original_id, self.distance)
+
+
+class FeedEntry(models.Model):
+    """A new poster or comment on a user's home feed.
+
+    poster.feed writes one row per member of the conference when the poster
+    or comment is created, or, for conferences over
+    ``settings.FEED_FANOUT_LIMIT`` members, a single row without a user that
+    members read along with their own.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    # None for the shared rows of large conferences
+    user = models.ForeignKey(get_user_model(), null=True,
+                             on_delete=models.CASCADE, related_name="+")
+    conference = models.ForeignKey(Conference, on_delete=models.CASCADE)
+    poster = models.ForeignKey(Poster, on_delete=models.CASCADE)
+    # None for new posters
+    comment = models.ForeignKey(Comment, null=True, on_delete=models.CASCADE)
+    created_date = models.DateTimeField('created date', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-id"], name="feedentry_user_idx"),
+            models.Index(fields=["conference", "-id"],
+                         name="feedentry_shared_idx",
+                         condition=models.Q(user__isnull=True)),
+        ]
+
+    def __str__(self):
+        return 'Feed entry {} for {}'.format(self.pk, self.user_id)
+
+
+class ConferenceArchive(models.Model):
+    """The posters and comments of an archived conference.
+
+    poster.archive moves them out of the hot tables into ``data``, a
+    zlib-compressed JSON document, and back again when restoring.
+    """
+
+    conference = models.OneToOneField(
+        Conference, on_delete=models.CASCADE, primary_key=True,
+        related_name="archive")
+    archived_date = models.DateTimeField('archived date', default=timezone.now)
+    data = models.BinaryField()
+    poster_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
-        return 'Comment {} by {}'.format(self.body, self.name)
+        return 'Archive of {}'.format(self.conference_id)
@@ -0,0 +1,91 @@
+"""Digest e-mails telling poster authors about new comments.
+
+Comments only enqueue ``Notification`` rows; nothing is sent from the web
+request. The ``send_digests`` management command collects every recipient
+whose oldest pending notification is older than
+``settings.NOTIFICATION_DIGEST_WINDOW`` seconds, renders one digest per
+recipient and delivers the whole batch over a single SMTP connection.
+"""
+import datetime
+import itertools
+from typing import List
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Comment, Notification
+
+
+def enqueue_comment(comment: Comment) -> List[Notification]:
+    """Queues a notification for every author of the commented poster."""
+    recipients = comment.poster.authors.filter(is_active=True) \
+        .exclude(pk=comment.author_id).values_list("pk", flat=True)
+
+    return Notification.objects.bulk_create([
+        Notification(recipient_id=pk, comment=comment) for pk in recipients
+    ])
+
+
+def build_digest(recipient, notifications: List[Notification],
+                 current_site) -> mail.EmailMessage:
+    comments = [n.comment for n in notifications]
+    context = {
+        "current_site": current_site,
+        "recipient": recipient,
+        "comments": comments,
+        "posters": [(poster, list(group)) for poster, group in
+                    itertools.groupby(comments, key=lambda c: c.poster)],
+    }
+    subject = render_to_string(
+        "poster/email/comment_digest_subject.txt", context).strip()
+    body = render_to_string("poster/email/comment_digest_message.txt", context)
+    return mail.EmailMessage(subject, body, to=[recipient.email])
+
+
+def send_digests(now: datetime.datetime = None, connection=None) -> int:
+    """Delivers every due digest, returning the number of e-mails sent.
+
+    Pending rows are locked with ``SKIP LOCKED`` so that several workers can
+    run at once without sending the same digest twice. If delivery fails the
+    transaction rolls back and the notifications stay pending. Notifications
+    of comments deactivated since they were queued are deleted unsent.
+    """
+    now = now or timezone.now()
+    window = datetime.timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+
+    with transaction.atomic():
+        Notification.objects.pending().filter(comment__active=False).delete()
+
+        due = Notification.objects.pending() \
+            .filter(created_date__lte=now - window) \
+            .values("recipient").distinct()[:settings.NOTIFICATION_BATCH_SIZE]
+
+        notifications = list(
+            Notification.objects.pending()
+            .filter(recipient__in=due, created_date__lte=now,
+                    comment__active=True)
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("recipient", "comment__poster", "comment__author")
+            .order_by("recipient", "comment__poster", "comment__path"))
+
+        if not notifications:
+            return 0
+
+        current_site = Site.objects.get_current()
+        messages = [
+            build_digest(recipient, list(group), current_site)
+            for recipient, group in
+            itertools.groupby(notifications, key=lambda n: n.recipient)
+        ]
+
+        connection = connection or mail.get_connection()
+        connection.send_messages(messages)
+
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]) \
+            .update(sent_date=now)
+
+    return len(messages)
@@ -0,0 +1,86 @@
+"""Who is currently looking at a poster.
+
+Each open ``poster_detail`` page sends a heartbeat every
+``settings.PRESENCE_HEARTBEAT`` seconds. Viewers are kept per poster in the
+cache as ``{user id: viewer}`` and dropped once they miss heartbeats for
+``settings.PRESENCE_TTL`` seconds; the cache entries themselves expire the
+same way, so abandoned posters clean up after themselves. The
+``PRESENCE_CACHE`` alias must be shared by every worker process: the
+database cache by default, or memcached.
+
+Concurrent heartbeats on one poster can overwrite each other; a viewer lost
+that way reappears on their next heartbeat.
+"""
+import time
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[settings.PRESENCE_CACHE]
+
+
+def viewers_key(poster_id: int) -> str:
+    return f"presence:poster:{poster_id}"
+
+
+def count_key(poster_id: int) -> str:
+    return f"presence:count:{poster_id}"
+
+
+def current_viewers(poster_id: int, now: float = None) -> Dict[int, dict]:
+    now = now or time.time()
+    viewers = get_cache().get(viewers_key(poster_id)) or {}
+    return {pk: viewer for pk, viewer in viewers.items()
+            if viewer["seen"] > now - settings.PRESENCE_TTL}
+
+
+def save_viewers(poster_id: int, viewers: Dict[int, dict]):
+    # The count is stored separately so conference pages can fetch every
+    # poster's count without transferring the viewer lists
+    get_cache().set_many({
+        viewers_key(poster_id): viewers,
+        count_key(poster_id): len(viewers),
+    }, timeout=settings.PRESENCE_TTL)
+
+
+def heartbeat(poster_id: int, user) -> Dict[int, dict]:
+    """Marks ``user`` as viewing the poster and returns the current viewers."""
+    now = time.time()
+    viewers = current_viewers(poster_id, now)
+    viewers[user.pk] = {
+        "seen": now,
+        "name": user.get_full_name(),
+        "username": user.username,
+    }
+    save_viewers(poster_id, viewers)
+    return viewers
+
+
+def leave(poster_id: int, user) -> Dict[int, dict]:
+    viewers = current_viewers(poster_id)
+    if viewers.pop(user.pk, None) is not None:
+        save_viewers(poster_id, viewers)
+    return viewers
+
+
+def counts(poster_ids: Iterable[int]) -> Dict[int, int]:
+    """Returns the number of viewers of each poster in one cache round trip."""
+    keys = {count_key(pk): pk for pk in poster_ids}
+    found = get_cache().get_many(keys)
+    return {keys[key]: count for key, count in found.items()}
+
+
+def deltas(viewers: Dict[int, dict], known: Iterable[int]) -> dict:
+    """Describes how ``viewers`` differs from the ids a client already shows."""
+    known = set(known)
+    return {
+        "joined": [
+            {"id": pk, "name": viewer["name"], "username": viewer["username"]}
+            for pk, viewer in viewers.items() if pk not in known
+        ],
+        "left": sorted(known - set(viewers)),
+        "count": len(viewers),
+    }
@@ -0,0 +1,143 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import duplicates, facets, feed, notifications, related, stats
+from .models import Comment, Conference, Poster
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        notifications.enqueue_comment(instance)
+        feed.queue_fan_out(instance.poster_id, instance.pk)
+        stats.increment([instance.author_id], "comments_written")
+        stats.record_activity(instance.author_id, stats.activity_entry(
+            "comment", instance.poster, instance.created_date))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.increment([instance.author_id], "comments_written", -1)
+
+
+def linked_user_ids(through, source, instance, reverse, pk_set):
+    """Returns the users affected by an m2m change.
+
+    Forward changes (``poster.authors.add(user)``) affect every user in
+    ``pk_set`` once; reverse changes (``user.poster_set.add(poster)``) affect
+    ``instance`` once per linked object.
+    """
+    if reverse:
+        links = through.objects.filter(user=instance)
+        if pk_set is not None:
+            links = links.filter(**{f"{source}__in": pk_set})
+        return [instance.pk] * links.count()
+
+    links = through.objects.filter(**{source: instance})
+    if pk_set is not None:
+        links = links.filter(user__in=pk_set)
+    return list(links.values_list("user", flat=True))
+
+
+def update_m2m_counter(through, source, counter, instance, action, reverse,
+                       pk_set, new_activity=None):
+    """Keeps ``counter`` in step with additions and removals on ``through``.
+
+    Rows about to be removed are looked up in the pre_* signal, since
+    ``pk_set`` may name objects that were never linked.
+    """
+    if action in ("pre_remove", "pre_clear"):
+        instance._stats_removed = linked_user_ids(
+            through, source, instance, reverse, pk_set)
+    elif action in ("post_remove", "post_clear"):
+        removed = Counter(getattr(instance, "_stats_removed", []))
+        for delta in set(removed.values()):
+            stats.increment([pk for pk, n in removed.items() if n == delta],
+                            counter, -delta)
+    elif action == "post_add" and pk_set:
+        # pk_set only holds the objects that were actually added
+        if reverse:
+            stats.increment([instance.pk], counter, len(pk_set))
+        else:
+            stats.increment(pk_set, counter)
+
+        if new_activity is not None:
+            new_activity(instance, reverse, pk_set)
+
+
+def poster_author_activity(instance, reverse, pk_set):
+    if reverse:
+        for poster in Poster.objects.filter(pk__in=pk_set):
+            stats.record_activity(
+                instance.pk, stats.activity_entry("poster", poster))
+    else:
+        for user_id in pk_set:
+            stats.record_activity(
+                user_id, stats.activity_entry("poster", instance))
+
+
+@receiver(m2m_changed, sender=Poster.authors.through)
+def poster_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    update_m2m_counter(sender, "poster", "posters_authored", instance, action,
+                       reverse, pk_set, new_activity=poster_author_activity)
+
+    # Authors are facets and count towards related posters. Clearing a
+    # user's posters (reverse with no pk_set) is left to the next rebuild.
+    if action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            facets.index_poster(instance)
+            related.queue_rebuild(instance.conference_id)
+        elif pk_set:
+            posters = list(Poster.objects.filter(pk__in=pk_set))
+            for poster in posters:
+                facets.index_poster(poster)
+            for conference_id in {poster.conference_id for poster in posters}:
+                related.queue_rebuild(conference_id)
+
+
+@receiver(post_save, sender=Poster)
+def poster_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        if created:
+            feed.queue_fan_out(instance.pk)
+        facets.index_poster(instance)
+        related.queue_rebuild(instance.conference_id)
+        if duplicates.image_changed(instance):
+            duplicates.queue_hash(instance.pk)
+            instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Poster)
+def poster_removed(sender, instance, **kwargs):
+    related.queue_rebuild(instance.conference_id)
+
+
+def conference_role_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    role = next(role for role in stats.ROLE_COUNTERS
+                if getattr(Conference, role).through is sender)
+    update_m2m_counter(sender, "conference", stats.ROLE_COUNTERS[role],
+                       instance, action, reverse, pk_set)
+
+
+for role in stats.ROLE_COUNTERS:
+    m2m_changed.connect(conference_role_changed,
+                        sender=getattr(Conference, role).through)
+
+
+# Deleting a poster or conference removes its m2m rows without sending
+# m2m_changed, so the counters are adjusted before the delete instead.
+
+@receiver(pre_delete, sender=Poster)
+def poster_deleted(sender, instance, **kwargs):
+    stats.increment(instance.authors.values_list("pk", flat=True),
+                    "posters_authored", -1)
+    facets.unindex_poster(instance)
+
+
+@receiver(pre_delete, sender=Conference)
+def conference_deleted(sender, instance, **kwargs):
+    for role, counter in stats.ROLE_COUNTERS.items():
+        stats.increment(getattr(instance, role).values_list("pk", flat=True),
+                        counter, -1)
@@ -0,0 +1,195 @@
+"""Static snapshots of a conference for offline kiosks.
+
+``build`` renders a conference into a directory that any static file server
+(or a browser opening ``index.html`` from disk) can serve without Django::
+
+    index.html            poster list with client-side search
+    search.js             search index, loaded by index.html
+    posters/<id>.html     one page per poster, with comments and related posters
+    images/<id>.jpg       poster images downscaled to SNAPSHOT_IMAGE_SIZE
+    manifest.json         fingerprint of every poster in the last build
+
+Builds are incremental: a poster is re-rendered only when its fingerprint
+(the poster, its authors, comments and related posters) differs from the
+manifest of the previous build. Changed posters are rendered by a pool of
+worker processes, each with its own database connection.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Q
+from django.template.loader import render_to_string
+
+from .models import Comment, Conference, Poster, PosterFacet, RelatedPoster
+
+MANIFEST = "manifest.json"
+
+
+def write_file(path: str, data: bytes):
+    """Replaces ``path`` atomically so a kiosk never serves half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, "wb") as temp:
+        temp.write(data)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def fingerprints(conference: Conference) -> Dict[int, str]:
+    """Returns a hash per poster of everything its snapshot page shows."""
+    parts = defaultdict(list)
+    ids = set()
+    posters = Poster.objects.filter(conference=conference).annotate(
+        comment_count=Count("comment", filter=Q(comment__active=True)),
+        comments_updated=Max("comment__updated_date")) \
+        .values_list("pk", "updated_date", "image", "comment_count",
+                     "comments_updated")
+    for pk, *values in posters:
+        ids.add(pk)
+        parts[pk] += values
+
+    authors = Poster.authors.through.objects \
+        .filter(poster__conference=conference).order_by("poster", "user") \
+        .values_list("poster", "user__first_name", "user__last_name")
+    for pk, *values in authors:
+        parts[pk] += values
+
+    related = RelatedPoster.objects \
+        .filter(poster__conference=conference).order_by("poster", "rank") \
+        .values_list("poster", "related", "related__title")
+    for pk, *values in related:
+        parts[pk] += values
+
+    return {pk: hashlib.sha1(repr(values).encode()).hexdigest()
+            for pk, values in parts.items() if pk in ids}
+
+
+def resize_image(poster: Poster, output: str) -> Optional[str]:
+    """Writes a downscaled JPEG of the poster image, returning its path."""
+    name = f"images/{poster.pk}.jpg"
+    path = os.path.join(output, name)
+
+    from PIL import Image
+
+    try:
+        image = Image.open(poster.image.path) if poster.image else None
+    except OSError:
+        image = None
+    if image is None:
+        # The image was removed, or cannot be read
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+
+    with image:
+        image.thumbnail(settings.SNAPSHOT_IMAGE_SIZE)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85, optimize=True)
+    write_file(path, buffer.getvalue())
+    return name
+
+
+def render_poster(output: str, poster_id: int, fingerprint: str) \
+        -> Tuple[int, str]:
+    """Renders one poster page and its image. Runs in worker processes."""
+    poster = Poster.objects.select_related("conference").get(pk=poster_id)
+    comments = Comment.objects.filter(poster=poster, active=True) \
+        .select_related("author").order_by("path")
+    related = RelatedPoster.objects.filter(poster=poster) \
+        .select_related("related").order_by("rank")
+
+    html = render_to_string("poster/snapshot/poster.html", {
+        "conference": poster.conference,
+        "poster": poster,
+        "authors": poster.authors.all(),
+        "comments": comments,
+        "related": related,
+        "image": resize_image(poster, output),
+    })
+    write_file(os.path.join(output, "posters", f"{poster_id}.html"),
+               html.encode())
+    return poster_id, fingerprint
+
+
+def search_index(conference: Conference) -> list:
+    keywords = defaultdict(list)
+    facets = PosterFacet.objects.filter(conference=conference) \
+        .values_list("poster", "label")
+    for pk, label in facets:
+        keywords[pk].append(label)
+
+    return [{
+        "id": poster.pk,
+        "title": poster.title,
+        "subtitle": poster.subtitle,
+        "keywords": keywords[poster.pk],
+        "url": f"posters/{poster.pk}.html",
+    } for poster in Poster.objects.filter(conference=conference).order_by("pk")]
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def build(conference: Conference, output: str, processes: int = None,
+          full: bool = False, log=None) -> Tuple[int, int]:
+    """Builds or updates the snapshot of ``conference`` in ``output``.
+
+    ``processes`` defaults to the number of CPUs; with 1, posters are
+    rendered in this process. ``full`` re-renders every poster, which is
+    needed after changing the snapshot templates. Returns the numbers of
+    posters rendered and removed.
+    """
+    manifest_path = os.path.join(output, MANIFEST)
+    previous = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path) as manifest:
+            previous = {int(pk): fingerprint for pk, fingerprint
+                        in json.load(manifest)["posters"].items()}
+
+    current = fingerprints(conference)
+    changed = [(pk, fingerprint) for pk, fingerprint in current.items()
+               if previous.get(pk) != fingerprint]
+    removed = set(previous) - set(current)
+
+    jobs = [(output, pk, fingerprint) for pk, fingerprint in changed]
+    if processes == 1 or len(jobs) < 2:
+        results = [render_poster(*job) for job in jobs]
+    else:
+        # Workers must open their own database connections
+        connections.close_all()
+        with multiprocessing.Pool(processes, initializer=init_worker) as pool:
+            results = pool.starmap(render_poster, jobs, chunksize=4)
+    if log is not None:
+        for pk, _ in results:
+            log(f"Rendered poster {pk}")
+
+    for pk in removed:
+        for name in (f"posters/{pk}.html", f"images/{pk}.jpg"):
+            try:
+                os.remove(os.path.join(output, name))
+            except FileNotFoundError:
+                pass
+
+    index = search_index(conference)
+    write_file(os.path.join(output, "search.js"), (
+        "window.SNAPSHOT_INDEX = " + json.dumps(index) + ";\n").encode())
+    write_file(os.path.join(output, "index.html"), render_to_string(
+        "poster/snapshot/conference.html",
+        {"conference": conference, "posters": index}).encode())
+    write_file(manifest_path, json.dumps({
+        "conference": conference.pk,
+        "posters": current,
+    }, indent=2, sort_keys=True).encode())
+    return len(changed), len(removed)
@@ -0,0 +1,157 @@
+"""Per-user activity counters shown on profile pages.
+
+Counters are adjusted with a single ``UPDATE ... SET x = x + n`` whenever a
+comment, poster author or conference role is added or removed, so profile
+pages read one row instead of aggregating over the user's whole history.
+"""
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import User
+
+from .models import Comment, Conference, Poster, UserStats
+
+RECENT_ACTIVITY_LIMIT = 10
+
+COUNTERS = ["posters_authored", "comments_written", "conferences_organized",
+            "conferences_attended", "conferences_guested"]
+
+# Conference role field -> UserStats counter
+ROLE_COUNTERS = {
+    "organizers": "conferences_organized",
+    "attendees": "conferences_attended",
+    "guests": "conferences_guested",
+}
+
+
+def increment(user_ids: Iterable[int], counter: str, delta: int = 1):
+    """Atomically adds ``delta`` to ``counter`` for each user.
+
+    Counters never drop below zero, and decrements never create a missing
+    stats row, so they cannot fail the write (or delete) that caused them.
+    """
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return
+
+    if delta > 0:
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+    UserStats.objects.filter(user_id__in=user_ids) \
+        .update(**{counter: Greatest(F(counter) + delta, 0)})
+
+
+def activity_entry(kind: str, poster: Poster, date=None) -> dict:
+    return {
+        "kind": kind,
+        "title": poster.title,
+        "url": reverse("poster:poster_detail",
+                       args=[poster.conference_id, poster.pk]),
+        "date": (date or timezone.now()).isoformat(),
+    }
+
+
+def record_activity(user_id: int, entry: dict):
+    """Prepends ``entry`` to the user's recent activity.
+
+    A single upsert, which creates the stats row if needed and keeps the
+    ``RECENT_ACTIVITY_LIMIT`` newest entries, rather than a locked read and
+    a save.
+    """
+    table = UserStats._meta.db_table
+    counters = ", ".join(COUNTERS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, {counters}, recent_activity) "
+            f"VALUES (%s, {', '.join(['0'] * len(COUNTERS))}, "
+            f"jsonb_build_array(%s::jsonb)) "
+            f"ON CONFLICT (user_id) DO UPDATE SET recent_activity = ("
+            f"SELECT jsonb_agg(entry ORDER BY n) FROM jsonb_array_elements("
+            f"EXCLUDED.recent_activity || {table}.recent_activity) "
+            f"WITH ORDINALITY AS entries (entry, n) WHERE n <= %s)",
+            [user_id, json.dumps(entry), RECENT_ACTIVITY_LIMIT])
+
+
+def count_subquery(queryset, field):
+    """Counts rows of ``queryset`` pointing at the outer row through ``field``.
+
+    Correlated subqueries keep each count independent, unlike several
+    Count() annotations over joins which multiply each other's rows.
+    """
+    return Subquery(
+        queryset.filter(**{field: OuterRef("pk")}).order_by()
+        .values(field).annotate(count=Count("pk")).values("count")[:1])
+
+
+def recent_activity(user_ids: List[int]) -> Dict[int, list]:
+    """Returns the recent activity of each of the users, with one query."""
+    comments = Comment._meta.db_table
+    posters = Poster._meta.db_table
+    authors = Poster.authors.through._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT user_id, kind, poster_id, conference_id, title, date "
+            f"FROM (SELECT *, row_number() OVER ("
+            f"PARTITION BY user_id ORDER BY date DESC) AS n FROM ("
+            f"SELECT comment.author_id AS user_id, 'comment' AS kind, "
+            f"poster.id AS poster_id, poster.conference_id, poster.title, "
+            f"comment.created_date AS date "
+            f"FROM {comments} AS comment JOIN {posters} AS poster "
+            f"ON poster.id = comment.poster_id "
+            f"WHERE comment.author_id = ANY(%s) "
+            f"UNION ALL "
+            f"SELECT author.user_id, 'poster', poster.id, poster.conference_id, "
+            f"poster.title, poster.created_date "
+            f"FROM {authors} AS author JOIN {posters} AS poster "
+            f"ON poster.id = author.poster_id "
+            f"WHERE author.user_id = ANY(%s)) AS activity) AS ranked "
+            f"WHERE n <= %s ORDER BY user_id, n",
+            [user_ids, user_ids, RECENT_ACTIVITY_LIMIT])
+        rows = cursor.fetchall()
+
+    entries = defaultdict(list)
+    for user_id, kind, poster_id, conference_id, title, date in rows:
+        poster = Poster(pk=poster_id, conference_id=conference_id, title=title)
+        entries[user_id].append(activity_entry(kind, poster, date))
+    return entries
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Recomputes every user's stats from scratch, returning the user count."""
+    counters = {
+        "posters_authored": count_subquery(
+            Poster.authors.through.objects.all(), "user"),
+        "comments_written": count_subquery(Comment.objects.all(), "author"),
+    }
+    for role, counter in ROLE_COUNTERS.items():
+        through = getattr(Conference, role).through
+        counters[counter] = count_subquery(through.objects.all(), "user")
+
+    users = User.objects.annotate(**counters).order_by("pk")
+    rebuilt = 0
+    batch = []
+    for user in users.iterator(chunk_size=batch_size):
+        batch.append(UserStats(
+            user=user,
+            **{counter: getattr(user, counter) or 0 for counter in counters}))
+        if len(batch) >= batch_size:
+            rebuilt += save_batch(batch)
+            batch = []
+    return rebuilt + save_batch(batch)
+
+
+def save_batch(batch) -> int:
+    activity = recent_activity([s.user_id for s in batch])
+    for user_stats in batch:
+        user_stats.recent_activity = activity.get(user_stats.user_id, [])
+    with transaction.atomic():
+        UserStats.objects.filter(user__in=[s.user_id for s in batch]).delete()
+        UserStats.objects.bulk_create(batch)
+    return len(batch)
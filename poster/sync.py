@@ -0,0 +1,185 @@
+"""Incremental sync of a conference for offline-capable clients.
+
+Database triggers log every change to a conference, its roster, posters and
+comments as a ``Change`` row, in the same transaction as the change. A
+client keeps the ``token`` of its last sync and asks for what changed since;
+the response holds the current state of every object changed in the next
+``limit`` log rows, so an object changed many times is sent once.
+
+Changes are read in ``(transaction id, id)`` order, and only from
+transactions older than every transaction still in progress. Ids alone are
+not enough: a transaction may take an id and commit after a later id has
+been synced, and the client would never see it.
+"""
+from typing import Dict, List, Tuple
+
+from django.db import connection
+
+from core.models import User
+
+from .models import Change, Comment, Conference, Poster
+
+# (transaction id, change id) of the last change a client has seen
+Token = Tuple[int, int]
+
+
+def parse_token(token: str) -> Token:
+    """Parses a client's token; an empty token syncs from the beginning."""
+    if not token:
+        return 0, 0
+    xid, _, pk = token.partition("-")
+    return int(xid), int(pk)
+
+
+def format_token(token: Token) -> str:
+    return "{}-{}".format(*token)
+
+
+def read_changes(conference_id: int, since: Token, limit: int) \
+        -> Tuple[List[tuple], bool]:
+    """Returns up to ``limit`` changes after ``since``, and whether there
+    are more to read.
+
+    A transaction sees its own changes, which only matters when it is the
+    one that made them (e.g. in tests).
+    """
+    table = Change._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT xid, id, kind, object_id, deleted FROM {table} "
+            f"WHERE conference_id = %s AND (xid, id) > (%s, %s) "
+            f"AND (xid < txid_snapshot_xmin(txid_current_snapshot()) "
+            f"OR xid = txid_current_if_assigned()) "
+            f"ORDER BY xid, id LIMIT %s",
+            [conference_id, since[0], since[1], limit + 1])
+        rows = cursor.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def user_data(user: User) -> dict:
+    return {
+        "id": user.pk,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+    }
+
+
+def conference_data(conference: Conference) -> dict:
+    return {
+        "id": conference.pk,
+        "title": conference.title,
+        "institution": conference.institution,
+        "description": conference.description,
+        "created_date": conference.created_date,
+        "is_public": conference.is_public,
+    }
+
+
+def poster_data(poster: Poster) -> dict:
+    return {
+        "id": poster.pk,
+        "title": poster.title,
+        "subtitle": poster.subtitle,
+        "description": poster.description,
+        "image": poster.image.url if poster.image else None,
+        "authors": [author.pk for author in poster.authors.all()],
+        "created_date": poster.created_date,
+        "updated_date": poster.updated_date,
+    }
+
+
+def comment_data(comment: Comment) -> dict:
+    return {
+        "id": comment.pk,
+        "poster": comment.poster_id,
+        "parent": comment.parent_id,
+        "author": comment.author_id,
+        "path": comment.path,
+        "depth": comment.depth,
+        "body": comment.body,
+        "body_html": comment.body_html if comment.body_html_version else None,
+        "active": comment.active,
+        "created_date": comment.created_date,
+        "updated_date": comment.updated_date,
+    }
+
+
+def delta(conference_id: int, since: Token, limit: int) -> dict:
+    """Describes the changes to a conference after ``since``.
+
+    Objects are sent as they are now, which may include later changes; those
+    are sent again by the sync that reads them. Objects deleted since are
+    left to the sync that reads their deletion.
+    """
+    changes, more = read_changes(conference_id, since, limit)
+    latest: Dict[Tuple[str, int], bool] = {}
+    for _, _, kind, object_id, is_deleted in changes:
+        latest[(kind, object_id)] = is_deleted
+    saved = {kind: [] for kind, _ in Change.KINDS}
+    deleted = {kind: [] for kind, _ in Change.KINDS}
+    for (kind, object_id), is_deleted in latest.items():
+        (deleted if is_deleted else saved)[kind].append(object_id)
+
+    result = {
+        "token": format_token(changes[-1][:2] if changes else since),
+        "more": more,
+        "conference": None,
+        "posters": [],
+        "comments": [],
+        "users": [],
+        "deleted": {
+            "posters": deleted[Change.POSTER],
+            "comments": deleted[Change.COMMENT],
+        },
+        "roster": {},
+    }
+
+    if saved[Change.CONFERENCE]:
+        conference = Conference.objects.filter(pk=conference_id).first()
+        if conference is not None:
+            result["conference"] = conference_data(conference)
+
+    user_ids = set()
+    if saved[Change.POSTER]:
+        posters = Poster.objects.filter(
+            pk__in=saved[Change.POSTER], conference_id=conference_id) \
+            .prefetch_related("authors").order_by("pk")
+        result["posters"] = [poster_data(poster) for poster in posters]
+        user_ids.update(author for poster in result["posters"]
+                        for author in poster["authors"])
+
+    if saved[Change.COMMENT]:
+        comments = Comment.objects.filter(
+            pk__in=saved[Change.COMMENT], poster__conference_id=conference_id) \
+            .order_by("pk")
+        result["comments"] = [comment_data(comment) for comment in comments]
+        user_ids.update(comment["author"] for comment in result["comments"])
+
+    for role in Change.ROLES:
+        if saved[role] or deleted[role]:
+            result["roster"][role] = {
+                "added": saved[role], "removed": deleted[role]}
+            user_ids.update(saved[role])
+
+    if user_ids:
+        result["users"] = [user_data(user) for user in
+                           User.objects.filter(pk__in=user_ids).order_by("pk")]
+    return result
+
+
+def compact() -> int:
+    """Deletes changes superseded by a later change to the same object.
+
+    Clients read the state of an object as of its latest change, so the
+    earlier ones never add anything. Returns the number of rows deleted.
+    """
+    table = Change._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM (SELECT id, row_number() OVER ("
+            f"PARTITION BY conference_id, kind, object_id "
+            f"ORDER BY xid DESC, id DESC) AS n FROM {table}) AS ranked "
+            f"WHERE n > 1)")
+        return cursor.rowcount
@@ -1,3 +1,1083 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import User
+
+from jobs.models import Job
+
+from . import (analytics, archive, duplicates, facets, feed, markup,
+               presence, related, snapshot, stats, sync)
+from .models import (COMMENT_MAX_DEPTH, Change, Comment, Conference,
+                     ConferenceArchive, DuplicatePoster, FacetCount, FeedEntry,
+                     Notification, Poster, PosterFacet, PosterViews,
+                     RelatedPoster, UserStats)
+from .notifications import send_digests
+
+
+class PosterTestCase(TestCase):
+    """Creates a conference with a single poster and commenting user"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="simple@example.com", first_name="Test", last_name="User",
+            username="testuser", password="password")
+        self.conference = Conference.objects.create(
+            title="Conference", institution="Institution", description="")
+        self.poster = Poster.objects.create(
+            title="Poster", subtitle="Subtitle", description="",
+            created_date=timezone.now(), conference=self.conference)
+
+    def tearDown(self):
+        # Buffered views point at posters that are about to be rolled back
+        analytics.buffer.reset()
+
+    def comment(self, body="body", parent=None, poster=None):
+        return Comment.objects.create(poster=poster or self.poster,
+                                      author=self.user, body=body, parent=parent)
+
+
+class CommentThreadTests(PosterTestCase):
+
+    def test_thread_order(self):
+        """Tests that replies are returned depth-first after their parent"""
+        first = self.comment("first")
+        second = self.comment("second")
+        reply = self.comment("reply", parent=first)
+        nested = self.comment("nested", parent=reply)
+        late_reply = self.comment("late reply", parent=first)
+
+        comments = list(Comment.objects.threads(
+            Comment.objects.filter(poster=self.poster).top_level()))
+        self.assertEqual(
+            comments, [first, reply, nested, late_reply, second])
+        self.assertEqual([c.depth for c in comments], [0, 1, 2, 1, 0])
+        self.assertTrue(all(c.thread_id == first.pk for c in comments[:4]))
+
+    def test_page_of_threads_single_query(self):
+        """Tests that a page of threads is fetched in one query"""
+        roots = [self.comment(str(i)) for i in range(5)]
+        for root in roots:
+            self.comment("reply", parent=self.comment("reply", parent=root))
+
+        page = Comment.objects.top_level().order_by("path")[1:3]
+        with self.assertNumQueries(1):
+            comments = list(Comment.objects.threads(page))
+            authors = [c.author.username for c in comments]
+
+        self.assertEqual(len(comments), 6)
+        self.assertEqual({c.thread_id for c in comments},
+                         {roots[1].pk, roots[2].pk})
+        self.assertEqual(authors, ["testuser"] * 6)
+
+    def test_single_insert(self):
+        """Tests that a new comment is written once, complete with its path"""
+        from django.db.models.signals import post_save
+
+        root = self.comment()
+        seen = []
+
+        def receiver(sender, instance, **kwargs):
+            seen.append(Comment.objects.values_list("path", flat=True)
+                        .get(pk=instance.pk))
+
+        post_save.connect(receiver, sender=Comment)
+        try:
+            reply = self.comment(parent=root)
+        finally:
+            post_save.disconnect(receiver, sender=Comment)
+        self.assertEqual(seen, [reply.path])
+        self.assertEqual(reply.path, root.path + f"{reply.pk:010d}/")
+        self.assertEqual(Change.objects.filter(
+            kind=Change.COMMENT, object_id=reply.pk).count(), 1)
+
+    def test_max_depth(self):
+        """Tests that replies past the max depth become siblings"""
+        comment = self.comment()
+        for _ in range(COMMENT_MAX_DEPTH + 2):
+            comment = self.comment(parent=comment)
+
+        self.assertEqual(comment.depth, COMMENT_MAX_DEPTH - 1)
+        self.assertLessEqual(len(comment.path), 255)
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOW=60)
+class NotificationTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email="author@example.com", first_name="Poster", last_name="Author",
+            username="posterauthor", password="password")
+        self.poster.authors.add(self.author, self.user)
+
+    def test_enqueue_on_comment(self):
+        """Tests that comments notify every poster author but the commenter"""
+        self.comment()
+        self.assertEqual(
+            list(Notification.objects.values_list("recipient", flat=True)),
+            [self.author.pk])
+
+    def test_digest_window(self):
+        """Tests that comments are coalesced into a single digest"""
+        for i in range(3):
+            self.comment(f"comment {i}")
+
+        self.assertEqual(send_digests(), 0, "Digest window has not elapsed")
+        self.assertEqual(len(mail.outbox), 0)
+
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        self.assertEqual(send_digests(now=later), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.author.email])
+        self.assertIn("3 new comments", mail.outbox[0].subject)
+        self.assertIn("comment 2", mail.outbox[0].body)
+        self.assertFalse(Notification.objects.pending().exists())
+
+        self.assertEqual(send_digests(now=later), 0, "Digests are sent once")
+
+    def test_deactivated_comments_skipped(self):
+        """Tests that comments deactivated before the digest are not sent"""
+        spam = self.comment("spam")
+        Comment.objects.filter(pk=spam.pk).update(active=False)
+
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        self.assertEqual(send_digests(now=later), 0)
+        self.assertFalse(Notification.objects.pending().exists())
+
+        self.comment("kept")
+        Comment.objects.filter(pk=self.comment("spam 2").pk) \
+            .update(active=False)
+        self.assertEqual(send_digests(now=later), 1)
+        self.assertIn("kept", mail.outbox[0].body)
+        self.assertNotIn("spam", mail.outbox[0].body)
+
+
+class UserStatsTests(PosterTestCase):
+
+    def stats(self):
+        return UserStats.objects.get(user=self.user)
+
+    def test_incremental_counters(self):
+        """Tests that counters follow comments, authorship and roles"""
+        comment = self.comment()
+        self.comment()
+        self.poster.authors.add(self.user)
+        self.conference.attendees.add(self.user)
+        self.user.organizers.add(self.conference)
+
+        user_stats = self.stats()
+        self.assertEqual(user_stats.comments_written, 2)
+        self.assertEqual(user_stats.posters_authored, 1)
+        self.assertEqual(user_stats.conferences_attended, 1)
+        self.assertEqual(user_stats.conferences_organized, 1)
+        self.assertEqual(
+            [a["kind"] for a in user_stats.recent_activity],
+            ["poster", "comment", "comment"])
+
+        comment.delete()
+        self.poster.authors.remove(self.user, self.user)
+        self.conference.attendees.clear()
+        self.conference.guests.remove(self.user)
+
+        user_stats = self.stats()
+        self.assertEqual(user_stats.comments_written, 1)
+        self.assertEqual(user_stats.posters_authored, 0)
+        self.assertEqual(user_stats.conferences_attended, 0)
+        self.assertEqual(user_stats.conferences_guested, 0)
+
+    def test_recent_activity_limit(self):
+        """Tests that recent activity keeps the newest entries, one write
+        each"""
+        for i in range(stats.RECENT_ACTIVITY_LIMIT + 2):
+            with self.assertNumQueries(1):
+                stats.record_activity(self.user.pk, {"kind": "comment", "n": i})
+        activity = self.stats().recent_activity
+        self.assertEqual(len(activity), stats.RECENT_ACTIVITY_LIMIT)
+        self.assertEqual(activity[0]["n"], stats.RECENT_ACTIVITY_LIMIT + 1)
+
+    def test_delete_cascades(self):
+        """Tests that deleting a conference updates its users' counters"""
+        self.comment()
+        self.poster.authors.add(self.user)
+        self.conference.attendees.add(self.user)
+
+        self.conference.delete()
+
+        user_stats = self.stats()
+        self.assertEqual(user_stats.comments_written, 0)
+        self.assertEqual(user_stats.posters_authored, 0)
+        self.assertEqual(user_stats.conferences_attended, 0)
+
+    def test_rebuild(self):
+        """Tests that a rebuild matches the incrementally kept counters"""
+        self.comment()
+        self.poster.authors.add(self.user)
+        self.conference.guests.add(self.user)
+        incremental = self.stats()
+
+        UserStats.objects.all().delete()
+        with self.assertNumQueries(6):
+            # Users with counters, recent activity of the whole batch, then
+            # delete and insert in a savepoint
+            self.assertEqual(stats.rebuild(), 1)
+
+        rebuilt = self.stats()
+        for field in ("posters_authored", "comments_written",
+                      "conferences_guested", "conferences_attended"):
+            self.assertEqual(getattr(rebuilt, field),
+                             getattr(incremental, field), field)
+        self.assertEqual([a["kind"] for a in rebuilt.recent_activity],
+                         ["comment", "poster"])
+
+    def test_profile_single_query(self):
+        """Tests that the profile page reads the user and stats at once"""
+        for _ in range(5):
+            self.comment()
+        self.user.avatar = "default-avatar.png"
+        self.user.save()
+        self.client.force_login(self.user)
+
+        url = reverse("core:profile", args=[self.user.username])
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            # Session and request.user, then the profile itself
+            response = self.client.get(url)
+        self.assertContains(response, "5 comments")
+
+
+@override_settings(POSTER_VIEWS_FLUSH_INTERVAL=3600)
+class PosterViewTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.avatar = "default-avatar.png"
+        self.user.save()
+        self.poster.image = "poster.png"
+        self.poster.save()
+        self.url = reverse("poster:poster_detail",
+                           args=[self.conference.pk, self.poster.pk])
+
+    def test_buffered_views(self):
+        """Tests that views are buffered, deduplicated and flushed at once"""
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(self.url)
+        self.client.logout()
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+
+        self.assertFalse(PosterViews.objects.exists(), "Views are buffered")
+        with self.assertNumQueries(1):
+            self.assertEqual(analytics.buffer.flush(), 1)
+
+        self.assertEqual(PosterViews.objects.get().views, 2,
+                         "Views are counted once per session")
+
+    def test_deleted_poster_views(self):
+        """Tests that views of posters deleted before the flush are skipped"""
+        other = Poster.objects.create(
+            title="Other", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        analytics.buffer.add(self.poster.pk, self.conference.pk, hour)
+        analytics.buffer.add(other.pk, self.conference.pk, hour)
+        other.delete()
+
+        analytics.buffer.flush()
+        self.assertEqual(list(PosterViews.objects.values_list("poster", "views")),
+                         [(self.poster.pk, 1)])
+
+    def test_failed_flush_dropped(self):
+        """Tests that counts are kept after a failed flush, and dropped after
+        a second one"""
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        analytics.buffer.add(self.poster.pk, self.conference.pk, hour)
+        with mock.patch.object(analytics, "upsert",
+                               side_effect=RuntimeError("down")):
+            with self.assertRaises(RuntimeError):
+                analytics.buffer.flush()
+            self.assertEqual(len(analytics.buffer.counts), 1)
+            with self.assertRaises(RuntimeError):
+                analytics.buffer.flush()
+            self.assertFalse(analytics.buffer.counts)
+
+        analytics.buffer.add(self.poster.pk, self.conference.pk, hour)
+        with mock.patch.object(analytics, "upsert",
+                               side_effect=RuntimeError("down")):
+            with self.assertRaises(RuntimeError):
+                analytics.buffer.flush()
+        self.assertEqual(analytics.buffer.flush(), 1)
+
+    def test_periodic_flush(self):
+        """Tests that buffered views are flushed without further views"""
+        view_buffer = analytics.ViewBuffer()
+        flushed = threading.Event()
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        with self.settings(POSTER_VIEWS_FLUSH_INTERVAL=0.01), \
+                mock.patch.object(view_buffer, "flush",
+                                  side_effect=flushed.set):
+            view_buffer.add(self.poster.pk, self.conference.pk, hour)
+            self.assertTrue(flushed.wait(5))
+            flusher = view_buffer.flusher
+            view_buffer.reset()
+            flusher.join(5)
+        self.assertFalse(flusher.is_alive(), "Resetting stops the flusher")
+
+    def test_rollups(self):
+        """Tests conference top posters and views per day"""
+        other = Poster.objects.create(
+            title="Other", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for _ in range(3):
+            analytics.buffer.add(other.pk, self.conference.pk, hour)
+        analytics.buffer.add(self.poster.pk, self.conference.pk, hour)
+        analytics.buffer.flush()
+        analytics.buffer.add(self.poster.pk, self.conference.pk, hour)
+        analytics.buffer.flush()
+
+        top = analytics.top_posters(self.conference)
+        self.assertEqual([(p.pk, p.views) for p in top],
+                         [(other.pk, 3), (self.poster.pk, 2)])
+        self.assertEqual(
+            [row["views"] for row in analytics.views_per_day(self.conference)],
+            [5])
+
+    def test_analytics_page(self):
+        """Tests that only organizers can see conference analytics"""
+        url = reverse("poster:conference_analytics", args=[self.conference.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.conference.organizers.add(self.user)
+        self.assertContains(self.client.get(url), "Most viewed posters")
+
+
+class UploadTests(PosterTestCase):
+
+    def test_oversized_poster_rejected(self):
+        """Tests that a poster image over the pixel limit is rejected with
+        the reason and nothing is stored"""
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (300, 200)).save(buffer, "PNG")
+        self.client.force_login(self.user)
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root,
+                              UPLOAD_IMAGE_MAX_PIXELS=50000):
+            response = self.client.post(
+                reverse("poster:poster_create", args=[self.conference.pk]),
+                {"title": "Big", "subtitle": "", "description": "",
+                 "image": ContentFile(buffer.getvalue(), name="big.png")})
+            self.assertEqual(os.listdir(media_root), [])
+
+        self.assertContains(response, "at most 0.05 megapixels")
+        self.assertFalse(Poster.objects.filter(title="Big").exists())
+
+
+class AdminTests(PosterTestCase):
+
+    def test_inline_limit_per_parent(self):
+        """Tests that inlines show the most recent rows of each parent"""
+        from .admin import INLINE_LIMIT
+
+        other = Conference.objects.create(
+            title="Other", institution="Institution", description="")
+        for conference in (self.conference, other):
+            Poster.objects.bulk_create(
+                Poster(title=f"{conference.title} {i}", subtitle="",
+                       description="", conference=conference,
+                       created_date=timezone.now())
+                for i in range(INLINE_LIMIT + 5))
+        admin = User.objects.create_superuser(
+            email="admin@example.com", first_name="Admin", last_name="User",
+            username="admin", password="password")
+        self.client.force_login(admin)
+
+        for conference in (self.conference, other):
+            response = self.client.get(reverse(
+                "admin:poster_conference_change", args=[conference.pk]))
+            formset = response.context["inline_admin_formsets"][0].formset
+            posters = list(formset.get_queryset())
+            self.assertEqual(len(posters), INLINE_LIMIT)
+            self.assertEqual({p.conference_id for p in posters},
+                             {conference.pk})
+
+
+class ExportTests(PosterTestCase):
+
+    def test_export_zip(self):
+        """Tests that a streamed export contains manifests and images"""
+        self.poster.authors.add(self.user)
+        root = self.comment("question")
+        self.comment("answer", parent=root)
+        self.conference.organizers.add(self.user)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            self.poster.image.save("poster.png", ContentFile(b"png" * 1000))
+            self.client.force_login(self.user)
+            response = self.client.get(reverse(
+                "poster:conference_export", args=[self.conference.pk]))
+            content = b"".join(response.streaming_content)
+
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertEqual(
+            json.loads(archive.read("conference.json"))["title"], "Conference")
+        roster = list(csv.DictReader(
+            io.TextIOWrapper(archive.open("roster.csv"), encoding="utf-8")))
+        self.assertEqual([(r["role"], r["email"]) for r in roster],
+                         [("organizers", self.user.email)])
+
+        comments = list(csv.DictReader(
+            io.TextIOWrapper(archive.open("comments.csv"), encoding="utf-8")))
+        self.assertEqual([c["body"] for c in comments], ["question", "answer"])
+        self.assertEqual(comments[1]["parent_id"], str(root.pk))
+
+        authors = archive.read("poster_authors.csv").decode().splitlines()
+        self.assertEqual(len(authors), 2)
+        self.assertEqual(
+            archive.read(f"images/{self.poster.pk}-poster.png"), b"png" * 1000)
+
+    def test_archived_rejected(self):
+        """Tests that archived conferences are not exported empty"""
+        self.conference.organizers.add(self.user)
+        Conference.objects.filter(pk=self.conference.pk).update(is_archived=True)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(
+            "poster:conference_export", args=[self.conference.pk]))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(b"Restore it", response.content)
+
+
+class PresenceTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        presence.get_cache().clear()
+        self.other = User.objects.create_user(
+            email="other@example.com", first_name="Other", last_name="User",
+            username="otheruser", password="password")
+        self.url = reverse("poster:poster_presence",
+                           args=[self.conference.pk, self.poster.pk])
+
+    def test_heartbeat_expires(self):
+        """Tests that viewers are dropped once they miss heartbeats"""
+        now = time.time()
+        with mock.patch("time.time", return_value=now - 20):
+            presence.heartbeat(self.poster.pk, self.user)
+        presence.heartbeat(self.poster.pk, self.other)
+
+        viewers = presence.current_viewers(self.poster.pk, now + 5)
+        self.assertEqual(set(viewers), {self.user.pk, self.other.pk})
+        viewers = presence.current_viewers(self.poster.pk, now + 15)
+        self.assertEqual(set(viewers), {self.other.pk})
+
+    def test_counts(self):
+        """Tests that conference pages get viewer counts from the cache"""
+        presence.heartbeat(self.poster.pk, self.user)
+        presence.heartbeat(self.poster.pk, self.other)
+        self.assertEqual(presence.counts([self.poster.pk, 0]),
+                         {self.poster.pk: 2})
+
+        presence.leave(self.poster.pk, self.other)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("poster:conference_detail", args=[self.conference.pk]))
+        self.assertEqual(response.context["posters"][0].viewer_count, 1)
+
+    def test_endpoint_deltas(self):
+        """Tests that heartbeats return who joined and left since last time"""
+        presence.heartbeat(self.poster.pk, self.other)
+        self.client.force_login(self.user)
+
+        delta = self.client.post(self.url).json()
+        self.assertEqual({v["id"] for v in delta["joined"]},
+                         {self.user.pk, self.other.pk})
+        self.assertEqual(delta["count"], 2)
+
+        presence.leave(self.poster.pk, self.other)
+        known = f"{self.user.pk},{self.other.pk}"
+        delta = self.client.post(self.url, {"known": known}).json()
+        self.assertEqual(delta, {"joined": [], "left": [self.other.pk],
+                                 "count": 1, "interval": 10})
+
+        delta = self.client.post(self.url, {"leave": "1"}).json()
+        self.assertEqual(delta["count"], 0)
+
+
+class FragmentCacheTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches["template_fragments"].clear()
+        self.user.avatar = "default-avatar.png"
+        self.user.save()
+        self.poster.image = "poster.png"
+        self.poster.save()
+        self.client.force_login(self.user)
+        self.url = reverse("poster:poster_detail",
+                           args=[self.conference.pk, self.poster.pk])
+
+    def test_comment_rows(self):
+        """Tests that comment rows are cached until the comment changes"""
+        comment = self.comment("original")
+        self.assertContains(self.client.get(self.url), "original")
+
+        Comment.objects.filter(pk=comment.pk).update(body="bypassed")
+        self.assertContains(self.client.get(self.url), "original")
+
+        comment.refresh_from_db()
+        comment.body = "edited"
+        comment.save()
+        self.assertContains(self.client.get(self.url), "edited")
+
+    def test_poster_rows(self):
+        """Tests that conference poster rows follow poster edits"""
+        url = reverse("poster:conference_detail", args=[self.conference.pk])
+        self.assertContains(self.client.get(url), "Subtitle")
+
+        self.poster.subtitle = "Renamed"
+        self.poster.save()
+        self.assertContains(self.client.get(url), "Renamed")
+
+
+class MarkupTests(PosterTestCase):
+
+    def test_render_sanitizes(self):
+        """Tests that Markdown is rendered with raw HTML and scripts escaped"""
+        html = markup.render(
+            "**bold** <script>alert(1)</script> [x](javascript:alert(1))\n\n"
+            "```\nif a < b:\n```\n\nsee https://example.com")
+        self.assertIn("<strong>bold</strong>", html)
+        self.assertIn("&lt;script&gt;", html)
+        self.assertNotIn("javascript:", html)
+        self.assertIn("<pre><code>if a &lt; b:", html)
+        self.assertIn('<a href="https://example.com" rel="nofollow">', html)
+
+    def test_render_headings(self):
+        """Tests that Markdown headings render below the page's own"""
+        html = markup.render("# One\n\n## Two\n\n#### Four\n\n<h1>raw</h1>")
+        self.assertIn("<h3>One</h3>", html)
+        self.assertIn("<h4>Two</h4>", html)
+        self.assertIn("<h6>Four</h6>", html)
+        self.assertIn("&lt;h1&gt;raw&lt;/h1&gt;", html)
+
+    def test_rendered_on_write(self):
+        """Tests that saving a comment stores its rendered body"""
+        comment = self.comment("*first*")
+        comment.refresh_from_db()
+        self.assertEqual(comment.body_html, "<p><em>first</em></p>")
+        self.assertEqual(comment.body_html_version, markup.RENDERER_VERSION)
+
+        comment.body = "*second*"
+        comment.save(update_fields=["body"])
+        comment.refresh_from_db()
+        self.assertEqual(comment.body_html, "<p><em>second</em></p>")
+
+    def test_rerender_stale(self):
+        """Tests that comments from an older renderer are re-rendered"""
+        comments = [self.comment(f"*{i}*") for i in range(3)]
+        Comment.objects.filter(pk__in=[c.pk for c in comments[1:]]) \
+            .update(body_html="old", body_html_version=0)
+
+        call_command("rerender_comments", batch_size=1, stdout=io.StringIO())
+        self.assertFalse(Comment.objects.stale_html().exists())
+        self.assertEqual(
+            list(Comment.objects.order_by("pk")
+                 .values_list("body_html", flat=True)),
+            [f"<p><em>{i}</em></p>" for i in range(3)])
+
+
+class RelatedPosterTests(PosterTestCase):
+
+    def create_poster(self, title, description):
+        return Poster.objects.create(
+            title=title, subtitle="", description=description,
+            created_date=timezone.now(), conference=self.conference)
+
+    def related(self, poster):
+        return list(RelatedPoster.objects.filter(poster=poster)
+                    .order_by("rank").values_list("related", flat=True))
+
+    def test_rebuild(self):
+        """Tests that posters are related by shared words, best match first"""
+        mri = self.create_poster("MRI segmentation", "Deep learning for brain MRI")
+        brain = self.create_poster("Brain MRI atlas", "An atlas of brain MRI scans")
+        learning = self.create_poster("Deep learning", "Deep learning for proteins")
+        self.create_poster("Pottery", "Ancient ceramics")
+
+        self.assertEqual(related.rebuild_conference(self.conference.pk), 3)
+        self.assertEqual(self.related(mri), [brain.pk, learning.pk])
+        self.assertEqual(self.related(learning), [mri.pk])
+        self.assertEqual(related.rebuild_conference(self.conference.pk), 0,
+                         "Unchanged posters are not rewritten")
+
+        learning.title = "Protein folding"
+        learning.description = "Protein folding"
+        learning.save()
+        related.rebuild_conference(self.conference.pk)
+        self.assertEqual(self.related(mri), [brain.pk])
+        self.assertEqual(self.related(learning), [])
+
+    def test_queued_on_change(self):
+        """Tests that poster changes queue one debounced rebuild"""
+        Job.objects.all().delete()
+        self.poster.title = "Renamed"
+        self.poster.save()
+        self.poster.authors.add(self.user)
+        job = Job.objects.get()
+        self.assertEqual(job.payload, {"conference_id": self.conference.pk})
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_poster_page(self):
+        """Tests that poster pages list related posters in one query"""
+        self.user.avatar = "default-avatar.png"
+        self.user.save()
+        self.poster.description = "Graph neural networks"
+        self.poster.image = "poster.png"
+        self.poster.save()
+        self.create_poster("GNN survey", "Graph neural networks survey")
+        related.rebuild_conference(self.conference.pk)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(
+            "poster:poster_detail", args=[self.conference.pk, self.poster.pk]))
+        self.assertEqual(list(response.context["related"]),
+                         list(RelatedPoster.objects.filter(poster=self.poster)))
+        self.assertContains(response, "GNN survey")
+
+
+class FacetTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(
+            email="other@lab.example.org", first_name="Other",
+            last_name="User", username="otheruser", password="password")
+
+    def counts(self, facet):
+        return dict(FacetCount.objects.filter(
+            conference=self.conference, facet=facet)
+            .values_list("value", "count"))
+
+    def test_incremental_counts(self):
+        """Tests that counts follow poster edits, authors and deletes"""
+        mri = Poster.objects.create(
+            title="Brain MRI", subtitle="", description="Scans #neuro",
+            created_date=timezone.now(), conference=self.conference)
+        mri.authors.add(self.user, self.other)
+        self.poster.authors.add(self.user)
+
+        self.assertEqual(self.counts(PosterFacet.INSTITUTION),
+                         {"example.com": 2, "lab.example.org": 1})
+        self.assertEqual(self.counts(PosterFacet.AUTHOR)[str(self.user.pk)], 2)
+        self.assertEqual(self.counts(PosterFacet.KEYWORD)["neuro"], 1)
+
+        mri.title = "Heart MRI"
+        mri.save()
+        keywords = self.counts(PosterFacet.KEYWORD)
+        self.assertNotIn("brain", keywords)
+        self.assertEqual(keywords["heart"], 1)
+
+        mri.delete()
+        self.assertEqual(self.counts(PosterFacet.INSTITUTION),
+                         {"example.com": 1})
+
+        before = list(FacetCount.objects.values_list("facet", "value", "count")
+                      .order_by("facet", "value"))
+        facets.rebuild_conference(self.conference.pk)
+        self.assertEqual(
+            list(FacetCount.objects.values_list("facet", "value", "count")
+                 .order_by("facet", "value")), before)
+
+    def test_filter_intersection(self):
+        """Tests that selecting several values keeps posters having all"""
+        both = Poster.objects.create(
+            title="Both", subtitle="", description="", conference=self.conference,
+            created_date=timezone.now())
+        both.authors.add(self.user, self.other)
+        self.poster.authors.add(self.user)
+
+        self.client.force_login(self.user)
+        url = reverse("poster:conference_detail", args=[self.conference.pk])
+        response = self.client.get(url, {"author": [self.user.pk]})
+        self.assertEqual(len(response.context["posters"]), 2)
+
+        response = self.client.get(
+            url, {"author": [self.user.pk], "institution": "lab.example.org"})
+        self.assertEqual(response.context["posters"], [both])
+        institutions = {entry["value"]: entry["count"]
+                        for label, facet, values in response.context["facets"]
+                        if facet == PosterFacet.INSTITUTION
+                        for entry in values}
+        self.assertEqual(institutions,
+                         {"example.com": 1, "lab.example.org": 1})
+
+
+class SnapshotTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.output = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output.cleanup)
+
+    def build(self, **kwargs):
+        return snapshot.build(self.conference, self.output.name, processes=1,
+                              **kwargs)
+
+    def test_incremental_build(self):
+        """Tests that only changed posters are rendered again"""
+        self.comment(body="Nice **work**")
+        self.assertEqual(self.build(), (1, 0))
+        for name in ("index.html", "search.js", "manifest.json",
+                     f"posters/{self.poster.pk}.html"):
+            self.assertTrue(os.path.exists(os.path.join(self.output.name, name)))
+        with open(os.path.join(self.output.name,
+                               f"posters/{self.poster.pk}.html")) as page:
+            self.assertIn("<strong>work</strong>", page.read())
+
+        self.assertEqual(self.build(), (0, 0))
+        self.comment(body="Another")
+        self.assertEqual(self.build(), (1, 0))
+        self.assertEqual(self.build(full=True), (1, 0))
+
+        page = os.path.join(self.output.name, "posters", f"{self.poster.pk}.html")
+        self.poster.delete()
+        self.assertEqual(self.build(), (0, 1))
+        self.assertFalse(os.path.exists(page))
+
+
+class SyncTests(PosterTestCase):
+
+    def sync(self, since="", **params):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("poster:conference_sync", args=[self.conference.pk]),
+            dict(params, since=since))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deltas_since_token(self):
+        """Tests that a sync only returns what changed since the token"""
+        self.conference.attendees.add(self.user)
+        self.poster.authors.add(self.user)
+        comment = self.comment()
+        comment_pk = comment.pk
+
+        full = self.sync()
+        self.assertEqual(full["conference"]["title"], "Conference")
+        self.assertEqual([p["id"] for p in full["posters"]], [self.poster.pk])
+        self.assertEqual(full["posters"][0]["authors"], [self.user.pk])
+        self.assertEqual([c["id"] for c in full["comments"]], [comment_pk])
+        self.assertEqual(full["roster"],
+                         {"attendees": {"added": [self.user.pk], "removed": []}})
+        self.assertEqual([u["id"] for u in full["users"]], [self.user.pk])
+        self.assertFalse(full["more"])
+
+        self.assertEqual(self.sync(full["token"])["posters"], [])
+
+        self.poster.title = "Renamed"
+        self.poster.save()
+        comment.delete()
+        self.conference.attendees.remove(self.user)
+        delta = self.sync(full["token"])
+        self.assertIsNone(delta["conference"])
+        self.assertEqual([p["title"] for p in delta["posters"]], ["Renamed"])
+        self.assertEqual(delta["comments"], [])
+        self.assertEqual(delta["deleted"],
+                         {"posters": [], "comments": [comment_pk]})
+        self.assertEqual(delta["roster"],
+                         {"attendees": {"added": [], "removed": [self.user.pk]}})
+
+    def test_batches_and_compaction(self):
+        """Tests that limited syncs page through the log, before and after
+        compacting it"""
+        for i in range(3):
+            self.comment(body=f"comment {i}")
+        self.poster.save()
+
+        def sync_all(limit):
+            comments, token, pages = set(), "", 0
+            while True:
+                delta = self.sync(token, limit=limit)
+                comments.update(c["id"] for c in delta["comments"])
+                token, pages = delta["token"], pages + 1
+                if not delta["more"]:
+                    return comments, pages
+
+        expected = set(Comment.objects.values_list("pk", flat=True))
+        total = Change.objects.filter(conference_id=self.conference.pk).count()
+        self.assertEqual(sync_all(2), (expected, -(-total // 2)))
+
+        self.assertGreater(sync.compact(), 0)
+        compacted = Change.objects.filter(conference_id=self.conference.pk)
+        # The conference, the poster and three comments
+        self.assertEqual(compacted.count(), 5)
+        self.assertEqual(sync_all(2)[0], expected)
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("poster:conference_sync", args=[self.conference.pk]),
+            {"since": "nonsense"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTests(PosterTestCase):
+
+    def test_archive_and_restore(self):
+        """Tests that an archived conference reads from its archive and is
+        restored with the same rows"""
+        self.user.avatar = "default-avatar.png"
+        self.user.save()
+        self.poster.image = "poster.png"
+        self.poster.save()
+        self.poster.authors.add(self.user)
+        other = Poster.objects.create(
+            title="Other", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+        RelatedPoster.objects.create(poster=self.poster, related=other,
+                                     rank=0, score=0.5)
+        root = self.comment(body="root")
+        reply = self.comment(body="*reply*", parent=root)
+        old = timezone.now() - datetime.timedelta(days=400)
+        Conference.objects.update(created_date=old)
+        Poster.objects.update(updated_date=old)
+        created = Comment.objects.get(pk=reply.pk).created_date
+        updated = {pk: date for pk, date in Poster.objects.values_list(
+            "pk", "updated_date")}
+        posters_authored = UserStats.objects.get(user=self.user).posters_authored
+
+        archive.archive_conference(self.conference.pk)
+        self.assertFalse(Poster.objects.filter(conference=self.conference).exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).posters_authored,
+            posters_authored)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(
+            "poster:conference_detail", args=[self.conference.pk]))
+        self.assertContains(response, "archived and read-only")
+        self.assertEqual([p.pk for p in response.context["posters"]],
+                         [self.poster.pk, other.pk])
+
+        url = reverse("poster:poster_detail",
+                      args=[self.conference.pk, self.poster.pk])
+        response = self.client.get(url)
+        self.assertContains(response, "<em>reply</em>")
+        self.assertEqual([r.related.title for r in response.context["related"]],
+                         ["Other"])
+        self.client.post(url, {"body": "too late"})
+        self.assertFalse(Comment.objects.exists())
+
+        Job.objects.all().delete()
+        self.assertEqual(archive.restore_conference(self.conference.pk), 2)
+        self.assertFalse(ConferenceArchive.objects.exists())
+        self.assertEqual(Comment.objects.get(pk=reply.pk).created_date, created)
+        self.assertEqual(dict(Poster.objects.values_list("pk", "updated_date")),
+                         updated)
+        self.assertFalse(archive.stale_conferences(365).exists(),
+                         "A restored conference is not archived again at once")
+        self.assertEqual(
+            sorted(Job.objects.values_list("name", flat=True)),
+            sorted([related.JOB_NAME, duplicates.JOB_NAME]
+                   + [feed.JOB_NAME] * 4),
+            "The unhashed image is hashed, recent rows are fanned out")
+        self.assertEqual(Comment.objects.get(pk=reply.pk).parent_id, root.pk)
+        self.assertEqual(list(self.poster.authors.all()), [self.user])
+        self.assertTrue(RelatedPoster.objects.filter(poster=self.poster).exists())
+        self.assertTrue(PosterFacet.objects.filter(
+            poster=self.poster, facet=PosterFacet.AUTHOR).exists())
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_stale_conferences(self):
+        """Tests that only conferences without recent edits are archived"""
+        old = timezone.now() - datetime.timedelta(days=400)
+        Conference.objects.update(created_date=old)
+        self.comment()
+        self.assertFalse(archive.stale_conferences(365).exists())
+
+        Poster.objects.update(updated_date=old)
+        Comment.objects.update(updated_date=old)
+        self.assertEqual(list(archive.stale_conferences(365)), [self.conference])
+        call_command("archive_conferences", stdout=io.StringIO())
+        self.conference.refresh_from_db()
+        self.assertTrue(self.conference.is_archived)
+
+
+def drawing(shapes, size=(400, 300), format="PNG") -> bytes:
+    """Returns an image of black ellipses on white, each given as a box in
+    fractions of the image size."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    for left, top, right, bottom in shapes:
+        draw.ellipse([left * width, top * height, right * width,
+                      bottom * height], fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format)
+    return buffer.getvalue()
+
+
+class DuplicateTests(PosterTestCase):
+
+    SHAPES = [(0.1, 0.1, 0.4, 0.5), (0.5, 0.6, 0.9, 0.9)]
+    OTHER_SHAPES = [(0.6, 0.05, 0.95, 0.4), (0.05, 0.5, 0.3, 0.95),
+                    (0.4, 0.4, 0.6, 0.6)]
+
+    def test_hash_distance(self):
+        """Tests that rescaled copies of an image hash alike and other images
+        do not"""
+        original = duplicates.image_hash(io.BytesIO(drawing(self.SHAPES)))
+        copy = duplicates.image_hash(io.BytesIO(
+            drawing(self.SHAPES, size=(1200, 900), format="JPEG")))
+        other = duplicates.image_hash(io.BytesIO(drawing(self.OTHER_SHAPES)))
+
+        self.assertLessEqual(duplicates.distance(original, copy), 2)
+        self.assertGreater(duplicates.distance(original, other), 16)
+        self.assertEqual(duplicates.distance(-1, 0), 64)
+
+    def test_cleared_hash_skipped(self):
+        """Tests that posters whose hash was cleared but are still indexed
+        are not compared"""
+        self.poster.image_hash = 7
+        duplicates.index_poster(self.poster)
+        Poster.objects.filter(pk=self.poster.pk).update(image_hash=None)
+
+        copy = Poster.objects.create(
+            title="Copy", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+        copy.image_hash = 7
+        self.assertEqual(duplicates.index_poster(copy), [])
+
+    def test_duplicates_found(self):
+        """Tests that uploading a copy of a poster image queues a hash job
+        that flags the copy to organizers"""
+        other = Poster.objects.create(
+            title="Other", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+        copy = Poster.objects.create(
+            title="Copy", subtitle="", description="",
+            created_date=timezone.now(), conference=self.conference)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            self.poster.image.save("a.png", ContentFile(drawing(self.SHAPES)))
+            other.image.save("b.png", ContentFile(drawing(self.OTHER_SHAPES)))
+            copy.image.save("c.jpg", ContentFile(
+                drawing(self.SHAPES, size=(800, 600), format="JPEG")))
+            self.assertEqual(
+                Job.objects.filter(name=duplicates.JOB_NAME).count(), 3)
+
+            # Saving without a new image does not hash it again
+            Job.objects.all().delete()
+            Poster.objects.get(pk=copy.pk).save()
+            self.assertFalse(
+                Job.objects.filter(name=duplicates.JOB_NAME).exists())
+
+            self.assertEqual(duplicates.hash_poster(self.poster.pk), [])
+            self.assertEqual(duplicates.hash_poster(other.pk), [])
+            found = duplicates.hash_poster(copy.pk)
+
+        self.assertEqual([(d.poster_id, d.original_id) for d in found],
+                         [(copy.pk, self.poster.pk)])
+        self.assertEqual(
+            duplicates.index_conference(self.conference.pk), 1)
+        self.assertEqual(
+            DuplicatePoster.objects.get().distance, found[0].distance)
+
+        self.conference.organizers.add(self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(
+            "poster:conference_analytics", args=[self.conference.pk]))
+        self.assertEqual(
+            [d.poster.title for d in response.context["duplicates"]], ["Copy"])
+
+
+class FeedTests(PosterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.member = User.objects.create_user(
+            email="member@example.com", first_name="Member", last_name="User",
+            username="member", password="password")
+        self.outsider = User.objects.create_user(
+            email="outsider@example.com", first_name="Outsider",
+            last_name="User", username="outsider", password="password")
+        self.conference.organizers.add(self.user)
+        self.conference.attendees.add(self.user, self.member)
+
+    def test_fan_out_on_write(self):
+        """Tests that new posters and comments are copied into members'
+        feeds, paged by entry id"""
+        self.assertTrue(Job.objects.filter(
+            name=feed.JOB_NAME, payload__poster_id=self.poster.pk).exists())
+        self.assertEqual(feed.fan_out_job(self.poster.pk), 2)
+        comment = self.comment("Nice poster")
+        self.assertEqual(feed.fan_out_job(self.poster.pk, comment.pk), 1)
+
+        with self.assertNumQueries(1):
+            entries, next_before = feed.page(self.member, size=1)
+            self.assertEqual([e.comment.author for e in entries], [self.user])
+        entries, next_before = feed.page(self.member, next_before, size=1)
+        self.assertEqual([(e.poster_id, e.comment_id) for e in entries],
+                         [(self.poster.pk, None)])
+        self.assertIsNone(next_before)
+        self.assertEqual(feed.page(self.outsider), ([], None))
+
+        self.client.force_login(self.member)
+        response = self.client.get(reverse("core:home"))
+        self.assertContains(response, "testuser commented on")
+        self.assertContains(response, "Nice poster")
+
+    def test_deactivated_comments_hidden(self):
+        """Tests that comments deactivated after fan-out leave the feed"""
+        comment = self.comment("Spam")
+        feed.fan_out_job(self.poster.pk)
+        feed.fan_out_job(self.poster.pk, comment.pk)
+        self.assertEqual(len(feed.page(self.member)[0]), 2)
+
+        Comment.objects.filter(pk=comment.pk).update(active=False)
+        entries, _ = feed.page(self.member)
+        self.assertEqual([(e.poster_id, e.comment_id) for e in entries],
+                         [(self.poster.pk, None)])
+
+    def test_fan_out_on_read(self):
+        """Tests that conferences over the fan-out limit share one entry per
+        event, which members read and trimming bounds"""
+        with self.settings(FEED_FANOUT_LIMIT=1):
+            self.assertEqual(feed.fan_out_job(self.poster.pk), 1)
+        self.assertIsNone(FeedEntry.objects.get().user_id)
+        self.assertEqual(len(feed.page(self.member)[0]), 1)
+        self.assertEqual(feed.page(self.outsider), ([], None))
+
+        feed.fan_out_job(self.poster.pk)
+        feed.fan_out_job(self.poster.pk)
+        with self.settings(FEED_LENGTH=1):
+            self.assertEqual(feed.trim(), 2)
+        self.assertEqual(FeedEntry.objects.filter(user=self.member).count(), 1)
+
+        FeedEntry.objects.update(
+            created_date=timezone.now() - datetime.timedelta(days=365))
+        call_command("trim_feeds", stdout=io.StringIO())
+        self.assertFalse(FeedEntry.objects.exists())
@@ -14,11 +14,36 @@ urlpatterns = [
         views.conference_detail,
         name='conference_detail'
     ),
+    path(
+        'conferences/<int:conf_k>/analytics/',
+        views.conference_analytics,
+        name='conference_analytics'
+    ),
+    path(
+        'conferences/<int:conf_k>/export.zip',
+        views.conference_export,
+        name='conference_export'
+    ),
+    path(
+        'conferences/<int:conf_k>/restore/',
+        views.conference_restore,
+        name='conference_restore'
+    ),
+    path(
+        'conferences/<int:conf_k>/sync/',
+        views.conference_sync,
+        name='conference_sync'
+    ),
     path(
         'conferences/<int:conf_k>/posters/<int:poster_pk>/',
         views.poster_detail,
         name='poster_detail'
     ),
+    path(
+        'conferences/<int:conf_k>/posters/<int:poster_pk>/presence/',
+        views.poster_presence,
+        name='poster_presence'
+    ),
     path(
         'conferences/<int:conf_k>/posters/create/',
         views.poster_update,
@@ -1,11 +1,23 @@
-from django.shortcuts import render, get_object_or_404, HttpResponseRedirect
+from django.shortcuts import render, get_object_or_404, HttpResponseRedirect, redirect
 from django.contrib.auth import decorators
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
+from django.views.decorators.http import require_POST
 from django.views import generic
-from .models import Poster, Conference
+from core.ratelimit import ratelimit
+from posterchat.metrics import time_image
+from .models import (Poster, Conference, Comment, DuplicatePoster, PosterFacet,
+                     RelatedPoster)
 from .forms import CommentForm, PosterForm
-from PIL import Image
+from . import analytics, archive, duplicates, facets, presence, sync
+from .export import export_conference
 import datetime
 
+COMMENTS_PER_PAGE = 20
+
 
 class ConferenceIndexView(generic.ListView):
     template_name = "poster/conference_index.html"
@@ -20,33 +32,135 @@ class ConferenceIndexView(generic.ListView):
 def conference_detail(request, conf_k):
     template_name = "poster/conference_detail.html"
     conference = get_object_or_404(Conference, pk=conf_k)
+    if conference.is_archived:
+        return archived_conference_detail(request, conference)
+
+    selection = facets.parse_selection(request.GET)
+    if selection:
+        posters = facets.filter_posters(
+            conference.poster_set.all(), conference.pk, selection)
+        counts = facets.facet_counts(conference.pk, posters)
+    else:
+        posters = conference.poster_set.all()
+        counts = facets.facet_counts(conference.pk)
+    facets.annotate_links(counts, selection)
 
-    posters = conference.poster_set.all()
+    posters = list(posters)
+    viewer_counts = presence.counts(poster.pk for poster in posters)
+    for poster in posters:
+        poster.viewer_count = viewer_counts.get(poster.pk, 0)
 
     organizers = conference.organizers.all()
     attendees = conference.attendees.all()
     guests = conference.attendees.all()
 
     is_organizer = request.user.is_authenticated and request.user in organizers
+    duplicate_count = DuplicatePoster.objects \
+        .filter(conference=conference).count() if is_organizer else 0
 
     return render(request, template_name, {
         "conference": conference,
         "posters": posters,
+        "facets": [(label, facet, counts[facet])
+                   for facet, label in PosterFacet.FACETS],
+        "facet_selection": selection,
         "organizers": organizers,
         "attendees": attendees,
         "guests": guests,
         "is_organizer": is_organizer,
+        "duplicate_count": duplicate_count,
+    })
+
+
+def archived_conference_detail(request, conference):
+    """Read-only conference page rendered from the conference's archive."""
+    organizers = conference.organizers.all()
+    return render(request, "poster/conference_detail.html", {
+        "conference": conference,
+        "posters": archive.posters(conference),
+        "facets": [],
+        "organizers": organizers,
+        "attendees": conference.attendees.all(),
+        "guests": conference.guests.all(),
+        "is_organizer": request.user in organizers,
+        "can_restore": request.user.is_staff or request.user in organizers,
     })
 
 
+def get_organized_conference(request, conf_k):
+    """Returns the conference, if the user is one of its organizers or staff."""
+    conference = get_object_or_404(Conference, pk=conf_k)
+
+    if not (request.user.is_staff or
+            conference.organizers.filter(pk=request.user.pk).exists()):
+        raise PermissionDenied
+    return conference
+
+
 @decorators.login_required
+def conference_analytics(request, conf_k):
+    template_name = "poster/conference_analytics.html"
+    conference = get_organized_conference(request, conf_k)
+
+    return render(request, template_name, {
+        "conference": conference,
+        "top_posters": analytics.top_posters(conference, limit=20),
+        "views_per_day": analytics.views_per_day(conference),
+        "duplicates": duplicates.for_conference(conference.pk),
+    })
+
+
+@decorators.login_required
+def conference_export(request, conf_k):
+    conference = get_organized_conference(request, conf_k)
+    if conference.is_archived:
+        return HttpResponse(
+            "This conference is archived. Restore it before exporting.",
+            status=409, content_type="text/plain")
+
+    response = StreamingHttpResponse(
+        export_conference(conference), content_type="application/zip")
+    response["Content-Disposition"] = \
+        f'attachment; filename="conference-{conference.pk}.zip"'
+    return response
+
+
+@require_POST
+@decorators.login_required
+def conference_restore(request, conf_k):
+    """Queues moving an archived conference back into the hot tables."""
+    conference = get_organized_conference(request, conf_k)
+    if conference.is_archived:
+        archive.queue_restore(conference.pk)
+    return redirect("poster:conference_detail", conf_k=conference.pk)
+
+
+@decorators.login_required
+def conference_sync(request, conf_k):
+    """Changes to a conference since the client's ``since`` token.
+
+    Clients repeat the request with the returned token while ``more`` is
+    true; ``limit`` lowers the number of changes read per request.
+    """
+    conference = get_object_or_404(Conference.objects.only("pk"), pk=conf_k)
+    try:
+        since = sync.parse_token(request.GET.get("since", ""))
+        limit = int(request.GET.get("limit", settings.SYNC_BATCH_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid sync token or limit")
+    limit = max(1, min(limit, settings.SYNC_BATCH_SIZE))
+    return JsonResponse(sync.delta(conference.pk, since, limit))
+
+
+@decorators.login_required
+@ratelimit("poster_upload")
 def poster_create(request, conf_k):
     template_name = "poster/poster_create.html"
     context = {}
 
     if request.method == "POST":
         poster_form = PosterForm(data=request.POST, files=request.FILES)
-        conference = get_object_or_404(Conference, pk=conf_k)
+        conference = get_object_or_404(Conference, pk=conf_k, is_archived=False)
         if poster_form.is_valid():
             new_poster = poster_form.save(commit=False)
             # new_poster.authors.add(request.user)
@@ -55,8 +169,12 @@ def poster_create(request, conf_k):
 
             destination = new_poster.image.path
 
-            new_poster.save()
-        return HttpResponseRedirect("/")
+            with time_image("poster_upload"):
+                new_poster.save()
+            return HttpResponseRedirect("/")
+        # Rejected uploads are shown with the reason, never stored
+        context["form"] = poster_form
+        return render(request, template_name, context)
 
     else:
         form = PosterForm()
@@ -65,21 +183,24 @@ def poster_create(request, conf_k):
 
 
 @decorators.login_required
+@ratelimit("poster_upload")
 def poster_update(request, conf_k, poster_pk=None):
     template_name = "poster/poster_create.html"
     context = {}
 
     if request.method == "POST":
         poster_form = PosterForm(data=request.POST, files=request.FILES)
-        conference = get_object_or_404(Conference, pk=conf_k)
+        conference = get_object_or_404(Conference, pk=conf_k, is_archived=False)
         if poster_form.is_valid():
             new_poster = poster_form.save(commit=False)
             # new_poster.authors.add(request.user)
             new_poster.created_date = datetime.datetime.now()
             new_poster.conference = conference
 
-            new_poster.save()
-        return HttpResponseRedirect("/")
+            with time_image("poster_upload"):
+                new_poster.save()
+            return HttpResponseRedirect("/")
+        form = poster_form
 
     elif poster_pk:
         poster = get_object_or_404(Poster, pk=poster_pk)
@@ -93,26 +214,38 @@ def poster_update(request, conf_k, poster_pk=None):
 
 
 @decorators.login_required
+@ratelimit("comment")
 def poster_detail(request, conf_k, poster_pk):
     template_name = 'poster/poster_detail.html'
-    poster = get_object_or_404(Poster, pk=poster_pk)
     conference = get_object_or_404(Conference, pk=conf_k)
+    if conference.is_archived:
+        return archived_poster_detail(request, conference, poster_pk)
+    poster = get_object_or_404(Poster, pk=poster_pk)
+    analytics.record_view(request, poster)
 
-    comments = poster.comment_set.filter(active=True)
+    # Paginate on top-level comments, then fetch their whole threads at once
+    top_level = poster.comment_set.top_level().filter(active=True)
+    comment_page = Paginator(top_level, COMMENTS_PER_PAGE).get_page(
+        request.GET.get("page"))
+    comments = Comment.objects.threads(
+        comment_page.object_list).filter(active=True)
 
     organizers = conference.organizers.all()
     attendees = conference.attendees.all()
     guests = conference.attendees.all()
     authors = poster.authors.all()
+    related = RelatedPoster.objects.filter(poster=poster) \
+        .select_related("related").order_by("rank")
 
     is_editable = request.user in organizers or request.user in authors
-    can_comment = request.user in organizers or request.user in attendees or request.users in authors
+    can_comment = request.user in organizers or request.user in attendees or request.user in authors
 
     new_comment = None
     if request.method != "POST":
-        comment_form = CommentForm()
+        comment_form = CommentForm(
+            poster=poster, initial={"parent": request.GET.get("reply_to")})
     else:
-        comment_form = CommentForm(data=request.POST)
+        comment_form = CommentForm(data=request.POST, poster=poster)
         if comment_form.is_valid():
             # Create comment object
 
@@ -125,8 +258,54 @@ def poster_detail(request, conf_k, poster_pk):
         "poster": poster,
         "conference": conference,
         "comments": comments,
+        "comment_page": comment_page,
+        "related": related,
         "new_comment": new_comment,
         "comment_form": comment_form,
         "is_editable": is_editable,
         "can_comment": can_comment,
     })
+
+
+def archived_poster_detail(request, conference, poster_pk):
+    """Read-only poster page rendered from the conference's archive."""
+    context = archive.poster_page(conference, poster_pk)
+    if context is None:
+        raise Http404("No poster matches the given query.")
+
+    comments = context["comments"]
+    top_level = [comment for comment in comments if comment.parent_id is None]
+    comment_page = Paginator(top_level, COMMENTS_PER_PAGE).get_page(
+        request.GET.get("page"))
+    threads = {comment.pk for comment in comment_page.object_list}
+
+    return render(request, 'poster/poster_detail.html', dict(
+        context,
+        conference=conference,
+        comments=[comment for comment in comments
+                  if comment.thread_id in threads],
+        comment_page=comment_page,
+        archived=True,
+    ))
+
+
+@require_POST
+@decorators.login_required
+def poster_presence(request, conf_k, poster_pk):
+    """Heartbeat from an open poster page, answered with viewer changes.
+
+    The client posts the ids of the viewers it currently shows as ``known``
+    and gets back who joined and who left since, plus the total count.
+    """
+    poster = get_object_or_404(
+        Poster.objects.only("pk"), pk=poster_pk, conference_id=conf_k)
+
+    if request.POST.get("leave"):
+        viewers = presence.leave(poster.pk, request.user)
+    else:
+        viewers = presence.heartbeat(poster.pk, request.user)
+
+    known = [int(pk) for pk in request.POST.get("known", "").split(",")
+             if pk.isdigit()][:settings.PRESENCE_MAX_VIEWERS]
+    return JsonResponse(dict(presence.deltas(viewers, known),
+                             interval=settings.PRESENCE_HEARTBEAT))
@@ -0,0 +1,189 @@
+"""Prometheus metrics, served at ``/metrics``.
+
+Gunicorn runs several worker processes, so metric values are kept in
+memory-mapped files in the ``prometheus_multiproc_dir`` directory (set up
+by ``gunicorn.conf.py``) and summed over every process when scraped.
+Without that variable, e.g. under ``runserver``, values stay in-process.
+Job workers (``runjobs``) answer no requests, so they serve their own
+metrics over plain HTTP on ``JOBS_METRICS_PORT``; see ``serve``.
+
+Scrapers authenticate with ``Authorization: Bearer <METRICS_TOKEN>``;
+staff users can view the endpoint from a logged-in browser.
+"""
+import os
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache.backends import locmem
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest,
+                               multiprocess, start_http_server)
+
+# Seconds; queries and header checks are mostly far below the default
+# request buckets
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                 0.5, 1.0, 2.5)
+IMAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+request_duration = Histogram(
+    "posterchat_request_duration_seconds",
+    "Time spent answering requests, per URL name",
+    ["view", "method"])
+responses = Counter(
+    "posterchat_responses_total",
+    "Responses sent, per URL name and status code",
+    ["view", "method", "status"])
+requests_in_progress = Gauge(
+    "posterchat_requests_in_progress",
+    "Requests being answered, summed over live workers",
+    multiprocess_mode="livesum")
+workers = Gauge(
+    "posterchat_workers",
+    "Live Gunicorn workers; busy workers over this is worker saturation",
+    multiprocess_mode="livesum")
+query_duration = Histogram(
+    "posterchat_db_query_duration_seconds",
+    "Time spent on database queries made while answering requests",
+    ["view"], buckets=QUERY_BUCKETS)
+cache_lookups = Counter(
+    "posterchat_cache_lookups_total",
+    "Cache lookups, per cache and result (hit or miss)",
+    ["cache", "result"])
+image_duration = Histogram(
+    "posterchat_image_processing_seconds",
+    "Time spent storing and resizing images",
+    ["operation"], buckets=IMAGE_BUCKETS)
+upload_validation_duration = Histogram(
+    "posterchat_upload_validation_seconds",
+    "Time spent checking uploaded image headers, per form field and result "
+    "(accepted or the rejection reason)",
+    ["field", "result"], buckets=QUERY_BUCKETS)
+
+
+def view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "<unresolved>"
+
+
+class MetricsMiddleware:
+    """Times each request and the database queries it makes.
+
+    Goes first in ``MIDDLEWARE`` so the other middleware is timed too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def time_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with requests_in_progress.track_inprogress(), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # The view is only known once the URL has been resolved
+        view = view_name(request)
+        request_duration.labels(view, request.method).observe(duration)
+        responses.labels(view, request.method, response.status_code).inc()
+        histogram = query_duration.labels(view)
+        for seconds in queries:
+            histogram.observe(seconds)
+        return response
+
+
+@contextmanager
+def time_image(operation: str):
+    """Records how long the enclosed image processing takes."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        image_duration.labels(operation).observe(time.perf_counter() - start)
+
+
+class MeteredCacheMixin:
+    """Counts the hits and misses of a cache backend, labelled with its
+    ``LOCATION``."""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.metrics_name = location or "default"
+
+    def get(self, key, default=None, version=None):
+        missing = object()
+        value = super().get(key, missing, version)
+        hit = value is not missing
+        cache_lookups.labels(self.metrics_name, "hit" if hit else "miss").inc()
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        if found:
+            cache_lookups.labels(self.metrics_name, "hit").inc(len(found))
+        if len(keys) > len(found):
+            cache_lookups.labels(self.metrics_name, "miss") \
+                .inc(len(keys) - len(found))
+        return found
+
+
+class LocMemCache(MeteredCacheMixin, locmem.LocMemCache):
+    pass
+
+
+def worker_started():
+    """Called in each Gunicorn worker after it is forked."""
+    workers.set(1)
+
+
+def worker_exited(pid: int):
+    """Called in the Gunicorn master when a worker exits."""
+    if "prometheus_multiproc_dir" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def is_authorized(request) -> bool:
+    token = settings.METRICS_TOKEN
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if token and constant_time_compare(header, f"Bearer {token}"):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def registry() -> CollectorRegistry:
+    """The metrics of this process, or of every process sharing its
+    ``prometheus_multiproc_dir``."""
+    if "prometheus_multiproc_dir" not in os.environ:
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def serve(port: int, addr: str = ""):
+    """Serves this process's metrics at ``http://addr:port/`` from a
+    background thread, for processes that don't answer requests. The
+    endpoint has no authentication, so keep the port private."""
+    start_http_server(port, addr, registry=registry())
+
+
+def metrics(request):
+    if not is_authorized(request):
+        raise Http404
+
+    return HttpResponse(generate_latest(registry()),
+                        content_type=CONTENT_TYPE_LATEST)
@@ -24,7 +24,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '(ki*kzv@1*o1q6k)-wm%5v#hdm&4)*duh^oagflq_!5iwxhi_*'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("POSTERCHAT_DEBUG", "1") == "1"
 
 ALLOWED_HOSTS = []
 
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
 
     'allauth',
     'allauth.account',
@@ -48,7 +49,8 @@ INSTALLED_APPS = [
     # 'allauth.socialaccount.providers.linkedin',
 
     'crispy_forms',
-    'poster',
+    'jobs.apps.JobsConfig',
+    'poster.apps.PosterConfig',
     'core',
 ]
 SITE_ID = 1
@@ -62,6 +64,7 @@ ACCOUNT_USERNAME_REQUIRED = False
 ACCOUNT_AUTHENTICATION_METHOD = 'email'
 
 MIDDLEWARE = [
+    'posterchat.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,10 +72,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiler.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'posterchat.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+# Templates are compiled once per process unless debugging
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,7 +91,6 @@ TEMPLATES = [
             os.path.join(BASE_DIR, 'templates'), os.path.join(
                 BASE_DIR, 'templates', 'allauth')
         ],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -89,6 +98,9 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
         },
     },
 ]
@@ -163,5 +175,174 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+
+# E-mail
+# https://docs.djangoproject.com/en/3.0/topics/email/
+
+EMAIL_HOST = os.getenv("POSTERCHAT_EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("POSTERCHAT_EMAIL_PORT", "25"))
+EMAIL_HOST_USER = os.getenv("POSTERCHAT_EMAIL_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("POSTERCHAT_EMAIL_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("POSTERCHAT_EMAIL_USE_TLS") == "1"
+DEFAULT_FROM_EMAIL = os.getenv(
+    "POSTERCHAT_DEFAULT_FROM_EMAIL", "PosterChat <noreply@posterchat.com>")
+
+# Comment notifications are coalesced per author over this many seconds
+NOTIFICATION_DIGEST_WINDOW = 15 * 60
+# Max number of recipients handled by a single send_digests run
+NOTIFICATION_BATCH_SIZE = 500
+
+
+# Poster views are buffered in each worker and written by a background
+# thread this often, which bounds how far behind the counts can be
+POSTER_VIEWS_FLUSH_INTERVAL = 30
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# The metered backends count hits and misses per LOCATION for /metrics
+CACHES = {
+    "default": {
+        "BACKEND": "posterchat.metrics.LocMemCache",
+        "LOCATION": "default",
+    },
+    # Rendered comment and poster rows, keyed on each row's updated_date so
+    # they never go stale. Per-process, like compiled templates.
+    "template_fragments": {
+        "BACKEND": "posterchat.metrics.LocMemCache",
+        "LOCATION": "template-fragments",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    # Poster presence must be shared by every worker process and node, or
+    # heartbeats landing on different workers see different viewers. The
+    # table is made by `manage.py createcachetable` in the release phase.
+    "presence": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "presence_cache",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+}
+
+
+# Poster presence ("who's viewing this poster"). Must name a cache shared by
+# all processes; memcached takes the heartbeats off the database.
+PRESENCE_CACHE = "presence"
+# Seconds between heartbeats from an open poster page
+PRESENCE_HEARTBEAT = 10
+# Viewers are dropped after missing heartbeats for this many seconds
+PRESENCE_TTL = 30
+PRESENCE_MAX_VIEWERS = 500
+
+
+# Number of related posters shown on each poster page
+RELATED_POSTERS_LIMIT = 5
+# Seconds to wait after a poster changes before rebuilding its conference's
+# related posters, so that a burst of edits causes a single rebuild
+RELATED_POSTERS_DELAY = 30
+
+
+# Largest poster images in kiosk snapshots (`manage.py build_snapshot`)
+SNAPSHOT_IMAGE_SIZE = (1600, 1600)
+
+
+# Home feeds: new posters and comments are copied into the feed of every
+# member of their conference, except in conferences with more than
+# FEED_FANOUT_LIMIT members, whose feed entries are shared and read by
+# members at request time. The hourly poster.trim_feeds job keeps FEED_LENGTH
+# entries per user, none older than FEED_RETENTION_DAYS.
+FEED_FANOUT_LIMIT = 2000
+FEED_PAGE_SIZE = 20
+FEED_LENGTH = 500
+FEED_RETENTION_DAYS = 90
+
+
+# Uploaded images are rejected from their header alone, before being
+# decoded or stored, when they are in another format or over these limits
+UPLOAD_IMAGE_FORMATS = ["JPEG", "PNG", "GIF", "WEBP"]
+UPLOAD_IMAGE_MAX_BYTES = 50 * 1024 * 1024
+UPLOAD_IMAGE_MAX_DIMENSION = 12000
+UPLOAD_IMAGE_MAX_PIXELS = 80 * 10 ** 6
+
+
+# Posters whose image hashes differ in at most this many of their 64 bits
+# are flagged to organizers as possible duplicates. The hash index finds
+# matches up to 7 bits apart.
+DUPLICATE_POSTER_DISTANCE = 6
+
+
+# Most change log rows read by one request to the sync endpoint
+SYNC_BATCH_SIZE = 500
+
+
+# Conferences without edits for this many days are moved into compressed
+# archives by `manage.py archive_conferences`
+ARCHIVE_AFTER_DAYS = 365
+
+
+# Bearer token Prometheus sends to scrape /metrics. Staff users can always
+# view it.
+METRICS_TOKEN = os.getenv("POSTERCHAT_METRICS_TOKEN", "")
+
+
+# Request profiling (see core/profiler.py). Staff users can always profile a
+# request by sending an `X-Profile: 1` header.
+# Fraction of requests to profile at random
+PROFILER_SAMPLE_RATE = float(os.getenv("POSTERCHAT_PROFILER_SAMPLE_RATE", "0"))
+# Profile every request and keep those slower than this many seconds
+PROFILER_SLOW_THRESHOLD = (
+    float(os.environ["POSTERCHAT_PROFILER_SLOW_THRESHOLD"])
+    if os.getenv("POSTERCHAT_PROFILER_SLOW_THRESHOLD") else None)
+# Seconds between stack samples
+PROFILER_INTERVAL = 0.005
+# Slowest profiles kept
+PROFILER_KEEP = 50
+
+
+# Token-bucket rate limits per view scope: each user and each IP address may
+# make `burst` requests at once, refilled at `rate` requests per `period`
+# seconds. Remove a scope to stop limiting it.
+RATELIMITS = {
+    "comment": {"rate": 10, "period": 60, "burst": 5},
+    "poster_upload": {"rate": 20, "period": 60 * 60, "burst": 5},
+}
+# Take client addresses from the last X-Forwarded-For entry, as added by the
+# Heroku router. Only enable behind such a proxy: otherwise clients choose
+# their own address by sending the header.
+RATELIMIT_FORWARDED_FOR = \
+    os.getenv("POSTERCHAT_RATELIMIT_FORWARDED_FOR", "0") == "1"
+
+
+# Worker startup, checked by `python manage.py benchmark_startup`. Seconds a
+# fresh process may take to load and warm up the application
+STARTUP_BUDGET = 2.0
+# Modules only needed by some code paths, which must not load at startup
+STARTUP_LAZY_MODULES = ["PIL", "bleach", "markdown", "numpy"]
+
+
+# Background jobs, run with `python manage.py runjobs`
+
+# Run jobs immediately when they are enqueued instead of in a worker
+JOBS_EAGER = False
+JOBS_POLL_INTERVAL = 1
+# Job workers serve their Prometheus metrics (e.g. avatar resizing times)
+# over unauthenticated HTTP on this port when it is set. Scrape it from a
+# private network only.
+JOBS_METRICS_PORT = int(os.getenv("POSTERCHAT_JOBS_METRICS_PORT", "0"))
+JOBS_METRICS_ADDR = os.getenv("POSTERCHAT_JOBS_METRICS_ADDR", "")
+JOBS_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled for each further attempt
+JOBS_RETRY_DELAY = 10
+JOBS_MAX_BACKOFF = 60 * 60
+# Running jobs are assumed lost and requeued after this many seconds
+JOBS_TIMEOUT = 15 * 60
+# Finished jobs are kept this many seconds for stats before being purged
+JOBS_RETENTION = 7 * 24 * 60 * 60
+# Jobs run every so many seconds by the workers, with an empty payload
+JOBS_PERIODIC = {
+    "poster.send_digests": 60,
+    "poster.trim_feeds": 60 * 60,
+}
+
 # should be at bottom
 django_heroku.settings(locals())
@@ -3,9 +3,12 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from . import metrics
+
 urlpatterns = [
     path('', include('core.urls')),
     path('admin/', admin.site.urls),
     path('conferences/', include('poster.urls')),
     path('accounts/', include('allauth.urls')),
+    path('metrics', metrics.metrics, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,72 @@
+"""Work done once per process before it serves requests.
+
+``posterchat.wsgi`` calls ``warm`` after loading the application, so the
+first requests to each worker do not pay for importing every view, building
+the URL resolver, loading template tag libraries and translations or
+compiling templates. Under ``gunicorn --preload`` (see gunicorn.conf.py)
+this happens once in the master and is shared by every forked worker.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.urls import get_resolver
+from django.utils import translation
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_EXTENSIONS = (".html", ".txt")
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # Imports every URLconf and view module and builds the reverse lookups
+    resolver.reverse_dict
+
+
+def template_names(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(TEMPLATE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def warm_templates() -> int:
+    """Loads tag libraries, and compiles templates if they will be cached.
+
+    Returns the number of templates compiled.
+    """
+    compiled = 0
+    for backend in engines.all():
+        engine = getattr(backend, "engine", None)
+        if engine is None or not any(isinstance(loader, CachedLoader)
+                                     for loader in engine.template_loaders):
+            continue
+
+        for directory in backend.template_dirs:
+            for name in template_names(directory):
+                try:
+                    backend.get_template(name)
+                except (TemplateDoesNotExist, TemplateSyntaxError):
+                    # Partial templates (such as e-mail bodies built from
+                    # blocks) may not compile on their own
+                    continue
+                compiled += 1
+    return compiled
+
+
+def warm():
+    started = time.perf_counter()
+    warm_urls()
+    compiled = warm_templates()
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+    # Nothing opened while warming may be shared with forked workers
+    connections.close_all()
+    logger.info("Warmed up in %.3fs (%d templates compiled)",
+                time.perf_counter() - started, compiled)
@@ -17,3 +17,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posterchat.settings')
 
 application = get_wsgi_application()
+
+from posterchat.warmup import warm  # noqa: E402 (needs the app loaded)
+
+warm()